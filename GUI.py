@@ -1,16 +1,16 @@
 import psutil
-import os
-import platform
 import tkinter as tk
 from tkinter import ttk
 import xtra_widgets as xw
 import reader
+import heatmap
+import data_service
+import catalog
+import control
 import datetime
-from time import sleep
+import queue
+import time
 import matplotlib
-from matplotlib import pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.lines import Line2D
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.figure import Figure
 matplotlib.use('TkAgg')
@@ -20,7 +20,10 @@ TITLE_FONT = ('Helvetica', 20, 'bold')
 FIELD_FONT = ('Helvetica', 10, 'bold')
 FIELD_CONTENT_FONT = ('Helvetica', 10)
 
-HEATMAP_OPTIMIZATION_FACTOR = 0
+HEATMAP_DAYS = 90
+DATA_SERVICE_POLL_MS = 50
+COLLECTOR_LAUNCH_TIMEOUT = 10   # seconds to wait for a launched collector's control socket
+TRACKER_REFRESH = 5             # seconds between reads of the collector's live status
 
 
 class NetTrackerApp(tk.Tk):
@@ -62,6 +65,13 @@ class HomePage(tk.Frame):
 
     def __init__(self, parent, controller):
         tk.Frame.__init__(self, parent)
+        self.data_service = data_service.DataService()
+        # Days with data, kept current in the background: changed days are re-analysed without pressing 'Update List'
+        self.catalog = catalog.Catalog()
+        self.changed_days = queue.Queue()
+        self.catalog.subscribe(data_service.days_changed)
+        self.catalog.subscribe(self.changed_days.put)
+        self.catalog.watch()
 
         self.title = tk.Label(self, text="Home", font=TITLE_FONT)
         self.summary_frame = tk.LabelFrame(self, text="Summary")
@@ -70,6 +80,9 @@ class HomePage(tk.Frame):
         self.status_tlabel = tk.Label(self.status_frame)
         self.status_onb = ttk.Button(self.status_frame, text="Switch On", command=lambda: self.update_tracker(1))
         self.status_offb = ttk.Button(self.status_frame, text="Switch Off", command=lambda: self.update_tracker(0))
+        self.control_request = None     # control.Request waiting for its response, see poll_data_service()
+        self.launched = None            # when the collector was launched, while waiting for it to answer
+        self.tracker_refreshed = 0      # when the status frame last showed the live status, see poll_data_service()
         self.update_tracker(-1)
         self.outages_frame = tk.LabelFrame(self.summary_frame, text="Outages", padx=5, pady=5)
         self.outages_timeperiod_frame = tk.Frame(self.outages_frame, relief='sunken', bd=2)
@@ -121,6 +134,7 @@ class HomePage(tk.Frame):
                                                          textvariable=self.outages_oscillation_percentage_v,
                                                          font=FIELD_CONTENT_FONT)
 
+        self.after(DATA_SERVICE_POLL_MS, self.poll_data_service)
         self.outages_update_button = ttk.Button(self.outages_frame, text="Update List",
                                                 command=self.update_outages_list)
         self.heatmap_frame = tk.LabelFrame(self, text="HeatMap")
@@ -132,13 +146,15 @@ class HomePage(tk.Frame):
         self.toolbar = NavigationToolbar2Tk(self.canvas, self.graph_frame)
         self.toolbar.update()
         self.ax = self.figure.gca()
-        self.heatmap_update_button = ttk.Button(self.heatmap_frame, text="Update Heatmap")
+        self.heatmap = None
+        self.heatmap_data = None        # (matrix, first day, pyramid) shown by self.heatmap
+        self.heatmap_changed = set()    # days whose files changed since heatmap_data was built
+        self.heatmap_update_button = ttk.Button(self.heatmap_frame, text="Update Heatmap",
+                                                command=self.update_heatmap)
         # Configuring the Figure:
         self.figure.subplots_adjust(left=0.1)
         self.plt.set_title("Heatmap View")
-        self.ax.legend(handles=[Line2D([0], [0], marker='o', color='lime', label='Online'),
-                                Line2D([0], [0], marker='o', color='r', label='Offline'),
-                                Line2D([0], [0], marker='o', color='blue', label='Unknown')])
+        self.ax.legend(handles=heatmap.LEGEND)
         # self.ax.yaxis.set_major_locator(plt.MaxNLocator(20))
         # self.ax.yaxis.set_minor_locator(mdates.MinuteLocator(byminute=))
         # self.ax.yaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
@@ -193,44 +209,53 @@ class HomePage(tk.Frame):
         :return: nothing
         """
 
-        if command is 1:
-            pass
-        elif command is 0:
-            if platform.system() == "Windows":
-                with open(os.path.join(os.environ["APPDATA"], "ICT/collector.pid"), 'r') as file:
-                    pid = int(file.read().strip('\n'))
-            elif platform.system() == "Linux":
-                with open("data/collector.pid", 'r') as file:
-                    pid = int(file.read().strip('\n'))
-            if psutil.pid_exists(pid):
-                os.kill(pid, 1)
-                try:
-                    sleep(1)
-                    os.kill(pid, 1)
-                except:
-                    pass
-
-
-        if platform.system() == "Windows":
-            with open(os.path.join(os.environ["APPDATA"], "ICT/collector.pid"), 'r') as file:
-                pid = int(file.read().strip('\n'))
-        elif platform.system() == "Linux":
-            with open("data/collector.pid", 'r') as file:
-                pid = int(file.read().strip('\n'))
-        if psutil.pid_exists(pid):
-            if platform.system() == "Windows":
-                with open(os.path.join(os.environ["APPDATA"],
-                                       "ICT/data/{}.trck".format(datetime.datetime.now().strftime("%d_%m%_%Y"))), 'r')\
-                        as file:
-                    state = "Online" if float(file.readlines()[-1]) > -1 else "Offline"
-            elif platform.system() == "Linux":
-                with open("data/{}.trck".format(datetime.datetime.now().strftime("%d_%m_%Y")), 'r') as file:
-                    state = "Online" if float(file.readlines()[-1]) > -1 else "Offline"
-
-            self.status_mlabel.config(text=state, fg="green" if state == "Online" else "red")
-            self.status_tlabel.config(text="Tracking is on and the computer is Online" if state == "Online" else
-                                      "Tracking is on, but the computer is Offline")
+        # Switching goes through the collector's control socket (see control) without waiting for the answer, which
+        # poll_data_service() picks up and then calls update_tracker(-1)
+        if command == 1:
             self.status_onb.config(state="disabled")
+            if self.collector_pid() is not None:
+                self.control_request = control.Request("start")
+            else:
+                control.launch()
+                self.launched = time.monotonic()
+                self.control_request = control.Request("status")
+            return
+        elif command == 0:
+            pid = self.collector_pid()
+            if pid is not None:
+                self.status_offb.config(state="disabled")
+                if control.available():
+                    self.control_request = control.Request("stop")
+                else:
+                    # Waiting for the collector to die happens on the data service's thread, see poll_data_service()
+                    self.data_service.submit("tracker", data_service.stop_collector_job, pid,
+                                             self.collector_pid("supervisor"))
+                return
+
+        self.tracker_refreshed = time.monotonic()
+        pid = self.collector_pid()
+        # The collector's live status is a small record it replaces every tick, see reader.live_status()
+        status = reader.live_status()
+        if pid is not None and (status is None or status["health"] != "stopped"):
+            if status is None or status["stale"]:
+                self.status_mlabel.config(text="Unknown", fg="blue")
+                self.status_tlabel.config(text="Tracking is on, waiting for the collector's next test")
+            elif status["health"] == "starting":
+                self.status_mlabel.config(text="Starting", fg="blue")
+                self.status_tlabel.config(text="Tracking is on, waiting for the collector's first test")
+            elif status["health"] == "paused":
+                self.status_mlabel.config(text="Paused", fg="blue")
+                self.status_tlabel.config(text="Tracking is paused, switch it on to resume")
+            elif status["health"] == "offline":
+                self.status_mlabel.config(text="Offline", fg="red")
+                self.status_tlabel.config(text="Tracking is on, but the computer is Offline since {}".format(
+                    status["outage_start"].strftime('%d/%m/%Y %H:%M')))
+            else:
+                self.status_mlabel.config(text="Online", fg="green")
+                self.status_tlabel.config(text="Tracking is on and the computer is Online" if status["health"] == "ok"
+                                          else "Tracking is on and the computer is Online, but the speedtest failed")
+            paused = status is not None and status["health"] == "paused"
+            self.status_onb.config(state="normal" if paused else "disabled")
             self.status_offb.config(state="normal")
         else:
             self.status_mlabel.config(text="Unknown", fg="blue")
@@ -238,116 +263,121 @@ class HomePage(tk.Frame):
             self.status_onb.config(state="normal")
             self.status_offb.config(state="disabled")
 
+    @staticmethod
+    def collector_pid(name: str = "collector"):
+        """
+        :param name: (str, default = "collector") "collector", or "supervisor" for the process that restarts it
+        :return: the process' PID, None if it isn't running
+        """
+        pid = control.read_pid(name)
+        return pid if pid is not None and psutil.pid_exists(pid) else None
+
+    def poll_control(self):
+        if self.control_request is None or self.control_request.poll() is None:
+            return
+        response = self.control_request.response
+        self.control_request = None
+        if not response["ok"] and self.launched is not None and \
+                time.monotonic() - self.launched < COLLECTOR_LAUNCH_TIMEOUT:
+            # The launched collector isn't listening yet
+            self.control_request = control.Request("status")
+            return
+        if not response["ok"]:
+            print("HomePage: the collector didn't answer: {}".format(response["error"]))
+        self.launched = None
+        self.update_tracker(-1)
 
     def update_outages_list(self):
         print("HomePage.update_outages_list() called")
-        self.outages_scrollbox.clear()
-        organizeds = []
-
-        if self.outages_timeperiod_var.get() != 4:
-            ite = 1
-            # if self.outages_timeperiod_var.get() == 1:
-            #     pass
-            if self.outages_timeperiod_var.get() == 2:
-                ite = 7
-            elif self.outages_timeperiod_var.get() == 3:
-                ite = 30
-
-            for i in range(ite):
-                try:
-                    organizeds.append(reader.organize((datetime.datetime.now() - datetime.timedelta(days=i)).strftime(
-                        "%d/%m/%Y")))
-                except FileNotFoundError:
-                    # print("File Not Found")
-                    break
-            print(organizeds)
-        else:
-            i = 0
-            while True:
-                try:
-                    # print((datetime.datetime.now() - datetime.timedelta(days=i)).strftime("%d/%m/%Y"))
-                    organizeds.append(reader.organize((datetime.datetime.now() - datetime.timedelta(days=i)).strftime(
-                        "%d/%m/%Y")))
-                    i += 1
-                except FileNotFoundError:
-                    break
-
-        info = []
-        for track in organizeds:
-            analysis = reader.get_analysis(track)
-            self.outages_scrollbox.special_insert(0, tuple(analysis["outage_times"]))
-            info.append([analysis["outage_count"], analysis["oscillation_count"], analysis["total_test_minutes"],
-                         analysis["total_minutes_lost"], analysis["oscillation_minutes"]])
-
-        # Update info labels:
-        outage_count = 0
-        oscillation_count = 0
-        test_mins = 0
-        mins_lost = 0
-        osc_mins = 0
-        for i in info:
-            outage_count += i[0]
-            oscillation_count += i[1]
-            test_mins += i[2]
-            mins_lost += i[3]
-            osc_mins += i[4]
+        # The summary arrives first, the outages list after it (see poll_data_service())
+        self.data_service.submit("outages", data_service.outages_job, self.outages_timeperiod_var.get(), self.catalog)
+
+    def update_heatmap(self, changed: set = None):
+        """
+        :param changed: (set, default = None) days whose files changed (see poll_catalog()), only their rows are
+                        rebuilt. None rebuilds the whole heatmap
+        """
+        if changed is None:
+            self.data_service.submit("heatmap", data_service.heatmap_job, HEATMAP_DAYS,
+                                     frozenset(self.heatmap_changed))
+            return
+        self.heatmap_changed |= changed
+        # A newer submission makes older ones stale (see data_service), so each one carries every change since the
+        # shown heatmap was built
+        self.data_service.submit("heatmap", data_service.heatmap_job, HEATMAP_DAYS, frozenset(self.heatmap_changed),
+                                 self.heatmap_data)
+
+    def poll_data_service(self):
+        for kind, stage, payload in self.data_service.poll():
+            if stage == "summary":
+                self.show_summary(payload)
+            elif stage == "outages":
+                self.outages_scrollbox.clear()
+                self.outages_scrollbox.special_insert(0, tuple(payload))
+            elif stage == "heatmap":
+                self.show_heatmap(*payload)
+            elif stage == "stopped":
+                self.update_tracker(-1)
+            elif stage == "error":
+                print("HomePage: {} failed: {}".format(kind, payload))
+        self.poll_catalog()
+        self.poll_control()
+        # The live status is read in constant time, so the status frame follows the collector on its own, except while
+        # a switch is on its way (it would re-enable the buttons)
+        if self.control_request is None and time.monotonic() - self.tracker_refreshed >= TRACKER_REFRESH:
+            self.update_tracker(-1)
+        self.after(DATA_SERVICE_POLL_MS, self.poll_data_service)
+
+    def poll_catalog(self):
+        """
+        Refreshes the outages list and the heatmap if days they show changed (see catalog).
+        """
+        changed = set()
+        while True:
+            try:
+                changed |= self.changed_days.get_nowait()
+            except queue.Empty:
+                break
+        if not changed:
+            return
+        first, last = data_service.period_range(self.outages_timeperiod_var.get(), self.catalog)
+        if any(first <= day <= last for day in changed):
+            self.update_outages_list()
+        if any(day > last - datetime.timedelta(days=HEATMAP_DAYS) for day in changed):
+            self.update_heatmap(changed)
+
+    def show_summary(self, analysis: dict):
+        outage_count = analysis["outage_count"]
+        oscillation_count = analysis["oscillation_count"]
+        test_mins = analysis["total_test_minutes"]
+        mins_lost = analysis["total_minutes_lost"]
+        osc_mins = analysis["oscillation_minutes"]
 
         self.outages_outage_count_v.set(str(outage_count))
         self.outages_oscillation_count_v.set(str(oscillation_count))
         self.outages_test_time_v.set("{} hour(s) and {} minute(s)".format(test_mins // 60, test_mins % 60))
         self.outages_offline_time_v.set("{} hour(s) and {} minute(s)".format(mins_lost // 60, mins_lost % 60))
         self.outages_oscillation_time_v.set("{} hour(s) and {} minute(s)".format(osc_mins // 60, osc_mins % 60))
-        self.outages_loss_percentage_v.set("{0:.2f}% ({1}/{2})".format(100 * (mins_lost / test_mins), mins_lost,
-                                                                       test_mins))
-        self.outages_oscillation_percentage_v.set("{0:.2f}% ({1}/{2})".format(100 * (osc_mins / test_mins), osc_mins,
-                                                                              test_mins))
-
-    def update_heatmap(self):
-        # a = reader.organize("16/12/2019")
-        # reader.fix(a)
-        # for li in a:
-        #     self.plt.scatter("Today", li[1], color=('lime' if li[2] > 0 else 'r' if li[2] > -2 else 'b'))
-        fixed_trackings = []
-        for i in range(3):
-            try:
-                print((datetime.datetime.now() - datetime.timedelta(days=i)).strftime("%d/%m/%Y"))
-                fixed_trackings.append(reader.fix(reader.organize((datetime.datetime.now() -
-                                                                   datetime.timedelta(days=i)).strftime(
-                                "%d/%m/%Y"))))
-                print("ft: ", fixed_trackings)
-            except FileNotFoundError:
-                print("HMP - File Not Found")
-                break
-
-        # i = 0
-        # o = False
-        cert = 0
-        for tracking in reversed(fixed_trackings):      # reversed because we appended from current date
-            # i += 1
-            for li in tracking:
-                # if cert is 0:
-                #     try:
-                #         for i in range(1, HEATMAP_OPTIMIZATION_FACTOR):
-                #             if li[2] == tracking[tracking.index(li) + i][2]:
-                #                 cert += 1
-                #     except IndexError:
-                #         pass
-                self.plt.scatter(li[1].split(' ')[0], datetime.datetime(year=2010, month=1, day=1,
-                                                                        hour=int(li[1].split(' ')[1].split(':')[0]),
-                                                                        minute=int(li[1].split(' ')[1].split(':')[1])),
-                                 color=('lime' if li[2] > 0 else 'r' if li[2] > -2 else 'b'))
-                # else:
-                #     cert -= 1
-                # if li[2] is not -1 and o:
-                #     o = False
-                # if li[2] == -1 and not o:
-                #     o = True
-                #     self.ax.annotate("",
-                #                 xy=(li[1].split(" ")[0], li[1].split(' ')[1]), xycoords='data',
-                #                 xytext=(0.1 if i is 1 else 0.4 if i is 2 else 0.9, 0.5), textcoords='axes fraction',
-                #                 arrowprops=dict(arrowstyle="->",
-                #                                 connectionstyle="arc3"),
-                #                 )
+        self.outages_loss_percentage_v.set("{0:.2f}% ({1}/{2})".format(analysis["total_loss_percentage"],
+                                                                       mins_lost, test_mins))
+        self.outages_oscillation_percentage_v.set("{0:.2f}% ({1}/{2})".format(
+            analysis["oscillation_loss_percentage"], osc_mins, test_mins))
+
+    def show_heatmap(self, matrix, first: datetime.date, levels: dict, changed: frozenset):
+        previous, self.heatmap_data = self.heatmap_data, (matrix, first, levels)
+        self.heatmap_changed -= changed
+        if self.heatmap is not None and previous is not None and previous[1] == first and \
+                previous[0].shape == matrix.shape:
+            # Same days, some of them changed: keep the user's zoom and pan
+            self.heatmap.update(levels)
+            self.canvas.draw_idle()
+            return
+        if self.heatmap is not None:
+            self.heatmap.disconnect()
+        # Follows the toolbar's zoom and pan, re-aggregating the visible window to the screen's resolution
+        self.heatmap = heatmap.ZoomableHeatmap(self.ax, matrix, first, levels=levels)
+        self.plt.set_title("Heatmap View")
+        self.canvas.draw_idle()
 
 
 if __name__ == "__main__":
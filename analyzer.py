@@ -0,0 +1,219 @@
+"""
+Streaming counterpart of reader.analyse(). An Analyzer takes the statuses of minutes in time order and keeps the totals
+and outages of everything it was fed, with the outage that is still going on kept open across midnight and across
+files, so feeding it the minutes of several days gives the same result as analyse() on their merged grids. consume()
+feeds it what was appended to a day's files since its last call, so keeping today's analysis current costs the new
+samples only, and save()/load() checkpoint its state so it can resume after a restart.
+"""
+
+import datetime
+import json
+import os
+import numpy as np
+import reader
+import slots
+import summary_index
+import trck
+
+
+class StateLost(RuntimeError):
+    """
+    A file was rewritten (not just appended to) after it was consumed, so the analyzer's state has to be rebuilt.
+    """
+
+
+def checkpoint_path(name: str) -> str:
+    return os.path.join(slots.DATA_DIR, "{}.analyzer".format(name))
+
+
+class Analyzer:
+
+    def __init__(self, origin: datetime.date):
+        """
+        :param origin: the day of minute index 0, which outage minute indexes count from
+        """
+        self.origin = origin
+        self.last = -1                  # minute index of the last minute fed
+        self.day = origin               # the day consume() goes on from
+        self.test_minutes = 0
+        self.lost_minutes = 0
+        self.oscillation_count = 0
+        self.oscillation_minutes = 0
+        self.outages = []               # finished outages, as [start, end]
+        self.open = None                # start of the outage going on, None if there is none
+        self.offsets = {}               # .trck path -> bytes of it consumed
+
+    @classmethod
+    def seeded(cls, first: datetime.date, today: datetime.date):
+        """
+        :return: an analyzer starting at first that has the days before today fed from the summary index (see
+                 summary_index.summary()), O(days) instead of a read of every minute
+        """
+        analyzer = cls(first)
+        if today > first:
+            analysis = summary_index.summary(first, today - datetime.timedelta(days=1))
+            outages = analysis["outages"]
+            finished = outages[~outages["ongoing"]]
+            analyzer.outages = [[int(o["start"]), int(o["end"])] for o in finished]
+            if len(finished) < len(outages):
+                analyzer.open = int(outages["start"][-1])
+            analyzer.test_minutes = analysis["total_test_minutes"]
+            analyzer.lost_minutes = analysis["total_minutes_lost"]
+            analyzer.oscillation_count = analysis["oscillation_count"]
+            analyzer.oscillation_minutes = analysis["oscillation_minutes"]
+            analyzer.last = (today - first).days * slots.MINUTES_PER_DAY - 1
+        analyzer.day = today
+        return analyzer
+
+    def feed(self, minute: int, status: int):
+        """
+        Takes one minute. Minutes must come in time order: minutes at or before the last one fed are ignored.
+        :param minute: minute index, from origin at 00:00
+        :param status: its slots status, unknown minutes may be left out
+        """
+        if minute <= self.last or status == slots.UNKNOWN:
+            return
+        self.last = minute
+        self.test_minutes += 1
+        if status == slots.OFFLINE:
+            self.lost_minutes += 1
+            if self.open is None:
+                self.open = minute
+        elif self.open is not None:
+            duration = minute - self.open
+            if duration <= reader.OSCILLATION_MINUTES:
+                self.oscillation_count += 1
+                self.oscillation_minutes += duration
+            self.outages.append([self.open, minute])
+            self.open = None
+
+    def feed_status(self, start: int, status: np.ndarray) -> int:
+        """
+        Takes a run of minutes.
+        :param start: minute index of status[0]
+        :param status: array of slots statuses
+        :return: number of known minutes fed
+        """
+        known = np.flatnonzero(status != slots.UNKNOWN)
+        known = known[known + start > self.last]
+        for m in known:
+            self.feed(start + int(m), int(status[m]))
+        return len(known)
+
+    def consume(self, day: datetime.date) -> int:
+        """
+        Feeds the minutes of a day that weren't fed yet: the day's .slot file when it has one (it also holds the minutes
+        that aren't in the .trck file), else the records appended to its .trck file since the last call. Days have to
+        be consumed in order; days without minute files count as unknown.
+        :param day: the day, on or after the last day consumed
+        :return: number of minutes fed
+        :raises StateLost: if the .trck file was rewritten since it was consumed
+        """
+        base = (day - self.origin).days * slots.MINUTES_PER_DAY
+        self.day = max(self.day, day)
+        grid = slots.read_day(day)
+        if grid is not None:
+            start = max(self.last + 1 - base, 0)
+            return self.feed_status(base + start, grid["status"][start:])
+
+        path = trck.find(day)
+        if path is None:
+            return 0
+        offset = self.offsets.get(path, 0)
+        if trck.files(day) == [trck.path(day)]:
+            if os.path.getsize(path) < offset:
+                raise StateLost(path)
+            with open(path, 'rb') as file:
+                file.seek(offset)
+                data = file.read()
+        else:
+            with trck.open_day(day, binary=True) as file:
+                file.read(offset)
+                data = file.read()
+        lines = data.decode(errors="surrogateescape").splitlines(keepends=True)
+        rows, valid = trck.parse(lines)
+        # A record still being written is left for the next call
+        self.offsets[path] = offset + sum(len(line.encode(errors="surrogateescape")) for line in lines[:valid])
+        prefix = day.strftime("%d/%m/%Y")
+        fed = 0
+        for row in rows:
+            if row[1].startswith(prefix) and base + reader.minute_of(row[1]) > self.last:
+                self.feed(base + reader.minute_of(row[1]), slots.status_of(row[2]))
+                fed += 1
+        return fed
+
+    def catch_up(self, today: datetime.date) -> int:
+        """
+        Consumes every day from the last one consumed (which may have gained records since) to today.
+        :return: number of minutes fed
+        """
+        start = self.day
+        return sum(self.consume(start + datetime.timedelta(days=d)) for d in range((today - start).days + 1))
+
+    def result(self, last: datetime.date) -> dict:
+        """
+        :param last: the last day of the range, an outage still going on lasts until its end
+        :return: same dict as reader.analyse() on the merged grids of origin to last
+        """
+        found = self.outages + ([[self.open, (last - self.origin).days * slots.MINUTES_PER_DAY + slots.MINUTES_PER_DAY]]
+                                if self.open is not None else [])
+        outages = np.zeros(len(found), dtype=reader.OUTAGE)
+        if found:
+            outages["start"], outages["end"] = np.array(found).T
+        outages["ongoing"][len(self.outages):] = True
+        outages["duration"] = outages["end"] - outages["start"]
+        outages["oscillation"] = ~outages["ongoing"] & (outages["duration"] <= reader.OSCILLATION_MINUTES)
+        test_time, mins, fluc_mins = self.test_minutes, self.lost_minutes, self.oscillation_minutes
+        return {"outages": outages,
+                "outage_count": len(outages),
+                "oscillation_count": self.oscillation_count,
+                "total_test_minutes": test_time,
+                "total_minutes_lost": mins,
+                "oscillation_minutes": fluc_mins,
+                "total_loss_percentage": 100 * (mins / test_time) if test_time else 0,
+                "oscillation_loss_percentage": 100 * (fluc_mins / test_time) if test_time else 0}
+
+    def save(self, path: str):
+        """
+        Checkpoints the state, atomically.
+        """
+        state = {"origin": self.origin.isoformat(), "day": self.day.isoformat(), "last": self.last,
+                 "test_minutes": self.test_minutes, "lost_minutes": self.lost_minutes,
+                 "oscillation_count": self.oscillation_count, "oscillation_minutes": self.oscillation_minutes,
+                 "outages": self.outages, "open": self.open, "offsets": self.offsets}
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        :return: the analyzer checkpointed at path, None if there is no (readable) checkpoint, or it doesn't have the
+                 fields of this version's save()
+        """
+        try:
+            with open(path) as file:
+                state = json.load(file)
+            analyzer = cls(datetime.date.fromisoformat(state["origin"]))
+            analyzer.day = datetime.date.fromisoformat(state["day"])
+            counts = {name: state[name] for name in COUNTS}
+            outages, open_start, offsets = state["outages"], state["open"], state["offsets"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if not all(_is_int(v) for v in counts.values()) or not (open_start is None or _is_int(open_start)) or \
+                not isinstance(outages, list) or \
+                not all(isinstance(o, list) and len(o) == 2 and all(map(_is_int, o)) for o in outages) or \
+                not isinstance(offsets, dict) or not all(_is_int(v) for v in offsets.values()):
+            return None
+        for name, value in counts.items():
+            setattr(analyzer, name, value)
+        analyzer.outages, analyzer.open, analyzer.offsets = outages, open_start, offsets
+        return analyzer
+
+
+COUNTS = ("last", "test_minutes", "lost_minutes", "oscillation_count", "oscillation_minutes")    # see Analyzer.load()
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
@@ -0,0 +1,480 @@
+"""
+Micro-benchmarks for the reader's data paths. Run with the name of a benchmark (or nothing, to run them all):
+    python benchmark.py [fix] [heatmap] [collector] [suite] [compression]
+
+"suite" runs the reader and GUI data paths on synthetic histories (see generate_history.py), headless, and appends its
+results to data/benchmark_history.jsonl, flagging what got slower or hungrier than the last run of another commit.
+
+"compression" compares the size and read throughput of plain and compressed .trck files on a multi-year history.
+"""
+
+import sys
+import contextlib
+import copy
+import datetime
+import gc
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+import tracemalloc
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import reader
+import heatmap
+import slots
+import standins
+import data_collector
+import generate_history
+import summary_index
+import trck
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+
+def legacy_fix(tracking: list) -> list:
+    """
+    reader.fix() as it was before the minute grid, kept here as the baseline.
+    """
+    index = 0
+    for minute in [datetime.datetime.strptime(tracking[0][1].split(' ')[0], '%d/%m/%Y') + datetime.timedelta(minutes=x)
+                   for x in range(60*24)]:
+        try:
+            if datetime.datetime.strptime(tracking[index][1], "%d/%m/%Y %H:%M") != minute:
+                tracking.insert(index, [-1, minute.strftime("%d/%m/%Y %H:%M"), -2, -2, -2])
+        except IndexError:
+            tracking.append([-1, minute.strftime("%d/%m/%Y %H:%M"), -2, -2, -2])
+        index += 1
+
+    return tracking
+
+
+def synthetic_day(step: int, day: datetime.date = datetime.date(2019, 12, 15)) -> list:
+    """
+    :param step: one sample every 'step' minutes
+    :param day: the day the samples belong to
+    :return: an organized list (see reader.organize())
+    """
+    prefix = day.strftime("%d/%m/%Y")
+    return [[n + 1, "{} {:02d}:{:02d}".format(prefix, m // 60, m % 60), 100.0 if m % 97 else -1.0, 50.0, 20.0]
+            for n, m in enumerate(range(0, 60 * 24, step))]
+
+
+def report(name: str, baseline, candidate, number: int):
+    base = min(timeit.repeat(baseline, number=number, repeat=3)) / number
+    cand = min(timeit.repeat(candidate, number=number, repeat=3)) / number
+    print("{:<28} {:>10.3f} ms {:>10.3f} ms {:>8.1f}x".format(name, base * 1000, cand * 1000, base / cand))
+
+
+def bench_fix():
+    print("{:<28} {:>13} {:>13} {:>9}".format("fix()", "legacy", "current", "speedup"))
+    for name, step in (("empty (1 sample)", 60 * 24), ("sparse (1 every 30 min)", 30), ("full (every minute)", 1)):
+        day = synthetic_day(step)
+        report(name, lambda: legacy_fix(copy.copy(day)), lambda: reader.fix(copy.copy(day)), 5)
+    for name, step in (("minute_grid() empty", 60 * 24), ("minute_grid() sparse", 30), ("minute_grid() full", 1)):
+        day = synthetic_day(step)
+        report(name, lambda: legacy_fix(copy.copy(day)), lambda: reader.minute_grid(day), 5)
+
+
+def scatter_heatmap(ax, trackings: list):
+    """
+    HomePage.update_heatmap() as it was before the raster renderer, kept here as the baseline.
+    """
+    for tracking in trackings:
+        for li in tracking:
+            ax.scatter(li[1].split(' ')[0], datetime.datetime(year=2010, month=1, day=1,
+                                                              hour=int(li[1].split(' ')[1].split(':')[0]),
+                                                              minute=int(li[1].split(' ')[1].split(':')[1])),
+                       color=('lime' if li[2] > 0 else 'r' if li[2] > -2 else 'b'))
+
+
+def measure(render) -> tuple:
+    """
+    Renders once on a new Agg figure.
+    :return: (seconds, peak bytes allocated by python while rendering)
+    """
+    figure = Figure(figsize=(6, 4), dpi=100)
+    FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    tracemalloc.start()
+    start = timeit.default_timer()
+    render(ax)
+    figure.canvas.draw()
+    elapsed = timeit.default_timer() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_heatmap():
+    print("{:<28} {:>13} {:>13} {:>13} {:>13}".format("heatmap", "scatter", "scatter mem", "raster",
+                                                       "raster mem"))
+    first = datetime.date(2019, 12, 15)
+    for days in (1, 3, 30, 365):
+        trackings = [reader.fix(synthetic_day(1, first + datetime.timedelta(days=i))) for i in range(min(days, 3))]
+        matrix = np.resize(np.stack([reader.minute_grid(t)[0]["status"] for t in trackings]), (days, 60 * 24))
+        if days <= 3:
+            s_time, s_mem = measure(lambda ax: scatter_heatmap(ax, trackings))
+            scatter = "{:>10.3f} s {:>10.1f} MB".format(s_time, s_mem / 2 ** 20)
+        else:
+            scatter = "{:>13} {:>13}".format("(too slow)", "-")
+        r_time, r_mem = measure(lambda ax: heatmap.draw(ax, matrix, first))
+        print("{:<28} {} {:>10.3f} s {:>10.1f} MB".format("{} day(s)".format(days), scatter, r_time, r_mem / 2 ** 20))
+
+
+def io_counters() -> dict:
+    """
+    :return: this process' I/O counters from /proc/self/io (which count sockets too), empty where there is none
+    """
+    try:
+        with open("/proc/self/io") as file:
+            return {k: int(v) for k, v in (line.split(':') for line in file)}
+    except OSError:
+        return {}
+
+
+def run_collector(interval: float, ticks: int, outages: list, **stand_in) -> dict:
+    """
+    Runs data_collector.monitor() in a temporary data directory, against a SpeedtestStandIn in a child process (so
+    only the collector's own CPU time is counted).
+    :param interval: seconds between ticks
+    :param ticks: ticks to run
+    :param outages: (first tick, last tick) ranges during which the stand-in drops every request
+    :param stand_in: other arguments of standins.SpeedtestStandIn
+    :return: dict with the measurements. "bytes" is the size of the data directory afterwards (the .slot file is
+             preallocated), "syscalls" counts every read and write call, sockets included
+    """
+    started = time.monotonic()
+    # Windows open a bit before their first tick and close a bit before the tick after their last one
+    windows = [(interval * (a - 1) - interval / 4, interval * b - interval / 4) for a, b in outages]
+    process, url = standins.speedtest_process(outages=windows, started=started, **stand_in)
+    expected = {i: not any(a <= i <= b for a, b in outages) for i in range(1, ticks + 1)}
+
+    data_dir, client = slots.DATA_DIR, data_collector._client
+    with tempfile.TemporaryDirectory() as tmp:
+        slots.DATA_DIR = tmp
+        data_collector._client = data_collector.SpeedtestClient(factory=standins.local_speedtest(url, interval))
+        try:
+            before, cpu = io_counters(), time.process_time()
+            first_day = datetime.date.today()
+            wall = time.monotonic()
+            with contextlib.redirect_stdout(io.StringIO()):
+                # Light probes would reach the network, and answer for the outages injected into the stand-in
+                data_collector.monitor(interval, ticks=ticks, light_probes=())
+            wall = time.monotonic() - wall
+            cpu = time.process_time() - cpu
+            after = io_counters()
+            written = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+
+            records = {}
+            day = first_day
+            while day <= datetime.date.today():
+                if reader.day_exists(day) and os.path.exists(reader.trck_path(day)):
+                    records.update({r[0]: slots.status_of(r[2]) == slots.ONLINE for r in reader.organize(day)})
+                day += datetime.timedelta(days=1)
+        finally:
+            slots.DATA_DIR, data_collector._client = data_dir, client
+            process.terminate()
+
+    samples = len(records)
+    offline = [i for i, up in expected.items() if not up]
+    return {"samples": samples, "wall": wall, "cpu": cpu, "bytes": written,
+            "syscalls": (after.get("syscr", 0) + after.get("syscw", 0) - before.get("syscr", 0) -
+                         before.get("syscw", 0)) if after else None,
+            "accuracy": sum(records.get(i) == up for i, up in expected.items()) / len(expected),
+            "detected": sum(records.get(i) is False for i in offline), "outages": len(offline),
+            "false": sum(records.get(i) is False for i, up in expected.items() if up)}
+
+
+def bench_collector():
+    """
+    The collector against a local speedtest stand-in, in accelerated time: a tick every few seconds instead of every
+    minute, with a short and a long outage injected.
+    """
+    print("{:<22} {:>9} {:>11} {:>11} {:>11} {:>11} {:>9} {:>9}".format(
+        "collector", "samples/s", "CPU/sample", "bytes/smpl", "calls/smpl", "accuracy", "detected", "false"))
+    for name, stand_in in (("unshaped", {}), ("2 MB/s, 50 ms", {"bandwidth": 2e6, "latency": 0.05})):
+        m = run_collector(4, 16, [(4, 5), (9, 12)], **stand_in)
+        print("{:<22} {:>9.3f} {:>8.1f} ms {:>11.0f} {:>11} {:>10.1f}% {:>5}/{:<3} {:>9}".format(
+            name, m["samples"] / m["wall"], m["cpu"] / m["samples"] * 1000, m["bytes"] / m["samples"],
+            "-" if m["syscalls"] is None else "{:.0f}".format(m["syscalls"] / m["samples"]), m["accuracy"] * 100,
+            m["detected"], m["outages"], m["false"]))
+
+
+SUITE_DAYS = (1, 30, 365)
+SUITE_FIRST = datetime.date(2019, 1, 1)
+SUITE_SEED = 2019
+SUITE_REPEAT = 3
+REGRESSION = 1.25       # flagged when a case takes this many times the time or allocations of the previous run...
+REGRESSION_FLOOR = 0.005    # ...and at least this many seconds more, so timer noise on tiny cases isn't flagged
+
+
+def _days(first: datetime.date, last: datetime.date) -> list:
+    return [first + datetime.timedelta(days=d) for d in range((last - first).days + 1)]
+
+
+def _existing(first: datetime.date, last: datetime.date) -> list:
+    return [day for day in _days(first, last) if reader.day_exists(day)]
+
+
+def case_organize(first, last):
+    return lambda: [reader.organize(day) for day in _existing(first, last)]
+
+
+def case_fix(first, last):
+    trackings = [reader.organize(day) for day in _existing(first, last)]
+    return lambda: [reader.fix(copy.copy(tracking)) for tracking in trackings]
+
+
+def case_get_analysis(first, last):
+    trackings = [reader.fix(reader.organize(day)) for day in _existing(first, last)]
+    return lambda: [reader.get_analysis(tracking) for tracking in trackings]
+
+
+def case_outages_index_cold(first, last):
+    def run():
+        reader.cache.clear()
+        if os.path.exists(summary_index.index_path()):
+            os.remove(summary_index.index_path())
+        analysis = summary_index.summary(first, last)
+        return reader.outage_times(analysis["outages"], datetime.datetime.combine(first, datetime.time()))
+    return run
+
+
+def case_outages_index_warm(first, last):
+    summary_index.summary(first, last)
+    return lambda: reader.outage_times(summary_index.summary(first, last)["outages"],
+                                       datetime.datetime.combine(first, datetime.time()))
+
+
+def case_outages_load_range(first, last):
+    def run():
+        reader.cache.clear()
+        analysis = reader.analyse(reader.load_range(first, last)[1]["status"])
+        return reader.outage_times(analysis["outages"], datetime.datetime.combine(first, datetime.time()))
+    return run
+
+
+def case_heatmap(first, last):
+    def run():
+        reader.cache.clear()
+        matrix = heatmap.status_matrix(first, last)
+        levels = heatmap.pyramid(matrix)
+        figure = Figure(figsize=(6, 4), dpi=100)
+        FigureCanvasAgg(figure)
+        heatmap.draw(figure.add_subplot(111), matrix, first)
+        figure.canvas.draw()
+        return levels
+    return run
+
+
+# (name, case, needs .slot files): a case builds its state and returns what to time. "outages" cases are what the
+# GUI's outage list goes through, "heatmap" is the GUI's heatmap build
+SUITE_CASES = [("organize", case_organize, False),
+               ("fix", case_fix, False),
+               ("get_analysis", case_get_analysis, False),
+               ("outages, index cold", case_outages_index_cold, False),
+               ("outages, index warm", case_outages_index_warm, False),
+               ("outages, load_range .trck", case_outages_load_range, False),
+               ("outages, load_range .slot", case_outages_load_range, True),
+               ("heatmap .trck", case_heatmap, False),
+               ("heatmap .slot", case_heatmap, True)]
+
+
+def peak_rss() -> int:
+    """
+    :return: peak resident set size of this process in bytes, 0 where it can't be known
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def run_case(data_dir: str, case, first: datetime.date, last: datetime.date, results=None) -> dict:
+    """
+    Times a case (best of SUITE_REPEAT), then runs it once more under tracemalloc for its allocations.
+    :return: dict with "wall" (s), "rss" (peak RSS of the process, bytes) and "alloc" (peak traced bytes)
+    """
+    slots.DATA_DIR = data_dir
+    run = case(first, last)
+    gc.collect()
+    wall = min(timeit.repeat(run, number=1, repeat=SUITE_REPEAT))
+    rss = peak_rss()
+    tracemalloc.start()
+    run()
+    alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    measured = {"wall": wall, "rss": rss, "alloc": alloc}
+    if results is not None:
+        results.put(measured)
+    return measured
+
+
+def isolated(data_dir: str, case, first: datetime.date, last: datetime.date) -> dict:
+    """
+    run_case() in a forked child, so every case starts with an empty cache and its peak RSS is its own. Platforms
+    without fork() run it in this process.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return run_case(data_dir, case, first, last)
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    child = context.Process(target=run_case, args=(data_dir, case, first, last, results))
+    child.start()
+    measured = results.get()
+    child.join()
+    return measured
+
+
+def commit() -> str:
+    """
+    :return: the current git commit, with "+" appended if the tree has changes, or None outside of a git repository
+    """
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return head.stdout.strip() + ("+" if status.stdout.strip() else "")
+
+
+def suite_history_path() -> str:
+    return os.path.join(slots.DATA_DIR, "benchmark_history.jsonl")
+
+
+def previous_run(current: str) -> dict:
+    """
+    :return: the latest run in the suite's history (see suite_history_path()) made at another commit (any run when
+             current is None), None if there is none
+    """
+    path = suite_history_path()
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if current is None or entry.get("commit") != current:
+                previous = entry
+    return previous
+
+
+def bench_suite():
+    """
+    Every SUITE_CASES case on a SUITE_FIRST history of each of SUITE_DAYS days (generated with SUITE_SEED, so runs of
+    different commits see the same data).
+    """
+    current = commit()
+    previous = previous_run(current)
+    title = "suite" + ("" if previous is None else " (vs {})".format(previous["commit"] or "last run"))
+    print("{:<38} {:>10} {:>11} {:>11} {:>9}".format(title, "wall", "peak RSS", "allocated", "vs prev"))
+    results = {}
+    data_dir = slots.DATA_DIR
+    try:
+        for days in SUITE_DAYS:
+            last = SUITE_FIRST + datetime.timedelta(days=days - 1)
+            with tempfile.TemporaryDirectory() as trck_dir, tempfile.TemporaryDirectory() as slot_dir:
+                for directory, with_slots in ((trck_dir, False), (slot_dir, True)):
+                    slots.DATA_DIR = directory
+                    generate_history.generate(SUITE_FIRST, days, with_slots=with_slots, seed=SUITE_SEED)
+                for name, case, needs_slots in SUITE_CASES:
+                    key = "{}, {} day(s)".format(name, days)
+                    results[key] = m = isolated(slot_dir if needs_slots else trck_dir, case, SUITE_FIRST, last)
+                    before = None if previous is None else previous["results"].get(key)
+                    change = "" if before is None else "{:>8.2f}x".format(m["wall"] / before["wall"])
+                    if before is not None and ((m["wall"] > before["wall"] * REGRESSION and
+                                                m["wall"] - before["wall"] > REGRESSION_FLOOR) or
+                                               m["alloc"] > before["alloc"] * REGRESSION):
+                        change += "  REGRESSION"
+                    print("{:<38} {:>8.3f} s {:>8.1f} MB {:>8.1f} MB {}".format(
+                        key, m["wall"], m["rss"] / 2 ** 20, m["alloc"] / 2 ** 20, change))
+    finally:
+        slots.DATA_DIR = data_dir
+
+    os.makedirs(slots.DATA_DIR, exist_ok=True)
+    with open(suite_history_path(), 'a') as file:
+        print(json.dumps({"commit": current, "when": datetime.datetime.now().isoformat(timespec="seconds"),
+                          "results": results}), file=file)
+
+
+COMPRESSION_DAYS = 3 * 365
+COMPRESSION_TRAINING_DAYS = 14
+
+
+def read_all(days: list) -> tuple:
+    """
+    :return: (seconds organize() took over every day, records read)
+    """
+    start = time.perf_counter()
+    records = sum(len(reader.organize(day)) for day in days)
+    return time.perf_counter() - start, records
+
+
+def directory_size(directory: str, suffix: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+               if name.endswith(suffix))
+
+
+def bench_compression():
+    """
+    Plain .trck files against gzip and zstd (with and without a dictionary trained on the first
+    COMPRESSION_TRAINING_DAYS days) on a COMPRESSION_DAYS days history: total size, time to compress, and how fast
+    organize() reads the whole history back.
+    """
+    days = [SUITE_FIRST + datetime.timedelta(days=d) for d in range(COMPRESSION_DAYS)]
+    formats = [("plain", None, None), ("gzip", "gz", None)]
+    if trck.zstandard is not None:
+        formats += [("zstd", "zst", False), ("zstd + dictionary", "zst", True)]
+    else:
+        print("zstandard isn't installed, only gzip is measured")
+    print("{:<20} {:>10} {:>7} {:>11} {:>9} {:>11} {:>13}".format(
+        "{} days".format(COMPRESSION_DAYS), "size", "ratio", "compress", "read", "text read", "records read"))
+    data_dir = slots.DATA_DIR
+    try:
+        with tempfile.TemporaryDirectory() as plain_dir:
+            slots.DATA_DIR = plain_dir
+            generate_history.generate(SUITE_FIRST, COMPRESSION_DAYS, seed=SUITE_SEED)
+            plain = directory_size(plain_dir, ".trck")
+            for name, method, dictionary in formats:
+                with tempfile.TemporaryDirectory() as directory:
+                    slots.DATA_DIR = directory
+                    for file_name in os.listdir(plain_dir):
+                        shutil.copy(os.path.join(plain_dir, file_name), directory)
+                    compressing = 0.0
+                    if method is not None:
+                        start = time.perf_counter()
+                        if dictionary:
+                            dictionary = trck.train_dictionary(days[:COMPRESSION_TRAINING_DAYS])
+                        for day in days:
+                            trck.compress(day, method, dictionary)
+                        compressing = time.perf_counter() - start
+                    size = directory_size(directory, ".trck" + ("" if method is None else trck.SUFFIXES[method]))
+                    reading, records = read_all(days)
+                    print("{:<20} {:>7.1f} MB {:>6.1f}x {:>9.2f} s {:>7.2f} s {:>6.1f} MB/s {:>9.0f} k/s".format(
+                        name, size / 2 ** 20, plain / size, compressing, reading, plain / reading / 2 ** 20,
+                        records / reading / 1000))
+    finally:
+        slots.DATA_DIR = data_dir
+
+
+BENCHMARKS = {"fix": bench_fix, "heatmap": bench_heatmap, "collector": bench_collector, "suite": bench_suite,
+              "compression": bench_compression}
+
+
+if __name__ == "__main__":
+    for bench in (sys.argv[1:] or BENCHMARKS):
+        BENCHMARKS[bench]()
+        print()
@@ -0,0 +1,225 @@
+"""
+Catalog of the days there is data for. It is built with a single scan of the data directory, keyed on real dates (the
+DD_MM_YYYY names don't sort), and counts minute files (.trck, compressed or not, and .slot) as well as days compacted
+into the retention tiers. watch() keeps it current with inotify on Linux, and by rescanning every POLL_SECONDS seconds
+elsewhere, and calls its subscribers with the days whose files changed.
+"""
+
+import ctypes
+import ctypes.util
+import datetime
+import os
+import platform
+import select
+import struct
+import threading
+import retention
+import slots
+import trck
+
+POLL_SECONDS = 5
+DAILY_SUFFIX = ".daily.npz"
+
+# inotify(7)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")      # wd, mask, cookie, length of the name that follows
+
+
+def _day_of(name: str) -> datetime.date:
+    return slots.day_of(name) or trck.day_of(name)
+
+
+def _compacted(directory: str, name: str) -> set:
+    """
+    :return: the days in a daily tier file, none if it can't be read (e.g. it is being replaced)
+    """
+    try:
+        return retention.daily_days(os.path.join(directory, name))
+    except (OSError, ValueError, KeyError):
+        return set()
+
+
+class Catalog:
+
+    def __init__(self, directory: str = None):
+        """
+        :param directory: (str, default = None) the data directory, None for slots.DATA_DIR
+        """
+        self.directory = slots.DATA_DIR if directory is None else directory
+        self.watching = None            # "inotify" or "polling" once watch() was called
+        self._files = {}                # name of a minute file -> (day, mtime, size)
+        self._tiers = {}                # name of a daily tier file -> days it holds
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.scan()
+
+    def _entries(self) -> tuple:
+        """
+        One scan of the directory.
+        :return: (minute files as {name: (day, mtime, size)}, daily tier file names)
+        """
+        files, tiers = {}, []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    day = _day_of(entry.name)
+                    if day is not None:
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        files[entry.name] = (day, stat.st_mtime_ns, stat.st_size)
+                    elif entry.name.endswith(DAILY_SUFFIX):
+                        tiers.append(entry.name)
+        except FileNotFoundError:
+            pass
+        return files, tiers
+
+    def scan(self) -> set:
+        """
+        Rescans the directory.
+        :return: the days that were added, removed or whose files changed since the last scan
+        """
+        files, tiers = self._entries()
+        tier_days = {name: _compacted(self.directory, name) for name in tiers}
+        with self._lock:
+            changed = {entry[0] for name, entry in files.items() if self._files.get(name) != entry}
+            changed |= {entry[0] for name, entry in self._files.items() if name not in files}
+            for name in set(tier_days) | set(self._tiers):
+                changed |= tier_days.get(name, set()) ^ self._tiers.get(name, set())
+            self._files, self._tiers = files, tier_days
+        return changed
+
+    def days(self) -> list:
+        """
+        :return: every day with data, sorted
+        """
+        with self._lock:
+            found = {entry[0] for entry in self._files.values()}
+            for days in self._tiers.values():
+                found |= days
+        return sorted(found)
+
+    def first(self) -> datetime.date:
+        """
+        :return: the first day with data, None if there is none
+        """
+        days = self.days()
+        return days[0] if days else None
+
+    def __contains__(self, day: datetime.date) -> bool:
+        with self._lock:
+            return any(entry[0] == day for entry in self._files.values()) or \
+                any(day in days for days in self._tiers.values())
+
+    def subscribe(self, callback):
+        """
+        :param callback: called as callback(set of days) with the days whose files changed, from the watching thread
+        """
+        self._subscribers.append(callback)
+
+    def _notify(self, changed: set):
+        if changed:
+            for callback in self._subscribers:
+                callback(changed)
+
+    def _changed(self, names: set) -> set:
+        """
+        Updates the entries of some files after inotify events.
+        :return: the days whose files changed
+        """
+        changed = set()
+        for name in names:
+            day = _day_of(name)
+            if day is not None:
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entry = (day, stat.st_mtime_ns, stat.st_size)
+                except FileNotFoundError:
+                    entry = None
+                with self._lock:
+                    if self._files.get(name) != entry:
+                        changed.add(day)
+                        if entry is None:
+                            self._files.pop(name, None)
+                        else:
+                            self._files[name] = entry
+            elif name.endswith(DAILY_SUFFIX):
+                days = _compacted(self.directory, name)
+                with self._lock:
+                    changed |= days ^ self._tiers.get(name, set())
+                    if days:
+                        self._tiers[name] = days
+                    else:
+                        self._tiers.pop(name, None)
+        return changed
+
+    def watch(self) -> str:
+        """
+        Keeps the catalog current on a background thread until close().
+        :return: "inotify", or "polling" where inotify isn't available
+        """
+        fd = _inotify(self.directory)
+        self.watching = "polling" if fd is None else "inotify"
+        target = self._poll if fd is None else self._read_events
+        threading.Thread(target=target, args=() if fd is None else (fd,), name="Catalog", daemon=True).start()
+        return self.watching
+
+    def _poll(self):
+        while not self._stop.wait(POLL_SECONDS):
+            self._notify(self.scan())
+
+    def _read_events(self, fd: int):
+        try:
+            # Whatever changed between the scan and the watch
+            self._notify(self.scan())
+            while not self._stop.is_set():
+                if not select.select([fd], [], [], 1)[0]:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                names, overflow = set(), False
+                i = 0
+                while i + _EVENT.size <= len(data):
+                    wd, mask, cookie, length = _EVENT.unpack_from(data, i)
+                    i += _EVENT.size
+                    names.add(data[i:i + length].rstrip(b"\0").decode(errors="replace"))
+                    overflow = overflow or mask & IN_Q_OVERFLOW
+                    i += length
+                self._notify(self.scan() if overflow else self._changed(names - {""}))
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._stop.set()
+
+
+def _inotify(directory: str):
+    """
+    :return: an inotify descriptor watching directory, None if inotify isn't available
+    """
+    if platform.system() != "Linux":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return None
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+    except (OSError, AttributeError):
+        return None
+    return fd
@@ -0,0 +1,138 @@
+"""
+Client side of the collector's control socket (data/collector.sock, see data_collector.ControlServer). A request is one
+line of JSON, {"command": ..., arguments...}, and so is its response, {"ok": true/false, ...}:
+    start, resume       resume collecting (start also launches the collector when it isn't running, see launch())
+    pause               keep the collector running, but skip its ticks
+    stop                stop the collector; it answers, then exits within milliseconds
+    status              paused, interval, tick and the live status (see live)
+    reconfigure         {"interval": seconds} changes the interval between speedtests
+Request never blocks, so the GUI can send one and poll() it from its mainloop.
+    python control.py COMMAND [interval]
+"""
+
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import slots
+
+COMMANDS = ("start", "stop", "pause", "resume", "status", "reconfigure")
+MAX_MESSAGE = 64 * 1024
+COLLECTOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_collector.py")
+
+
+def socket_path() -> str:
+    return os.path.join(slots.DATA_DIR, "collector.sock")
+
+
+def pid_path(name: str = "collector") -> str:
+    """
+    :param name: (str, default = "collector") "collector", or "supervisor" for the process that restarts it
+    :return: where the process' PID is stored
+    """
+    if platform.system() == "Windows":
+        return os.path.join(os.environ["APPDATA"], "ICT/{}.pid".format(name))
+    return os.path.join(slots.DATA_DIR, "{}.pid".format(name))
+
+
+def read_pid(name: str = "collector") -> int:
+    """
+    :return: the stored PID (see pid_path()), None if there is none
+    """
+    try:
+        with open(pid_path(name), 'r') as file:
+            return int(file.read().strip('\n'))
+    except (OSError, ValueError):
+        return None
+
+
+def available() -> bool:
+    """
+    :return: True if the platform has Unix domain sockets
+    """
+    return hasattr(socket, "AF_UNIX")
+
+
+class Request:
+    """
+    A request to the control socket that never blocks: connecting and sending a line to a local socket don't wait, and
+    poll() only takes what has already arrived.
+    """
+
+    def __init__(self, command: str, path: str = None, **arguments):
+        """
+        :param command: one of COMMANDS
+        :param path: (str, default = None) the socket, None for socket_path()
+        :param arguments: the command's arguments
+        """
+        self.command = command
+        self.response = None
+        self._buffer = b""
+        self._socket = None
+        try:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.setblocking(False)
+            self._socket.connect(socket_path() if path is None else path)
+            self._socket.sendall((json.dumps(dict(arguments, command=command)) + "\n").encode())
+        except OSError as e:
+            self._finish({"ok": False, "error": "The collector isn't running ({})".format(e), "running": False})
+
+    def _finish(self, response: dict):
+        self.response = response
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def poll(self) -> dict:
+        """
+        :return: the response, None if it hasn't arrived yet
+        """
+        while self.response is None:
+            try:
+                data = self._socket.recv(MAX_MESSAGE)
+            except BlockingIOError:
+                return None
+            except OSError as e:
+                self._finish({"ok": False, "error": str(e), "running": False})
+                break
+            self._buffer += data
+            if b"\n" in self._buffer or not data:
+                try:
+                    self._finish(json.loads(self._buffer.split(b"\n")[0]))
+                except ValueError:
+                    self._finish({"ok": False, "error": "Bad response: {!r}".format(self._buffer)})
+        return self.response
+
+    def wait(self, timeout: float = 2.0) -> dict:
+        """
+        Polls until the response arrives, for scripts.
+        :return: the response, None if it didn't arrive within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        while self.poll() is None and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return self.response
+
+
+def launch() -> subprocess.Popen:
+    """
+    Starts the collector's supervisor as a daemon (see data_collector.supervise()). Returns as soon as it is spawned.
+    """
+    if platform.system() == "Windows":
+        return subprocess.Popen([sys.executable, COLLECTOR, "--supervise"], stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen([sys.executable, COLLECTOR, "--daemon"], stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+if __name__ == "__main__":
+    arguments = {"interval": float(sys.argv[2])} if len(sys.argv) > 2 else {}
+    response = Request(sys.argv[1], **arguments).wait()
+    if sys.argv[1] == "start" and response is not None and response.get("running") is False:
+        launch()
+        response = {"ok": True, "launched": True}
+    print(json.dumps(response, indent=4))
@@ -0,0 +1,31 @@
+import os
+import sys
+import reader
+import slots
+import trck
+
+
+def convert(overwrite: bool = False) -> list:
+    """
+    One-shot conversion of the existing .trck history into .slot files. The .trck files are left untouched, so the
+    text history keeps working with older tools.
+    :param overwrite: (bool, default = False) rebuilds .slot files that already exist
+    :return: list of the days converted, as datetime.date
+    """
+    converted = []
+    for day in sorted({trck.day_of(name) for name in os.listdir(slots.DATA_DIR)} - {None}):
+        if not overwrite and os.path.exists(slots.slot_path(day)):
+            continue
+        tracking = reader.organize(day)
+        if not tracking:
+            continue
+        slots.write_grid(day, reader.minute_grid(tracking)[0])
+        converted.append(day)
+    return converted
+
+
+if __name__ == "__main__":
+    days = convert(overwrite="--overwrite" in sys.argv)
+    print("Converted {} day(s)".format(len(days)))
+    for d in days:
+        print("\t" + d.strftime("%d/%m/%Y"))
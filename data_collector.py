@@ -1,63 +1,615 @@
 import speedtest
 import datetime
-import platform
+import json
+import math
 import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import scheduler
+import probes
+import slots
+import summary_index
+import trck
+import metrics
+import retention
+import live
+import control
 
 
-def store_pid():
-    if platform.system() == "Windows":
-        with open(os.path.join(os.environ["APPDATA"], "ICT/collector.pid"), 'w') as file:
-            file.write(str(os.getpid()))
-    elif platform.system() == "Linux":
-        with open("data/collector.pid", 'w') as file:
-            file.write(str(os.getpid()))
+def store_pid(name: str = "collector"):
+    """
+    :param name: (str, default = "collector") whose PID it is, see control.pid_path()
+    """
+    with open(control.pid_path(name), 'w') as file:
+        file.write(str(os.getpid()))
+
+
+class SpeedtestClient:
+    """
+    Long-lived speedtest client. Fetching the config and server list and pinging the closest servers to pick the best
+    one happens once and is kept across tests; each test only re-pings the kept server. Selection runs again when it is
+    older than 'ttl', after 'max_failures' failed tests in a row, or when the kept server's ping regresses to more than
+    'regression' times what it was when it was picked. Keeping the same server also keeps samples comparable.
+    """
+
+    def __init__(self, ttl: float = 6 * 60 * 60, max_failures: int = 3, regression: float = 2.0,
+                 factory=speedtest.Speedtest):
+        """
+        :param ttl: (float, default = 6 hours) seconds a server selection (and the client's config) is kept for
+        :param max_failures: (int, default = 3) failed tests in a row that force a new selection
+        :param regression: (float, default = 2.0) ping, relative to the ping at selection, that forces a new selection
+        :param factory: (default = speedtest.Speedtest) builds the underlying client
+        """
+        self.ttl = ttl
+        self.max_failures = max_failures
+        self.regression = regression
+        self.factory = factory
+        self.client = None
+        self.server = None
+        self.baseline = None
+        self.selected_at = None
+        self.failures = 0
+        self.selections = 0
+        self.phases = {}
+
+    def needs_selection(self) -> bool:
+        return self.server is None or self.failures >= self.max_failures or \
+               time.monotonic() - self.selected_at > self.ttl
+
+    def select(self):
+        """
+        Fetches the config and the server list, then picks the server with the lowest latency. How long each took
+        ("servers", "selection") is left in 'phases', in seconds.
+        """
+        start = time.perf_counter()
+        self.client = self.factory()
+        self.client.get_servers()
+        self.phases["servers"] = time.perf_counter() - start
+        start = time.perf_counter()
+        self.server = self.client.get_best_server()
+        self.phases["selection"] = time.perf_counter() - start
+        self.baseline = self.server["latency"]
+        self.selected_at = time.monotonic()
+        self.failures = 0
+        self.selections += 1
+
+    def test(self) -> tuple:
+        """
+        :return: (download, upload, ping), speeds as bits per second and ping as MilliSeconds. How long each phase
+                 took ("servers" and "selection", or "ping", then "download", "upload") is left in 'phases', in
+                 seconds
+        """
+        self.phases = {}
+        try:
+            if self.needs_selection():
+                self.select()
+            else:
+                start = time.perf_counter()
+                self.client.get_best_server([self.server])
+                self.phases["ping"] = time.perf_counter() - start
+            start = time.perf_counter()
+            self.client.download()
+            self.phases["download"] = time.perf_counter() - start
+            start = time.perf_counter()
+            self.client.upload()
+            self.phases["upload"] = time.perf_counter() - start
+            res = self.client.results.dict()
+        except:
+            self.failures += 1
+            raise
+        self.failures = 0
+        if res["ping"] > self.baseline * self.regression:
+            self.server = None
+        return res["download"], res["upload"], res["ping"]
+
+
+_client = SpeedtestClient()
 
 
 def test():
-    s = speedtest.Speedtest()
-    s.get_servers()
-    s.get_best_server()
-    s.download()
-    s.upload()
-    res = s.results.dict()
-    return res["download"], res["upload"], res["ping"]
-
-
-def monitor():
-    i = 0
-    this_time = None
-    next_time = datetime.datetime.now()
-    while True:
-        if datetime.datetime.now() >= next_time:
-            file_name = "data/{}.trck".format(datetime.datetime.now().strftime("%d_%m_%Y"))
-            i += 1
-            this_time = datetime.datetime.now()
-            next_time = this_time + datetime.timedelta(minutes=1)
-            try:
-                d, u, p = test()
-                with open(file_name, 'a') as f:
-                    print('{}:'.format(i), file=f)
-                    print(this_time.strftime('%d/%m/%Y %H:%M'), file=f)
-                    print('{:.2f}'.format(d / 1024), file=f)        # kb/s
-                    print('{:.2f}'.format(u / 1024), file=f)
-                    print('{}'.format(p), file=f)                    # ms
-
-                print("Time: ", this_time.strftime('%d/%m/%Y %H:%M'))
-                print("Test #{}\n\tDownload: {} Kb/s\n\tUpload: {} Kb/s\n\tLatency: {} ms".format(i, d/1024, u/1024, p))
-                print("Waiting for ", next_time.strftime('%d/%m/%Y %H:%M'))
-            except:
-                with open(file_name, 'a') as f:
-                    print('{}:'.format(i), file=f)
-                    print(this_time.strftime('%d/%m/%Y %H:%M'), file=f)
-                    print('-1', file=f)        # kb/s
-                    print('-1', file=f)
-                    print('-1', file=f)         # ms
-
-                print("Time: ", this_time.strftime('%d/%m/%Y %H:%M'))
+    return _client.test()
+
+
+LIGHT_TARGETS = ["tcp:1.1.1.1:53", "tcp:8.8.8.8:53", "dns:speedtest.net"]
+LIGHT_INTERVAL = 5
+# The light tier decides the status of every minute, so speedtests only need to run now and then for the speeds
+HEAVY_INTERVAL = 15 * 60
+# Without it, every minute between two speedtests would be unknown
+SOLO_INTERVAL = 60
+LIGHT_RUN = 0           # run number of the records of minutes decided by the light tier
+
+
+def watch(light_probes: list, interval: float = LIGHT_INTERVAL, collector_control=None,
+          on_minute=None) -> scheduler.Scheduler:
+    """
+    Starts the light tier: runs every probe each 'interval' seconds on a background thread and logs the results.
+    Prints a line whenever the connection goes down or comes back.
+    :param light_probes: list of probes.Probe
+    :param interval: (float, default = LIGHT_INTERVAL) seconds between rounds
+    :param collector_control: (Control, default = None) rounds are skipped while it is paused
+    :param on_minute: (default = None) called as on_minute(minute, rounds) once a minute is over, with the minute as a
+                      datetime.datetime and the results of its rounds (see probes.minute_verdict())
+    :return: the running Scheduler, stop() it to end the tier
+    """
+    online = [None]
+    minute = [None, []]     # the minute being gathered, its rounds
+
+    def probe(tick: int, lag: float):
+        if collector_control is not None and collector_control.paused.is_set():
+            return
+        results = probes.fan_out(light_probes)
+        probes.log(results)
+        state = probes.verdict(results)
+        if state != online[0]:
+            online[0] = state
+            print("{}: light probes say the connection is {}".format(results[0].when.strftime('%d/%m/%Y %H:%M:%S'),
+                                                                     "up" if state else "DOWN"))
+        if on_minute is not None:
+            when = results[0].when.replace(second=0, microsecond=0)
+            if minute[0] is not None and minute[0] != when:
+                on_minute(minute[0], minute[1])
+                minute[1] = []
+            minute[0] = when
+            minute[1].append(results)
+
+    light = scheduler.Scheduler(interval, probe)
+    threading.Thread(target=light.run, name="LightProbes", daemon=True).start()
+    return light
+
+
+class Control:
+    """
+    What the control socket (see ControlServer) changes in a running monitor(): pausing, the interval, stopping.
+    """
+
+    def __init__(self, interval: float = HEAVY_INTERVAL):
+        self.interval = interval
+        self.paused = threading.Event()
+        self.ready = threading.Event()     # set by monitor() once halt is set and it is about to run its first tick
+        self.stopped = threading.Event()
+        self.restart = False
+        self.scheduler = None
+        self.halt = None        # set by monitor(): closes the files, between two writes
+
+    def reconfigure(self, interval: float):
+        """
+        Restarts the heavy tier with a new interval, once the tick running (if any) is done. The tick count (and the
+        monitor()'s 'ticks' limit) carries on from where it was.
+        """
+        self.interval = interval
+        self.restart = not self.stopped.is_set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+    def stop(self):
+        """
+        Makes monitor() return once the tick running (if any) is done, or before its first tick if it hasn't started.
+        """
+        self.restart = False
+        self.stopped.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
+
+def monitor(interval: float = None, overlap: str = scheduler.SKIP, ticks: int = None,
+            light_probes: list = None, writer: trck.Writer = None, sink: metrics.MetricsSink = None,
+            keep_minutes: int = retention.MINUTE_DAYS, compression: str = trck.COMPRESSION,
+            collector_control: Control = None, light_interval: float = LIGHT_INTERVAL):
+    """
+    The heavy tier: runs a speedtest every 'interval' seconds and appends the results to the day's files and probe log.
+    With light probes, the light tier (see watch()) runs alongside it and decides the status of every minute without a
+    speedtest: a minute is offline when most of its rounds found every target down, and its record (run LIGHT_RUN)
+    has no speeds (slots.NO_SPEEDTEST) but the median latency of each target.
+    The light probes run alongside each speedtest, so a failed speedtest while other targets answer is told apart from
+    an outage: the minute is recorded as online without speeds (slots.NO_SPEEDTEST) instead of offline. Every tick
+    writes one .trck record, with the latency of each light probe target, and the matching .slot row. After every
+    tick, the collector's state is published as its live status (see live). It returns once the compression and
+    compaction it started in the background are done.
+    :param interval: (float, default = None) seconds between tests, None is HEAVY_INTERVAL with light probes and
+                     SOLO_INTERVAL without
+    :param overlap: (str, default = scheduler.SKIP) what to do with ticks that come while a test is still running (see
+                    scheduler)
+    :param ticks: (int, default = None) last tick to run (see scheduler.Scheduler.run()), None runs forever
+    :param light_probes: (list, default = None) probes.Probe to run concurrently with every speedtest, and every
+                         'light_interval' seconds in between. None runs the probes of LIGHT_TARGETS, an empty list
+                         runs the speedtests alone
+    :param writer: (trck.Writer, default = None) writer of the .trck files, None uses one that syncs every record
+    :param sink: (metrics.MetricsSink, default = None) where the phase timings of every tick go, None uses one writing
+                 to the data directory
+    :param keep_minutes: (int, default = retention.MINUTE_DAYS) days kept at minute resolution, older ones are compacted
+                         into the retention tiers in the background at startup and at every rollover. None never
+                         compacts
+    :param compression: (str, default = trck.COMPRESSION) "zst" or "gz": at startup and at every rollover, the .trck
+                        files of closed days are compressed with it in the background (see trck.compress()). None
+                        leaves them as plain text
+    :param collector_control: (Control, default = None) lets the control socket pause, reconfigure and stop the loop
+    :param light_interval: (float, default = LIGHT_INTERVAL) seconds between rounds of the light tier
+    """
+    light_probes = probes.from_config(LIGHT_TARGETS) if light_probes is None else light_probes
+    if interval is None:
+        interval = HEAVY_INTERVAL if light_probes else SOLO_INTERVAL
+    writer = trck.Writer() if writer is None else writer
+    sink = metrics.MetricsSink() if sink is None else sink
+    write_lock = threading.Lock()
+    last_day = [None]
+    # What the live status publishes, see live
+    state = {"tick": 0, "failures": 0, "sample": (None, slots.UNKNOWN, -1, -1, -1), "last_success": None,
+             "outage_start": None, "health": "ok"}
+    halted = [False]
+    heavy_minutes = set()   # minutes with a speedtest running or done, which the light tier leaves alone
+    heavy = probes.SpeedtestProbe(test)
+    compactions = []        # threads running close_days()
+
+    def roll_over(day: datetime.date):
+        """
+        Call with write_lock held, before writing a record of day.
+        """
+        if last_day[0] is None or last_day[0] < day:
+            # Days before this one are closed now: their files can be compressed and compacted, and the previous
+            # day's row in the summary index is final
+            writer.close()
+            compaction = threading.Thread(target=close_days, args=(last_day[0], day), name="Compaction", daemon=True)
+            compaction.start()
+            compactions.append(compaction)
+            last_day[0] = day
+
+    def publish(i: int, when: datetime.datetime, outcome: str, d: float, u: float, p: float):
+        """
+        Call with write_lock held, after writing a record.
+        """
+        state["health"] = outcome
+        if outcome == "offline":
+            state["outage_start"] = state["outage_start"] or when
+        else:
+            state["outage_start"] = None
+        state["sample"] = (when, slots.OFFLINE if outcome == "offline" else slots.ONLINE, d, u, p)
+        try:
+            live.publish(outcome, i, interval, state["failures"], *state["sample"], state["last_success"],
+                         state["outage_start"])
+        except OSError as e:
+            print("Could not publish the live status: {}".format(e))
+
+    def light_minute(when: datetime.datetime, rounds: list):
+        online, targets = probes.minute_verdict(rounds)
+        with write_lock:
+            if halted[0] or when in heavy_minutes:
+                return
+            heavy_minutes.difference_update([m for m in heavy_minutes if m < when])
+            roll_over(when.date())
+            if online:
+                # Medians of a few rounds have the probes' full precision, the records keep two decimals
+                p = round(min((t[2] for t in targets if t[2] is not None), default=-1), 2)
+                writer.write(LIGHT_RUN, when, slots.NO_SPEEDTEST, slots.NO_SPEEDTEST, p, targets)
+                slots.write_sample(when, LIGHT_RUN, slots.NO_SPEEDTEST, slots.NO_SPEEDTEST, p)
+                # The last speedtest's health holds until the next one, unless it found the connection down
+                outcome = "ok" if state["health"] == "offline" else state["health"]
+            else:
+                writer.write(LIGHT_RUN, when, -1, -1, -1, targets)
+                slots.write_sample(when, LIGHT_RUN, -1, -1, -1)
+                outcome = "offline"
+            publish(state["tick"], when, outcome, -1, -1, -1)
+
+    def sample(i: int, lag: float):
+        if collector_control is not None and collector_control.paused.is_set():
+            try:
+                live.publish("paused", i, interval, state["failures"], *state["sample"], state["last_success"], None)
+            except OSError:
+                pass
+            return
+        tick_start = time.perf_counter()
+        this_time = datetime.datetime.now()
+        with write_lock:
+            heavy_minutes.add(this_time.replace(second=0, microsecond=0))
+        next_time = this_time + datetime.timedelta(seconds=interval - lag)
+        results = probes.fan_out([heavy] + list(light_probes))
+        phases = dict(_client.phases, probes=time.perf_counter() - tick_start)
+        start = time.perf_counter()
+        probes.log(results)
+        phases["probe_log"] = time.perf_counter() - start
+        result = results[0]
+        d, u, p = (result.download, result.upload, round(result.latency, 2)) if result.ok else (None, None, None)
+        online = probes.verdict(results)
+        if d is not None:
+            outcome = "ok" if slots.status_of(d) == slots.ONLINE else "offline"
+        else:
+            outcome = "speedtest_failed" if online else "offline"
+
+        with write_lock:
+            start = time.perf_counter()
+            roll_over(this_time.date())
+
+            targets = [(r.probe, r.target, r.latency if r.ok else None) for r in results[1:]]
+            print("Time: ", this_time.strftime('%d/%m/%Y %H:%M'))
+            if d is not None:
+                writer.write(i, this_time, d, u, p, targets)
+                slots.write_sample(this_time, i, d, u, p)
+                print("Test #{}\n\tDownload: {} Kb/s\n\tUpload: {} Kb/s\n\tLatency: {} ms".format(i, d, u, p))
+            elif online:
+                latencies = [r.latency for r in results if r.ok]
+                p = round(min(latencies), 2)
+                writer.write(i, this_time, slots.NO_SPEEDTEST, slots.NO_SPEEDTEST, p, targets)
+                slots.write_sample(this_time, i, slots.NO_SPEEDTEST, slots.NO_SPEEDTEST, p)
+                print("Test #{}\n\tSPEEDTEST FAILED, but {}/{} other target(s) answered".format(
+                    i, len(latencies), len(results) - 1))
+            else:
+                writer.write(i, this_time, -1, -1, -1, targets)
+                slots.write_sample(this_time, i, -1, -1, -1)
                 print("Test #{}\n\tNO INTERNET".format(i))
-                print("Waiting for ", next_time.strftime('%d/%m/%Y %H:%M'))
+            print("Waiting for ", next_time.strftime('%d/%m/%Y %H:%M'))
+            phases["write"] = time.perf_counter() - start
 
+            state["tick"] = i
+            if outcome == "ok":
+                state["last_success"] = this_time
+                state["failures"] = 0
+            else:
+                state["failures"] += 1
+            publish(i, this_time, outcome, *((d, u, p) if d is not None else (-1, -1, -1)))
 
-if __name__ == '__main__':
+        sink.record(i, this_time, lag, time.perf_counter() - tick_start, phases, outcome)
+
+    def close_days(previous: datetime.date, today: datetime.date):
+        """
+        :param previous: the day that just closed, None at startup
+        :param today: the day being written to
+        """
+        if compression is not None:
+            try:
+                trck.compress_closed(today, compression, write_lock)
+            except Exception as e:
+                print("Could not compress closed days: {}".format(e))
+        # After the compression, so the row is keyed on the file that stays
+        if previous is not None:
+            try:
+                summary_index.update(previous)
+            except Exception as e:
+                print("Could not update the summary index: {}".format(e))
+        if keep_minutes is not None:
+            try:
+                compacted, pruned = retention.compact(today, keep_minutes)
+            except Exception as e:
+                print("Could not compact old days: {}".format(e))
+                return
+            if compacted or pruned:
+                print("Compacted {} old day(s), dropped the hourly aggregates of {} day(s)".format(compacted, pruned))
+
+    def missed(count: int):
+        print("Missed {} test(s): the previous test took longer than {} second(s)".format(count, interval))
+
+    def halt():
+        if light_tier is not None:
+            light_tier.stop()
+        with write_lock:
+            halted[0] = True
+            writer.close()
+            try:
+                live.publish("stopped", state["tick"], interval, state["failures"], *state["sample"],
+                             state["last_success"], None)
+            except OSError:
+                pass
+
+    # Replaces whatever the last run left, e.g. "stopped", until the first sample
+    try:
+        live.publish("starting", 0, interval, 0, *state["sample"], None, None)
+    except OSError as e:
+        print("Could not publish the live status: {}".format(e))
+    light_tier = watch(light_probes, light_interval, collector_control, light_minute) if light_probes else None
+    heavy_tier = None
+    if collector_control is not None:
+        collector_control.halt = halt
+        collector_control.ready.set()
+    try:
+        while True:
+            heavy_tier = scheduler.Scheduler(interval, sample, overlap=overlap, on_missed=missed,
+                                             tick=0 if heavy_tier is None else heavy_tier.tick)
+            if collector_control is not None:
+                # Either stop() sees this scheduler, or this sees the stop
+                collector_control.scheduler = heavy_tier
+                if collector_control.stopped.is_set():
+                    break
+            heavy_tier.run(ticks)
+            if collector_control is None or not collector_control.restart:
+                break
+            # Reconfigured: the ticks go on, on the new interval
+            collector_control.restart = False
+            interval = collector_control.interval
+    finally:
+        halt()
+        # Once monitor() returns, nothing it started touches the data directory
+        for compaction in compactions:
+            compaction.join()
+
+
+class ControlServer:
+    """
+    Serves the control socket (see control) of a running collector, on a background thread. Every request is answered
+    right away, on a thread of its own: stop answers and then exits the process as soon as no file is being written,
+    without waiting for the speedtest running (its minute is left unknown).
+    """
+
+    def __init__(self, collector_control: Control, path: str = None, exit_on_stop: bool = True):
+        """
+        :param collector_control: the Control of the monitor() to serve
+        :param path: (str, default = None) the socket, None for control.socket_path()
+        :param exit_on_stop: (bool, default = True) exit the process on stop, else only stop the monitor() loop
+        """
+        self.control = collector_control
+        self.path = control.socket_path() if path is None else path
+        self.exit_on_stop = exit_on_stop
+        if os.path.exists(self.path):
+            # A socket left behind by a collector that died, unless one is still answering on it
+            response = control.Request("status", self.path).wait(1)
+            if response is not None and response.get("ok"):
+                raise RuntimeError("Another collector is serving {}".format(self.path))
+            os.remove(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.socket.listen(8)
+        self.thread = threading.Thread(target=self._accept, name="ControlServer", daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        # Requests wait in the backlog until the monitor() can act on them, so a stop can't come before it can halt
+        self.control.ready.wait()
+        while True:
+            try:
+                connection = self.socket.accept()[0]
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection: socket.socket):
+        with connection:
+            connection.settimeout(1)
+            data = b""
+            request = {}
+            try:
+                while b"\n" not in data and len(data) < control.MAX_MESSAGE:
+                    chunk = connection.recv(4096)
+                    if not chunk:
+                        break
+                    data += chunk
+                request = json.loads(data.split(b"\n")[0])
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object, got {}".format(type(request).__name__))
+                response = self.handle(request)
+            except (OSError, ValueError) as e:
+                request = {}
+                response = {"ok": False, "error": "Bad request: {}".format(e)}
+            stopping = request.get("command") == "stop" and response["ok"]
+            if stopping:
+                # Halted before answering, so the live status already says "stopped" when the answer arrives
+                self.stop()
+            try:
+                connection.sendall((json.dumps(response) + "\n").encode())
+            except OSError:
+                pass
+        if stopping and self.exit_on_stop:
+            os._exit(0)
+
+    def handle(self, request: dict) -> dict:
+        """
+        :return: the response to a request
+        """
+        command = request.get("command")
+        if command in ("start", "resume"):
+            self.control.paused.clear()
+        elif command == "pause":
+            self.control.paused.set()
+        elif command == "reconfigure":
+            try:
+                interval = float(request["interval"])
+            except (KeyError, TypeError, ValueError):
+                return {"ok": False, "error": "reconfigure needs an interval, in seconds"}
+            # nan and inf would make it to the scheduler, which can't lay ticks on them
+            if not math.isfinite(interval) or interval <= 0:
+                return {"ok": False, "error": "The interval must be a positive number of seconds"}
+            self.control.reconfigure(interval)
+        elif command not in ("status", "stop"):
+            return {"ok": False, "error": "Unknown command {!r}, try one of {}".format(command, control.COMMANDS)}
+        status = live.read()
+        if status is not None:
+            status = {k: v.isoformat() if isinstance(v, datetime.datetime) else v for k, v in status.items()}
+        return {"ok": True, "running": True, "pid": os.getpid(), "paused": self.control.paused.is_set(),
+                "interval": self.control.interval, "stopping": command == "stop",
+                "tick": None if self.control.scheduler is None else self.control.scheduler.tick, "live": status}
+
+    def stop(self):
+        self.control.stop()
+        self.close()
+        if self.exit_on_stop and self.control.halt is not None:
+            self.control.halt()
+
+    def close(self):
+        try:
+            self.socket.close()
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def serve():
+    """
+    Runs the collector with its light tier and control socket, until stopped.
+    """
     store_pid()
-    monitor()
+    collector_control = Control()
+    server = ControlServer(collector_control) if control.available() else None
+    try:
+        monitor(collector_control=collector_control)
+    finally:
+        if server is not None:
+            server.close()
+
+
+RESTART_DELAY = 1       # seconds before the supervisor starts a dead collector again, doubled up to MAX_RESTART_DELAY
+MAX_RESTART_DELAY = 60  # while it keeps dying within a minute of starting
+
+
+def supervise():
+    """
+    Runs the collector in a child process and starts it again whenever it dies without being stopped (exit code 0).
+    SIGTERM stops both.
+    """
+    child = [None]
+
+    def terminate(signum, frame):
+        if child[0] is not None:
+            child[0].terminate()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    # Stopping the collector without its control socket (on Windows) has to stop this process first, see
+    # data_service.stop_collector_job()
+    store_pid("supervisor")
+    delay = RESTART_DELAY
+    try:
+        while True:
+            started = time.monotonic()
+            child[0] = subprocess.Popen([sys.executable, os.path.abspath(__file__)])
+            code = child[0].wait()
+            if code == 0:
+                return
+            if time.monotonic() - started > 60:
+                delay = RESTART_DELAY
+            print("{}: the collector exited with {}, starting it again in {} s".format(
+                datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'), code, delay), flush=True)
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+    finally:
+        try:
+            os.remove(control.pid_path("supervisor"))
+        except OSError:
+            pass
+
+
+def daemonize(log_path: str):
+    """
+    Detaches the process from its terminal and parent (double fork), with its output appended to log_path.
+    """
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    if os.fork():
+        os._exit(0)
+    log = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    null = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null, 0)
+    os.dup2(log, 1)
+    os.dup2(log, 2)
+
+
+if __name__ == '__main__':
+    # --daemon: the supervisor, detached; --supervise: the supervisor, in the foreground; else the collector itself
+    if "--daemon" in sys.argv:
+        daemonize(os.path.join(slots.DATA_DIR, "collector.log"))
+        supervise()
+    elif "--supervise" in sys.argv:
+        supervise()
+    else:
+        serve()
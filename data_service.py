@@ -0,0 +1,191 @@
+"""
+Background data service for the GUI. Loading and analysing ranges runs on a worker thread, and the results are handed
+back through a queue that the Tk mainloop polls with after(), so the window never freezes while data is read.
+
+Jobs are generators that yield (stage, payload) pairs as their results become ready, which lets the GUI render
+progressively. Each job has a kind, and submitting a new job of a kind makes every older job of that kind stale: stale
+jobs that haven't started are skipped, running ones stop at their next stage, and their results are never delivered.
+"""
+
+import datetime
+import os
+import queue
+import signal
+import threading
+import analyzer
+import catalog
+import heatmap
+import reader
+
+PERIOD_DAYS = {1: 1, 2: 7, 3: 30}       # time period radio buttons of HomePage, 4 is "All Time"
+
+
+class DataService:
+
+    def __init__(self):
+        self.results = queue.Queue()
+        self._requests = queue.Queue()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="DataService", daemon=True)
+        self._thread.start()
+
+    def submit(self, kind: str, job, *args) -> int:
+        """
+        Queues a job, making older jobs of the same kind stale.
+        :param kind: what the job produces, e.g. "outages"
+        :param job: generator function yielding (stage, payload)
+        :param args: arguments for job
+        :return: the job's generation
+        """
+        with self._lock:
+            generation = self._latest.get(kind, 0) + 1
+            self._latest[kind] = generation
+        self._requests.put((kind, generation, job, args))
+        return generation
+
+    def is_current(self, kind: str, generation: int) -> bool:
+        with self._lock:
+            return self._latest.get(kind) == generation
+
+    def poll(self) -> list:
+        """
+        Takes every result delivered so far, without blocking. Results of stale jobs are dropped.
+        :return: list of (kind, stage, payload). Failed jobs deliver ("error", exception) as their last stage
+        """
+        ready = []
+        while True:
+            try:
+                kind, generation, stage, payload = self.results.get_nowait()
+            except queue.Empty:
+                return ready
+            if self.is_current(kind, generation):
+                ready.append((kind, stage, payload))
+
+    def _run(self):
+        while True:
+            kind, generation, job, args = self._requests.get()
+            if not self.is_current(kind, generation):
+                continue
+            try:
+                for stage, payload in job(*args):
+                    if not self.is_current(kind, generation):
+                        break
+                    self.results.put((kind, generation, stage, payload))
+            except Exception as e:
+                self.results.put((kind, generation, "error", e))
+
+
+def period_range(period: int, days: catalog.Catalog) -> tuple:
+    """
+    :param period: value of HomePage's time period radio buttons
+    :param days: the catalog of days with data
+    :return: (first day, last day) of the period. "All Time" starts at the first day with data (minute files or
+             retention tiers), whatever gaps there are after it
+    """
+    today = datetime.date.today()
+    if period in PERIOD_DAYS:
+        return today - datetime.timedelta(days=PERIOD_DAYS[period] - 1), today
+    first = days.first()
+    return today if first is None or first > today else first, today
+
+
+_analyzers = {}     # time period -> analyzer.Analyzer, only used on the DataService thread
+_changed = {}       # time period -> days whose files changed since its analyzer last caught up
+_changed_lock = threading.Lock()
+
+
+def days_changed(days: set):
+    """
+    Catalog subscriber (see catalog.Catalog.subscribe()): the analyzers forget what they read of these days.
+    """
+    with _changed_lock:
+        for period in list(PERIOD_DAYS) + [4]:
+            _changed.setdefault(period, set()).update(days)
+
+
+def live_analysis(period: int, first: datetime.date, today: datetime.date) -> dict:
+    """
+    Analysis of a time period that ends today. The period's analyzer is kept (and checkpointed, see analyzer) between
+    calls and only fed the samples written since the last one; it is rebuilt from the summary index (which only
+    re-reads the days that changed) when the period moved to another first day, a file was rewritten or a day it had
+    already gone past changed (see days_changed()).
+    :return: see reader.analyse()
+    """
+    path = analyzer.checkpoint_path("period_{}".format(period))
+    live = _analyzers.get(period) or analyzer.Analyzer.load(path)
+    with _changed_lock:
+        changed = _changed.pop(period, set())
+    try:
+        if live is None or live.origin != first or live.day > today or any(first <= d < live.day for d in changed):
+            raise analyzer.StateLost(path)
+        live.catch_up(today)
+    except analyzer.StateLost:
+        live = analyzer.Analyzer.seeded(first, today)
+        live.catch_up(today)
+    _analyzers[period] = live
+    try:
+        live.save(path)
+    except OSError as e:
+        print("Could not checkpoint the analysis: {}".format(e))
+    return live.result(today)
+
+
+def outages_job(period: int, days: catalog.Catalog):
+    """
+    Yields ("summary", analysis without "outages") first and then ("outages", list of str) for a time period.
+    """
+    first, last = period_range(period, days)
+    analysis = live_analysis(period, first, last)
+    outages = analysis.pop("outages")
+    yield "summary", analysis
+    yield "outages", reader.outage_times(outages, datetime.datetime.combine(first, datetime.time()))
+
+
+def heatmap_job(days: int, changed: frozenset = frozenset(), previous: tuple = None):
+    """
+    Yields ("heatmap", (matrix, first day, pyramid, changed)) for the last 'days' days.
+    :param changed: (frozenset, default = empty) days whose files changed since previous was built, handed back so the
+                    caller knows which changes the result covers
+    :param previous: (tuple, default = None) (matrix, first day, pyramid) of an earlier result. When it still starts on
+                     the same day, only the rows of the changed days are rebuilt (see heatmap.update_days()), otherwise
+                     (or without one) the whole matrix is
+    """
+    today = datetime.date.today()
+    first = today - datetime.timedelta(days=days - 1)
+    if previous is not None and previous[1] == first:
+        matrix, levels = heatmap.update_days(previous[0], previous[2], first, changed)
+    else:
+        matrix = heatmap.status_matrix(first, today)
+        levels = heatmap.pyramid(matrix)
+    yield "heatmap", (matrix, first, levels, changed)
+
+
+STOP_REPEAT = 1     # seconds between the two signals of stop_collector_job()
+
+
+def _hang_up(pid: int):
+    try:
+        os.kill(pid, 1)
+    except ProcessLookupError:
+        pass
+
+
+def stop_collector_job(pid: int, supervisor: int = None):
+    """
+    Stops the collector without its control socket: its supervisor first (see data_collector.supervise()), which
+    would otherwise take the collector's death for a crash and start it again, then the collector, with SIGHUP
+    twice, STOP_REPEAT seconds apart. The second signal is sent from a timer, so the worker isn't held up. Yields
+    ("stopped", pid) once the first one is sent.
+    :param supervisor: (int, default = None) PID of the collector's supervisor, None if it has none
+    """
+    if supervisor is not None:
+        try:
+            os.kill(supervisor, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    _hang_up(pid)
+    repeat = threading.Timer(STOP_REPEAT, _hang_up, (pid,))
+    repeat.daemon = True
+    repeat.start()
+    yield "stopped", pid
@@ -0,0 +1,105 @@
+"""
+Writes synthetic .trck histories for benchmarks and manual testing: days to years of samples, with outages (short
+oscillations and longer ones), outages crossing midnight, and gaps where the collector wasn't running.
+    python generate_history.py DD/MM/YYYY DAYS [--slots] [--seed N]
+"""
+
+import os
+import sys
+import datetime
+import numpy as np
+import reader
+import slots
+import trck
+
+
+def generate(first, days: int, step: int = 1, outages_per_day: float = 2.0, oscillation_share: float = 0.6,
+             midnight_rate: float = 0.1, gaps_per_day: float = 0.2, download: float = 50000.0,
+             upload: float = 10000.0, ping: float = 20.0, with_slots: bool = False, seed: int = None) -> np.ndarray:
+    """
+    Writes a history into slots.DATA_DIR, overwriting the files of the days it covers.
+    :param first: the first day (see reader.to_date())
+    :param days: number of days
+    :param step: (int, default = 1) one sample every 'step' minutes
+    :param outages_per_day: (float, default = 2.0) average number of outages a day
+    :param oscillation_share: (float, default = 0.6) share of the outages that last OSCILLATION_MINUTES or less
+    :param midnight_rate: (float, default = 0.1) chance of each midnight having an outage across it
+    :param gaps_per_day: (float, default = 0.2) average number of times a day the collector stops, for up to 4 hours
+    :param download: (float, default = 50000.0) average download speed, KiloBits per second
+    :param upload: (float, default = 10000.0) average upload speed, KiloBits per second
+    :param ping: (float, default = 20.0) average latency, MilliSeconds
+    :param with_slots: (bool, default = False) also writes the .slot files
+    :param seed: (int, default = None) seed of the random generator
+    :return: array of slots statuses, one per minute of the whole history, as it was written (minutes between samples
+             and gaps are UNKNOWN)
+    """
+    first = reader.to_date(first)
+    rng = np.random.default_rng(seed)
+    total = days * slots.MINUTES_PER_DAY
+
+    offline = np.zeros(total, dtype=bool)
+    count = rng.poisson(outages_per_day * days)
+    short = rng.random(count) < oscillation_share
+    lengths = np.where(short, rng.integers(1, reader.OSCILLATION_MINUTES + 1, count),
+                       rng.integers(reader.OSCILLATION_MINUTES + 1, 6 * 60, count))
+    starts = rng.integers(0, total, count)
+    midnights = np.flatnonzero(rng.random(days - 1) < midnight_rate) + 1
+    starts = np.concatenate([starts, midnights * slots.MINUTES_PER_DAY - rng.integers(5, 90, len(midnights))])
+    lengths = np.concatenate([lengths, rng.integers(95, 180, len(midnights))])
+    for start, length in zip(starts, lengths):
+        offline[start:start + length] = True
+
+    sampled = np.zeros(total, dtype=bool)
+    sampled[::step] = True
+    count = rng.poisson(gaps_per_day * days)
+    for start, length in zip(rng.integers(0, total, count), rng.integers(10, 4 * 60, count)):
+        sampled[start:start + length] = False
+
+    status = np.full(total, slots.UNKNOWN, dtype=np.uint8)
+    status[sampled] = np.where(offline[sampled], slots.OFFLINE, slots.ONLINE)
+    downloads = np.maximum(rng.normal(download, download / 10, total), 1)
+    uploads = np.maximum(rng.normal(upload, upload / 10, total), 1)
+    pings = np.maximum(rng.normal(ping, ping / 4, total), 1).round(3)
+
+    # Like the collector, run numbers start over after every gap
+    run = 0
+    for d in range(days):
+        day = first + datetime.timedelta(days=d)
+        base = d * slots.MINUTES_PER_DAY
+        frames = []
+        for m in range(slots.MINUTES_PER_DAY):
+            minute = base + m
+            if not sampled[minute]:
+                run = 0
+                continue
+            run += 1
+            when = datetime.datetime.combine(day, datetime.time(m // 60, m % 60))
+            if offline[minute]:
+                frames.append(trck.frame(run, when, -1, -1, -1))
+            else:
+                frames.append(trck.frame(run, when, downloads[minute], uploads[minute], pings[minute]))
+        # Compressed files of the day would be stale, and so would everything if the day has no samples
+        stale = trck.paths(day)[1:] if frames else trck.paths(day) + [slots.slot_path(day)]
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+        if not frames:
+            continue
+        with open(trck.path(day), 'wb') as file:
+            file.write(b"".join(frames))
+        if with_slots:
+            slots.write_grid(day, reader.minute_grid(reader.organize(day))[0])
+        elif os.path.exists(slots.slot_path(day)):
+            os.remove(slots.slot_path(day))
+    return status
+
+
+if __name__ == "__main__":
+    arguments = [a for a in sys.argv[1:] if not a.startswith("--")]
+    seed = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else None
+    if seed is not None:
+        arguments.remove(str(seed))
+    os.makedirs(slots.DATA_DIR, exist_ok=True)
+    status = generate(arguments[0], int(arguments[1]), with_slots="--slots" in sys.argv, seed=seed)
+    print("Wrote {} day(s), {} sample(s), {} offline".format(arguments[1], np.count_nonzero(status != slots.UNKNOWN),
+                                                          np.count_nonzero(status == slots.OFFLINE)))
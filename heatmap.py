@@ -0,0 +1,219 @@
+"""
+Raster heatmap of the connection status. A range of days becomes a days x 1440 matrix of slot statuses that is drawn
+with a single imshow(), so the cost of a redraw doesn't depend on how many minutes are shown.
+"""
+
+import datetime
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.colors import BoundaryNorm, ListedColormap, Normalize
+from matplotlib.lines import Line2D
+from matplotlib.ticker import FuncFormatter, MultipleLocator
+import reader
+import retention
+import slots
+
+# Indexed by slot status: UNKNOWN, ONLINE, OFFLINE
+COLORMAP = ListedColormap(["blue", "lime", "r"])
+NORM = BoundaryNorm([-0.5, 0.5, 1.5, 2.5], COLORMAP.N)
+LEGEND = [Line2D([0], [0], marker='o', color='lime', label='Online'),
+          Line2D([0], [0], marker='o', color='r', label='Offline'),
+          Line2D([0], [0], marker='o', color='blue', label='Unknown')]
+
+
+def status_matrix(start, end) -> np.ndarray:
+    """
+    :param start: first day (see reader.to_date())
+    :param end: last day (see reader.to_date())
+    :return: (days, 1440) array of slot statuses, missing days are UNKNOWN. Days compacted into the retention tiers
+             are filled in from their hourly (or else daily) aggregates, with the worst status of each
+    """
+    first = reader.to_date(start)
+    grids, merged = reader.load_range(start, end)
+    matrix = merged["status"].reshape(-1, slots.MINUTES_PER_DAY)
+    for i, grid in enumerate(grids):
+        if grid is not None:
+            continue
+        day = first + datetime.timedelta(days=i)
+        for bucket in (60, slots.MINUTES_PER_DAY):
+            found = retention.records(day, bucket)
+            if found is not None:
+                worst = np.where(found["offline"] > 0, slots.OFFLINE,
+                                 np.where(found["unknown"] > 0, slots.UNKNOWN, slots.ONLINE))
+                matrix[i] = np.repeat(worst, bucket)
+                break
+    return matrix
+
+
+def _clock(value, position) -> str:
+    minute = int(round(value)) % slots.MINUTES_PER_DAY
+    return "{:02d}:{:02d}".format(minute // 60, minute % 60)
+
+
+def draw(ax, matrix: np.ndarray, first: datetime.date):
+    """
+    Draws a status matrix on ax, replacing whatever was there. Days go along x, the time of the day along y.
+    :param ax: matplotlib axes
+    :param matrix: (days, minutes per day) array of slot statuses (see status_matrix())
+    :param first: the day of the first row of matrix
+    :return: the AxesImage
+    """
+    ax.clear()
+    x0 = mdates.date2num(first)
+    image = ax.imshow(matrix.T, cmap=COLORMAP, norm=NORM, aspect='auto', interpolation='nearest', origin='lower',
+                      extent=(x0, x0 + len(matrix), 0, matrix.shape[1]))
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d/%m'))
+    ax.yaxis.set_major_locator(MultipleLocator(120))
+    ax.yaxis.set_major_formatter(FuncFormatter(_clock))
+    ax.legend(handles=LEGEND, loc='upper right')
+    return image
+
+
+# Severity of each slot status (worst wins when minutes are aggregated), and the status of each severity
+SEVERITY = np.zeros(3, dtype=np.uint8)
+SEVERITY[[slots.ONLINE, slots.UNKNOWN, slots.OFFLINE]] = [0, 1, 2]
+STATUS_OF_SEVERITY = np.array([slots.ONLINE, slots.UNKNOWN, slots.OFFLINE], dtype=np.uint8)
+LOSS_COLORMAP = ListedColormap(["lime", "yellowgreen", "yellow", "orange", "r"])
+LOSS_COLORMAP.set_bad("blue")
+
+
+def aggregate(matrix: np.ndarray, day_bucket: int, minute_bucket: int, mode: str = "worst") -> np.ndarray:
+    """
+    Aggregates a status matrix into buckets of day_bucket days x minute_bucket minutes.
+    :param matrix: (days, minutes per day) array of slot statuses
+    :param day_bucket: days per bucket, the last bucket is padded with UNKNOWN days
+    :param minute_bucket: minutes per bucket, must divide the minutes per day
+    :param mode: (str, default = "worst") "worst" gives the worst status of each bucket (offline, then unknown, then
+                 online), "loss" gives the fraction of known minutes that were offline (nan if none were known)
+    :return: (ceil(days / day_bucket), minutes per day / minute_bucket) array
+    """
+    days, minutes = matrix.shape
+    padded = -(-days // day_bucket) * day_bucket
+    if padded != days:
+        matrix = np.concatenate([matrix, np.full((padded - days, minutes), slots.UNKNOWN, dtype=matrix.dtype)])
+    blocks = matrix.reshape(padded // day_bucket, day_bucket, minutes // minute_bucket, minute_bucket)
+    if mode == "worst":
+        return STATUS_OF_SEVERITY[SEVERITY[blocks].max(axis=(1, 3))]
+    offline = (blocks == slots.OFFLINE).sum(axis=(1, 3))
+    known = (blocks != slots.UNKNOWN).sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(known > 0, offline / known, np.nan)
+
+
+DAY_BUCKETS = (1, 2, 7, 30)
+MINUTE_BUCKETS = (1, 2, 5, 15, 60, 180, 1440)
+
+
+def pyramid(matrix: np.ndarray, mode: str = "worst") -> dict:
+    """
+    Precomputes the aggregates of a status matrix for every bucket size ZoomableHeatmap can pick.
+    :param matrix: (days, minutes per day) array of slot statuses
+    :param mode: (str, default = "worst") how buckets are aggregated (see aggregate())
+    :return: dict of (days per bucket, minutes per bucket): aggregate
+    """
+    return {(d, m): aggregate(matrix, d, m, mode) for d in DAY_BUCKETS for m in MINUTE_BUCKETS
+            if d <= max(len(matrix), 1) and matrix.shape[1] % m == 0}
+
+
+def update_days(matrix: np.ndarray, levels: dict, first: datetime.date, days, mode: str = "worst") -> tuple:
+    """
+    Rebuilds the rows of some days in a status matrix and the buckets of its pyramid that cover them, so a day that
+    changed (today's, every minute) doesn't cost a rebuild of the whole history. The arguments aren't modified.
+    :param matrix: (days, minutes per day) array of slot statuses (see status_matrix())
+    :param levels: the matrix's pyramid()
+    :param first: the day of the first row of matrix
+    :param days: the days to rebuild, those outside the matrix are ignored
+    :param mode: (str, default = "worst") how levels' buckets are aggregated (see aggregate())
+    :return: (matrix, levels) with those days rebuilt
+    """
+    rows = sorted({(day - first).days for day in days} & set(range(len(matrix))))
+    if not rows:
+        return matrix, levels
+    matrix = matrix.copy()
+    for row in rows:
+        day = first + datetime.timedelta(days=row)
+        matrix[row] = status_matrix(day, day)[0]
+    levels = dict(levels)
+    for (d, m), level in levels.items():
+        level = levels[(d, m)] = level.copy()
+        for column in sorted({row // d for row in rows}):
+            level[column] = aggregate(matrix[column * d:(column + 1) * d], d, m, mode)[0]
+    return matrix, levels
+
+
+class ZoomableHeatmap:
+    """
+    Heatmap that follows the zoom and pan of its axes. A pyramid of aggregates is built once, and whenever the axis
+    limits change the visible window is cut from the coarsest level that still has about one bucket per pixel, so each
+    zoom step costs the same no matter how much history is loaded.
+    """
+
+    def __init__(self, ax, matrix: np.ndarray, first: datetime.date, mode: str = "worst", levels: dict = None):
+        """
+        :param ax: matplotlib axes, cleared before drawing
+        :param matrix: (days, minutes per day) array of slot statuses (see status_matrix())
+        :param first: the day of the first row of matrix
+        :param mode: (str, default = "worst") how buckets are aggregated (see aggregate())
+        :param levels: (dict, default = None) the matrix's pyramid() if it was already built, e.g. off the UI thread
+        """
+        self.ax = ax
+        self.days = len(matrix)
+        self.minutes = matrix.shape[1]
+        self.x0 = mdates.date2num(first)
+        self.levels = levels if levels is not None else pyramid(matrix, mode)
+        self.level = None
+        self._updating = False
+
+        self.image = draw(ax, matrix if mode == "worst" else self.levels[(1, 1)], first)
+        if mode != "worst":
+            self.image.set_cmap(LOSS_COLORMAP)
+            self.image.set_norm(Normalize(0, 1))
+        ax.set_autoscale_on(False)
+        self._cids = [ax.callbacks.connect('xlim_changed', self._on_limits),
+                      ax.callbacks.connect('ylim_changed', self._on_limits)]
+        self._on_limits(ax)
+
+    def pick_level(self, days: float, minutes: float, width: float, height: float) -> tuple:
+        """
+        :return: (days per bucket, minutes per bucket) of the coarsest level with at least one bucket per pixel
+        """
+        # Short histories have no levels for the widest day buckets
+        day_bucket = max([d for d in DAY_BUCKETS
+                          if d <= max(days / max(width, 1), 1) and (d, 1) in self.levels] or [1])
+        minute_bucket = max([m for m in MINUTE_BUCKETS
+                             if m <= max(minutes / max(height, 1), 1) and (day_bucket, m) in self.levels] or [1])
+        return day_bucket, minute_bucket
+
+    def _on_limits(self, ax):
+        if self._updating:
+            return
+        self._updating = True
+        try:
+            (x_lo, x_hi), (y_lo, y_hi) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+            box = ax.get_window_extent()
+            d, m = self.pick_level(x_hi - x_lo, y_hi - y_lo, box.width, box.height)
+            level = self.levels[(d, m)]
+            # Visible window in buckets of the level, with one bucket of margin so pans don't show empty edges
+            c_lo = int(np.clip(np.floor((x_lo - self.x0) / d) - 1, 0, len(level)))
+            c_hi = int(np.clip(np.ceil((x_hi - self.x0) / d) + 1, c_lo, len(level)))
+            r_lo = int(np.clip(np.floor(y_lo / m) - 1, 0, level.shape[1]))
+            r_hi = int(np.clip(np.ceil(y_hi / m) + 1, r_lo, level.shape[1]))
+            if c_hi > c_lo and r_hi > r_lo:
+                self.image.set_data(level[c_lo:c_hi, r_lo:r_hi].T)
+                self.image.set_extent((self.x0 + c_lo * d, self.x0 + c_hi * d, r_lo * m, r_hi * m))
+                self.level = (d, m)
+        finally:
+            self._updating = False
+
+    def update(self, levels: dict):
+        """
+        Shows new levels of a matrix with the same shape (see update_days()), keeping the current zoom and pan.
+        """
+        self.levels = levels
+        self._on_limits(self.ax)
+
+    def disconnect(self):
+        for cid in self._cids:
+            self.ax.callbacks.disconnect(cid)
+        self._cids = []
@@ -0,0 +1,84 @@
+"""
+The collector's live status: one small fixed-size record (data/collector.status) holding the last sample, when the last
+speedtest succeeded, when the outage going on started, the tick counter and the collector's health. The collector
+replaces the file atomically after every tick, so readers never see half a record and reading it costs the same at
+00:01 as at 23:59, unlike reading the last record of the day's .trck file.
+"""
+
+import datetime
+import os
+import struct
+import time
+import slots
+
+MAGIC = b"ICTL"
+VERSION = 1
+# magic, version, health, status of the last sample, pid, tick, heavy interval, consecutive failed ticks, time
+# published, time of the last sample, of the last successful speedtest and of the current outage's start (0 for none),
+# download, upload, ping of the last sample
+RECORD = struct.Struct("<4sHBBiqfIddddfff")
+HEALTH = ("ok", "speedtest_failed", "offline", "stopped", "paused", "starting")
+STALE_INTERVALS = 3     # a status not published for this many intervals is stale
+
+
+def status_path() -> str:
+    return os.path.join(slots.DATA_DIR, "collector.status")
+
+
+def _stamp(when: datetime.datetime) -> float:
+    return 0.0 if when is None else when.timestamp()
+
+
+def _time(stamp: float) -> datetime.datetime:
+    return None if stamp == 0 else datetime.datetime.fromtimestamp(stamp)
+
+
+def publish(health: str, tick: int, interval: float, failures: int, when: datetime.datetime, status: int,
+            download: float, upload: float, ping: float, last_success: datetime.datetime,
+            outage_start: datetime.datetime, path: str = None):
+    """
+    Replaces the status record.
+    :param health: one of HEALTH, "starting" until the collector's first sample
+    :param tick: the collector's tick counter
+    :param interval: seconds between the collector's ticks
+    :param failures: ticks in a row without a successful speedtest
+    :param when: when the last sample was taken, None if there is none yet
+    :param status: slots status of the last sample
+    :param download: KiloBits per second, -1 without a result
+    :param upload: KiloBits per second, -1 without a result
+    :param ping: MilliSeconds, -1 without a result
+    :param last_success: when the last successful speedtest was taken, None if there was none
+    :param outage_start: when the outage going on started, None if online
+    :param path: (str, default = None) where to publish it, None for status_path()
+    """
+    path = status_path() if path is None else path
+    data = RECORD.pack(MAGIC, VERSION, HEALTH.index(health), status, os.getpid(), tick, interval, failures,
+                       time.time(), _stamp(when), _stamp(last_success), _stamp(outage_start), download, upload, ping)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def read(path: str = None) -> dict:
+    """
+    :param path: (str, default = None) the status file, None for status_path()
+    :return: the status record as a dict, with times as datetime.datetime (None when not set) and "stale" True if the
+             collector hasn't published for STALE_INTERVALS intervals. None if there is no (valid) record
+    """
+    path = status_path() if path is None else path
+    try:
+        with open(path, 'rb') as file:
+            data = file.read(RECORD.size + 1)
+    except FileNotFoundError:
+        return None
+    if len(data) != RECORD.size:
+        return None
+    magic, version, health, status, pid, tick, interval, failures, published, when, last_success, outage_start, \
+        download, upload, ping = RECORD.unpack(data)
+    if magic != MAGIC or version != VERSION or health >= len(HEALTH):
+        return None
+    return {"health": HEALTH[health], "pid": pid, "tick": tick, "interval": interval, "failures": failures,
+            "published": _time(published), "time": _time(when), "status": status, "download": download,
+            "upload": upload, "ping": ping, "last_success": _time(last_success), "outage_start": _time(outage_start),
+            "stale": HEALTH[health] != "stopped" and time.time() - published > STALE_INTERVALS * interval}
@@ -0,0 +1,154 @@
+"""
+Self-instrumentation of the collector. Every tick records how long each of its phases took, how late it started and
+what the collector itself costs (CPU time, RSS). Ticks are appended to the day's metrics log
+(data/DD_MM_YYYY.metrics, one JSON object per line), and histograms kept in memory are written out after every tick in
+the Prometheus text format, for node_exporter's textfile collector.
+"""
+
+import bisect
+import datetime
+import json
+import os
+import threading
+import psutil
+import slots
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)     # seconds
+PREFIX = "ict_collector"
+
+
+class Histogram:
+    """
+    Cumulative histogram, as Prometheus has them: counts[i] is the number of observations <= buckets[i], and the last
+    count (the "+Inf" bucket) is the number of observations.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return self.counts[-1]
+
+    def observe(self, value: float):
+        for i in range(bisect.bisect_left(self.buckets, value), len(self.counts)):
+            self.counts[i] += 1
+        self.sum += value
+
+    def exposition(self, name: str, labels: str = "") -> list:
+        """
+        :return: the histogram's lines in the Prometheus text format, without HELP and TYPE
+        """
+        separator = "," if labels else ""
+        lines = ['{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, separator, bound, count)
+                 for bound, count in zip([repr(float(b)) for b in self.buckets] + ["+Inf"], self.counts)]
+        braces = "{{{}}}".format(labels) if labels else ""
+        lines.append("{}_sum{} {!r}".format(name, braces, self.sum))
+        lines.append("{}_count{} {}".format(name, braces, self.count))
+        return lines
+
+
+def log_path(day: datetime.date) -> str:
+    return os.path.join(slots.DATA_DIR, "{}.metrics".format(day.strftime("%d_%m_%Y")))
+
+
+def prom_path() -> str:
+    return os.path.join(slots.DATA_DIR, "collector.prom")
+
+
+class MetricsSink:
+
+    def __init__(self, prom_file: str = None, write_log: bool = True):
+        """
+        :param prom_file: (str, default = None) where to write the Prometheus textfile, None writes prom_path().
+                          Point it at node_exporter's --collector.textfile.directory to have it scraped
+        :param write_log: (bool, default = True) append every tick to the day's metrics log
+        """
+        self.prom_file = prom_file
+        self.write_log = write_log
+        self.process = psutil.Process()
+        self.phases = {}
+        self.duration = Histogram()
+        self.lag = Histogram()
+        self.outcomes = {}
+        self.last = None
+        self._lock = threading.Lock()
+
+    def resources(self) -> tuple:
+        """
+        :return: (CPU seconds used by the process so far, user and system, resident set size in bytes)
+        """
+        cpu = self.process.cpu_times()
+        return cpu.user + cpu.system, self.process.memory_info().rss
+
+    def record(self, tick: int, when: datetime.datetime, lag: float, duration: float, phases: dict, outcome: str):
+        """
+        Records a tick: updates the histograms, logs it and rewrites the Prometheus textfile.
+        :param tick: the tick's number
+        :param when: when the tick started
+        :param lag: seconds the tick started late
+        :param duration: seconds the whole tick took
+        :param phases: seconds each phase took, by phase name
+        :param outcome: how the tick ended, e.g. "ok" or "offline"
+        """
+        cpu, rss = self.resources()
+        with self._lock:
+            for phase, seconds in phases.items():
+                self.phases.setdefault(phase, Histogram()).observe(seconds)
+            self.duration.observe(duration)
+            self.lag.observe(lag)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.last = {"tick": tick, "time": when.isoformat(timespec="seconds"), "lag": round(lag, 6),
+                         "duration": round(duration, 6), "phases": {k: round(v, 6) for k, v in phases.items()},
+                         "outcome": outcome, "cpu": round(cpu, 3), "rss": rss}
+            if self.write_log:
+                try:
+                    with open(log_path(when.date()), 'a') as file:
+                        print(json.dumps(self.last), file=file)
+                except OSError as e:
+                    print("Could not write the metrics log: {}".format(e))
+            try:
+                self.write_prom(when)
+            except OSError as e:
+                print("Could not write the metrics textfile: {}".format(e))
+
+    def exposition(self, when: datetime.datetime) -> str:
+        """
+        :return: every metric in the Prometheus text format
+        """
+        lines = ["# HELP {}_phase_seconds Duration of each phase of a tick.".format(PREFIX),
+                 "# TYPE {}_phase_seconds histogram".format(PREFIX)]
+        for phase in sorted(self.phases):
+            lines += self.phases[phase].exposition(PREFIX + "_phase_seconds", 'phase="{}"'.format(phase))
+        for name, histogram, description in (("tick_seconds", self.duration, "Duration of a whole tick."),
+                                             ("tick_lag_seconds", self.lag, "How late ticks started.")):
+            lines += ["# HELP {}_{} {}".format(PREFIX, name, description),
+                      "# TYPE {}_{} histogram".format(PREFIX, name)]
+            lines += histogram.exposition("{}_{}".format(PREFIX, name))
+        lines += ["# HELP {}_ticks_total Ticks, by outcome.".format(PREFIX),
+                  "# TYPE {}_ticks_total counter".format(PREFIX)]
+        lines += ['{}_ticks_total{{outcome="{}"}} {}'.format(PREFIX, outcome, count)
+                  for outcome, count in sorted(self.outcomes.items())]
+        if self.last is not None:
+            lines += ["# HELP {}_cpu_seconds_total CPU time used by the collector.".format(PREFIX),
+                      "# TYPE {}_cpu_seconds_total counter".format(PREFIX),
+                      "{}_cpu_seconds_total {!r}".format(PREFIX, self.last["cpu"]),
+                      "# HELP {}_resident_memory_bytes Resident set size of the collector.".format(PREFIX),
+                      "# TYPE {}_resident_memory_bytes gauge".format(PREFIX),
+                      "{}_resident_memory_bytes {}".format(PREFIX, self.last["rss"]),
+                      "# HELP {}_last_tick_timestamp_seconds When the last tick started.".format(PREFIX),
+                      "# TYPE {}_last_tick_timestamp_seconds gauge".format(PREFIX),
+                      "{}_last_tick_timestamp_seconds {!r}".format(PREFIX, round(when.timestamp(), 3))]
+        return "\n".join(lines) + "\n"
+
+    def write_prom(self, when: datetime.datetime):
+        """
+        Replaces the textfile atomically, so the scraper never reads half of it.
+        """
+        path = self.prom_file or prom_path()
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, 'w') as file:
+            file.write(self.exposition(when))
+        os.replace(temporary, path)
@@ -0,0 +1,259 @@
+"""
+Pluggable connectivity probes. Light probes (TCP connect, DNS resolve, HTTP HEAD) cost a round trip and can run every
+few seconds; the heavy probe is the full speedtest. Every result of both tiers is appended to the day's probe log
+(data/DD_MM_YYYY.probes) with its probe type, so outages can be resolved to the second.
+"""
+
+import collections
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait
+import http.client
+import os
+import socket
+import statistics
+import threading
+import time
+import urllib.parse
+import slots
+
+LIGHT = "light"
+HEAVY = "heavy"
+
+Result = collections.namedtuple("Result", "when probe target ok latency download upload")
+
+
+class Probe:
+    """
+    Base of all probes. Subclasses set 'kind' and implement measure().
+    """
+
+    kind = None
+    tier = LIGHT
+
+    def __init__(self, target: str, timeout: float = 2.0):
+        """
+        :param target: what to probe, the format depends on the probe
+        :param timeout: (float, default = 2.0) seconds before the probe counts as failed
+        """
+        self.target = target
+        self.timeout = timeout
+
+    def measure(self) -> tuple:
+        """
+        :return: (download, upload) as KiloBits per second, None for probes that don't measure them
+        :raises: anything, on failure
+        """
+        raise NotImplementedError
+
+    def run(self) -> Result:
+        """
+        Runs the probe once. Never raises, failures give a Result with ok = False.
+        """
+        when = datetime.datetime.now()
+        start = time.perf_counter()
+        try:
+            download, upload = self.measure()
+        except Exception:
+            return Result(when, self.kind, self.target, False, None, None, None)
+        return Result(when, self.kind, self.target, True, (time.perf_counter() - start) * 1000, download, upload)
+
+    def __repr__(self):
+        return "{}({!r})".format(type(self).__name__, self.target)
+
+
+class TcpProbe(Probe):
+    """
+    Opens a TCP connection to "host:port".
+    """
+
+    kind = "tcp"
+
+    def measure(self) -> tuple:
+        host, port = self.target.rsplit(':', 1)
+        socket.create_connection((host.strip("[]"), int(port)), timeout=self.timeout).close()
+        return None, None
+
+
+class DnsProbe(Probe):
+    """
+    Resolves a host name. getaddrinfo() has no timeout of its own, so it runs in a daemon thread.
+    """
+
+    kind = "dns"
+
+    def measure(self) -> tuple:
+        outcome = []
+
+        def resolve():
+            try:
+                outcome.append(socket.getaddrinfo(self.target, None))
+            except Exception as e:
+                outcome.append(e)
+
+        worker = threading.Thread(target=resolve, daemon=True)
+        worker.start()
+        worker.join(self.timeout)
+        if not outcome:
+            raise TimeoutError("resolving {} timed out".format(self.target))
+        if isinstance(outcome[0], Exception):
+            raise outcome[0]
+        return None, None
+
+
+class HttpHeadProbe(Probe):
+    """
+    Sends a HEAD request to a http:// or https:// URL. Any response below 500 counts as online.
+    """
+
+    kind = "http"
+
+    def measure(self) -> tuple:
+        url = urllib.parse.urlsplit(self.target)
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(url.netloc, timeout=self.timeout)
+        try:
+            connection.request("HEAD", url.path or "/")
+            status = connection.getresponse().status
+        finally:
+            connection.close()
+        if status >= 500:
+            raise ConnectionError("{} answered {}".format(self.target, status))
+        return None, None
+
+
+class SpeedtestProbe(Probe):
+    """
+    The heavy tier: a full speedtest, through a function returning (download, upload, ping) like data_collector.test().
+    """
+
+    kind = "speedtest"
+    tier = HEAVY
+
+    def __init__(self, test, target: str = "speedtest.net", timeout: float = None):
+        super().__init__(target, timeout)
+        self.test = test
+        self.ping = None
+
+    def measure(self) -> tuple:
+        d, u, p = self.test()
+        self.ping = p
+        return d / 1024, u / 1024
+
+    def run(self) -> Result:
+        result = super().run()
+        # The speedtest's own ping is what .trck files store as latency
+        return result._replace(latency=self.ping) if result.ok else result
+
+
+MAX_WORKERS = 16
+FAN_OUT_GRACE = 0.5     # seconds fan_out() waits past the longest probe timeout before giving up on stragglers
+# Shared by the light and heavy tiers; its threads are only started as probes are submitted
+_pool = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="probe")
+
+
+def fan_out(probe_list: list) -> list:
+    """
+    Runs probes concurrently on a bounded thread pool, so a round takes as long as its slowest probe instead of the sum
+    of all of them. Probes still running past the longest timeout (plus FAN_OUT_GRACE) count as failed.
+    :param probe_list: list of Probe
+    :return: list of Result, one per probe, in the same order
+    """
+    when = datetime.datetime.now()
+    futures = [_pool.submit(p.run) for p in probe_list]
+    timeouts = [p.timeout for p in probe_list if p.timeout is not None]
+    deadline = max(timeouts) + FAN_OUT_GRACE if timeouts and len(timeouts) == len(probe_list) else None
+    done = wait(futures, timeout=deadline).done
+    return [f.result() if f in done else Result(when, p.kind, p.target, False, None, None, None)
+            for f, p in zip(futures, probe_list)]
+
+
+def verdict(results: list, quorum: int = 1) -> bool:
+    """
+    Overall online verdict of a round: a single dead target is a bad server, all of them failing is an outage.
+    :param results: list of Result
+    :param quorum: (int, default = 1) targets that must answer for the connection to count as online
+    :return: True if online
+    """
+    return sum(r.ok for r in results) >= quorum
+
+
+def minute_verdict(rounds: list) -> tuple:
+    """
+    Sums up the rounds of light probes run during a minute.
+    :param rounds: list of rounds, each a list of Result as returned by fan_out()
+    :return: (online, targets): online is True unless most rounds found the connection down (see verdict()), targets is
+             a list of (probe kind, target, median latency of its answers, None if it never answered)
+    """
+    online = 2 * sum(verdict(results) for results in rounds) >= len(rounds)
+    latencies = collections.OrderedDict()
+    for results in rounds:
+        for r in results:
+            latencies.setdefault((r.probe, r.target), [])
+            if r.ok:
+                latencies[(r.probe, r.target)].append(r.latency)
+    return online, [(kind, target, statistics.median(found) if found else None)
+                    for (kind, target), found in latencies.items()]
+
+
+PROBE_TYPES = {"tcp": TcpProbe, "dns": DnsProbe, "http": HttpHeadProbe, "https": HttpHeadProbe}
+
+
+def from_config(targets: list, timeout: float = 2.0) -> list:
+    """
+    Builds light probes from target strings: "tcp:host:port", "dns:name", or a http:// or https:// URL.
+    :param targets: list of str
+    :param timeout: (float, default = 2.0) timeout of every probe
+    :return: list of Probe
+    """
+    probes = []
+    for target in targets:
+        kind, rest = target.split(':', 1)
+        if kind not in PROBE_TYPES:
+            raise ValueError("Unknown probe type in {!r}".format(target))
+        probes.append(PROBE_TYPES[kind](target if kind.startswith("http") else rest, timeout))
+    return probes
+
+
+def log_path(day: datetime.date) -> str:
+    return os.path.join(slots.DATA_DIR, "{}.probes".format(day.strftime("%d_%m_%Y")))
+
+
+_log_lock = threading.Lock()
+
+
+def log(results: list):
+    """
+    Appends results to the probe logs of their days, one line each:
+    time,probe type,target,ok,latency (ms),download (Kb/s),upload (Kb/s). Missing values are left empty.
+    """
+    days = {}
+    for result in results:
+        days.setdefault(result.when.date(), []).append(result)
+    with _log_lock:
+        for day, found in days.items():
+            with open(log_path(day), 'a') as file:
+                for result in found:
+                    print(",".join([result.when.strftime("%H:%M:%S.%f"), result.probe,
+                                    result.target.replace(',', '%2C'), "1" if result.ok else "0"] +
+                                   ["" if v is None else "{:.2f}".format(v)
+                                    for v in (result.latency, result.download, result.upload)]), file=file)
+
+
+def read_log(date) -> list:
+    """
+    :param date: the day to read, as a datetime.date
+    :return: list of Result, in the order they were logged. Truncated lines are skipped
+    """
+    results = []
+    with open(log_path(date), 'r') as file:
+        for line in file:
+            fields = line.rstrip('\n').split(',')
+            if len(fields) != 7:
+                continue
+            try:
+                when = datetime.datetime.combine(date, datetime.datetime.strptime(fields[0], "%H:%M:%S.%f").time())
+                values = [float(v) if v else None for v in fields[4:]]
+            except ValueError:
+                continue
+            results.append(Result(when, fields[1], fields[2].replace('%2C', ','), fields[3] == "1", *values))
+    return results
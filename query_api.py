@@ -0,0 +1,332 @@
+"""
+Headless HTTP/JSON query service over the tracking data, for dashboards and monitoring that poll it instead of parsing
+.trck files themselves. It only listens on localhost.
+    python query_api.py [port]
+
+Endpoints (dates are YYYY-MM-DD or DD/MM/YYYY, "end" defaults to today and "start" to "end"):
+    /status                          the latest known minute
+    /summary?start=&end=             totals of a range (see reader.get_analysis())
+    /outages?start=&end=             outages of a range, outages crossing midnight are joined
+    /quantiles?start=&end=&q=        quantiles of the speeds and latency of a range, q as e.g. "0.05,0.5,0.95" (p50, p95
+                                     and p99 by default), from the per-day sketches of summary_index
+    /series?start=&end=&step=        minute series, in buckets of 'step' minutes (or 'points' buckets at most):
+                                     the worst status of each bucket and the average speeds and latency of its online
+                                     minutes, answered from the coarsest retention tier that can (see
+                                     reader.series()). Streamed, with chunked transfer encoding
+
+Results are cached, keyed on the identity (path, mtime, size) of every day file they were built from, so they are
+rebuilt when the collector writes to a day and served from memory otherwise. The identity also makes the ETag, and
+requests with a matching If-None-Match get a 304 without touching the data.
+"""
+
+import collections
+import datetime
+import hashlib
+import http.server
+import json
+import sys
+import threading
+import urllib.parse
+import numpy as np
+import reader
+import sketch
+import slots
+import summary_index
+
+PORT = 8765
+CACHE_ENTRIES = 64
+SERIES_CHUNK = 2048     # points per chunk of a streamed series
+STATUS_NAMES = {slots.UNKNOWN: "unknown", slots.ONLINE: "online", slots.OFFLINE: "offline"}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def parse_date(value: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return reader.to_date(value)
+    except ValueError:
+        raise BadRequest("Bad date: {!r}".format(value))
+
+
+def date_range(params: dict) -> tuple:
+    """
+    :return: (first, last) day of a request's "start" and "end"
+    """
+    last = parse_date(params["end"]) if "end" in params else datetime.date.today()
+    first = parse_date(params["start"]) if "start" in params else last
+    if first > last:
+        raise BadRequest("start is after end")
+    return first, last
+
+
+def identities(first: datetime.date, last: datetime.date) -> tuple:
+    return tuple(reader.cache.identity(first + datetime.timedelta(days=d)) for d in range((last - first).days + 1))
+
+
+def timestamp(first: datetime.date, minute: int) -> str:
+    return (datetime.datetime.combine(first, datetime.time()) + datetime.timedelta(minutes=int(minute))).isoformat(
+        timespec="minutes")
+
+
+def status(params: dict) -> tuple:
+    """
+    :return: (key the result depends on, function building it)
+    """
+    today = datetime.date.today()
+    yesterday = today - datetime.timedelta(days=1)
+
+    def build():
+        for day in (today, yesterday):
+            try:
+                grid = reader.cache.grid(day)
+            except FileNotFoundError:
+                continue
+            known = np.flatnonzero(grid["status"] != slots.UNKNOWN)
+            if len(known):
+                m = known[-1]
+                return {"time": timestamp(day, m), "status": STATUS_NAMES[int(grid["status"][m])],
+                        "run": int(grid["run"][m]), "download": float(grid["download"][m]),
+                        "upload": float(grid["upload"][m]), "ping": float(grid["ping"][m])}
+        return {"time": None, "status": "unknown"}
+
+    return identities(yesterday, today), build
+
+
+def summary(params: dict) -> tuple:
+    first, last = date_range(params)
+
+    def build():
+        analysis = summary_index.summary(first, last)
+        del analysis["outages"]
+        return dict(analysis, start=first.isoformat(), end=last.isoformat())
+
+    return identities(first, last), build
+
+
+def outages(params: dict) -> tuple:
+    first, last = date_range(params)
+
+    def build():
+        found = summary_index.summary(first, last)["outages"]
+        return {"start": first.isoformat(), "end": last.isoformat(),
+                "outages": [{"start": timestamp(first, o["start"]),
+                             "end": None if o["ongoing"] else timestamp(first, o["end"]),
+                             "duration": int(o["duration"]), "oscillation": bool(o["oscillation"]),
+                             "ongoing": bool(o["ongoing"])} for o in found]}
+
+    return identities(first, last), build
+
+
+def quantiles(params: dict) -> tuple:
+    first, last = date_range(params)
+    try:
+        qs = tuple(float(q) for q in params["q"].split(",")) if "q" in params else sketch.QUANTILES
+    except ValueError:
+        raise BadRequest("q must be a list of numbers")
+    if not all(0 <= q <= 1 for q in qs):
+        raise BadRequest("quantiles must be between 0 and 1")
+
+    def build():
+        found = summary_index.quantiles(first, last, qs)
+        # JSON has no nan
+        return dict({metric: {str(q): None if np.isnan(v) else round(v, 2) for q, v in found[metric].items()}
+                     for metric in sketch.METRICS}, samples=found["samples"], start=first.isoformat(),
+                    end=last.isoformat())
+
+    return identities(first, last) + (qs,), build
+
+
+def series(params: dict) -> tuple:
+    first, last = date_range(params)
+    minutes = ((last - first).days + 1) * slots.MINUTES_PER_DAY
+    try:
+        step = int(params["step"]) if "step" in params else \
+            -(-minutes // int(params["points"])) if "points" in params else 1
+    except ValueError:
+        raise BadRequest("step and points must be integers")
+    if step < 1:
+        raise BadRequest("step and points must be positive")
+
+    def build():
+        buckets, exact = reader.series(first, last, step)
+        return {"start": first.isoformat(), "end": last.isoformat(), "step": step, "exact": exact, "series": buckets}
+
+    return identities(first, last) + (step,), build
+
+
+def stream_series(result: dict):
+    """
+    Yields the JSON of a series, in chunks of SERIES_CHUNK points: {"start", "end", "step", "exact", "fields",
+    "points"}, with each point as [time, status, download, upload, ping, online minutes, offline minutes]. The status is
+    the worst of the bucket (offline, then unknown, then online), speeds and latency are averages over its online
+    minutes (null without any). "exact" is false when compacted days couldn't be answered at that step (see
+    reader.series())
+    """
+    first = datetime.date.fromisoformat(result["start"])
+    data = result["series"]
+    status = np.where(data["offline"] > 0, slots.OFFLINE, np.where(data["unknown"] > 0, slots.UNKNOWN, slots.ONLINE))
+    yield '{{"start": "{}", "end": "{}", "step": {}, "exact": {}, "fields": ["time", "status", "download", "upload", ' \
+          '"ping", "online", "offline"], "points": ['.format(result["start"], result["end"], result["step"],
+                                                             json.dumps(result["exact"]))
+    for chunk in range(0, len(data), SERIES_CHUNK):
+        points = []
+        for i in range(chunk, min(chunk + SERIES_CHUNK, len(data))):
+            values = ["null" if np.isnan(data[f][i]) else "{:.2f}".format(data[f][i])
+                      for f in ("download_mean", "upload_mean", "ping_mean")]
+            points.append('["{}", "{}", {}, {}, {}]'.format(timestamp(first, i * result["step"]),
+                                                            STATUS_NAMES[int(status[i])], ", ".join(values),
+                                                            data["online"][i], data["offline"][i]))
+        yield (", " if chunk else "") + ", ".join(points)
+    yield "]}"
+
+
+ENDPOINTS = {"/status": status, "/summary": summary, "/outages": outages, "/quantiles": quantiles, "/series": series}
+
+
+class ResultCache:
+    """
+    LRU cache of built results, each stored with the key it depends on. A result whose key changed (a day file was
+    written) is rebuilt on its next request. Results are built outside the cache's lock, so hits are answered while
+    another result is being built, and concurrent requests for a result that is being built wait for that build instead
+    of starting their own.
+    """
+
+    def __init__(self, entries: int = CACHE_ENTRIES):
+        self.entries = entries
+        self.hits = 0
+        self.misses = 0
+        self._results = collections.OrderedDict()     # (path, query) -> (key, result)
+        self._building = {}                           # (path, query) -> Event set when its build is over
+        self._lock = threading.Lock()
+        # reader's cache isn't thread-safe, so results are built one at a time
+        self._build_lock = threading.Lock()
+
+    def get(self, request: tuple, key: tuple, build):
+        while True:
+            with self._lock:
+                cached = self._results.get(request)
+                if cached is not None and cached[0] == key:
+                    self._results.move_to_end(request)
+                    self.hits += 1
+                    return cached[1]
+                building = self._building.get(request)
+                if building is None:
+                    self.misses += 1
+                    building = self._building[request] = threading.Event()
+                    break
+            # another request is building it, its result is looked at again once it's over (it may have been built
+            # from another key, or have failed)
+            building.wait()
+
+        try:
+            with self._build_lock:
+                result = build()
+        except BaseException:
+            with self._lock:
+                del self._building[request]
+            building.set()
+            raise
+        with self._lock:
+            del self._building[request]
+            self._results[request] = (key, result)
+            self._results.move_to_end(request)
+            while len(self._results) > self.entries:
+                self._results.popitem(last=False)
+        building.set()
+        return result
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        endpoint = ENDPOINTS.get(url.path.rstrip('/') or '/')
+        if endpoint is None:
+            self._json(404, {"error": "Unknown endpoint, try one of {}".format(sorted(ENDPOINTS))})
+            return
+        try:
+            key, build = endpoint(params)
+            etag = '"{}"'.format(hashlib.sha1(repr((url.path, sorted(params.items()), key)).encode()).hexdigest())
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            result = self.server.results.get((url.path, tuple(sorted(params.items()))), key, build)
+        except BadRequest as e:
+            self._json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._json(500, {"error": "{}: {}".format(type(e).__name__, e)})
+            return
+
+        if endpoint is series:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in stream_series(result):
+                data = chunk.encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._json(200, result, etag)
+
+    def _json(self, code: int, body: dict, etag: str = None):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryServer:
+    """
+    The query service, serving on a background thread. Port 0 picks a free port.
+    """
+
+    def __init__(self, port: int = PORT, host: str = "127.0.0.1"):
+        self.server = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.results = ResultCache()
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name="QueryServer", daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}/".format(self.port)
+
+    @property
+    def results(self) -> ResultCache:
+        return self.server.results
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    query_server = QueryServer(int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
+    print("Serving the tracking data on {}".format(query_server.url))
+    try:
+        query_server.thread.join()
+    except KeyboardInterrupt:
+        query_server.close()
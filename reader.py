@@ -1,67 +1,472 @@
+import collections
 import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from matplotlib import pyplot as plt
 from matplotlib.lines import Line2D
+import live
+import sketch
+import slots
+import trck
+import retention
+
+
+def to_date(date) -> datetime.date:
+    """
+    :param date: a datetime.date/datetime.datetime, or a string as %d/%m/%Y
+    :return: the datetime.date it refers to
+    """
+    if isinstance(date, datetime.datetime):
+        return date.date()
+    if isinstance(date, datetime.date):
+        return date
+    return datetime.datetime.strptime(date, "%d/%m/%Y").date()
+
+
+def trck_path(day: datetime.date) -> str:
+    """
+    :param day: the day whose file is wanted
+    :return: path to the day's .trck file
+    """
+    return trck.path(day)
 
 
 def organize(date: str) -> list:
     """
-    Organizes a .trck file into a list of lists. The first dimension refers to each minute, the second dimension refers
+    Organizes a .trck file (plain or compressed) into a list of lists. Torn or corrupt records are skipped (see
+    trck.parse()). The first dimension refers to each minute, the second dimension refers
     to each information: [[run's #: int, date and time as '%d/%m %H:%M': str,
                            download speed as KiloBits per second: float,
                            upload speed as KiloBits per second: float,
                            latency as MilliSeconds: float]]
-    :param date: strftime as %d/%m/%Y
+    Records of ticks that ran light probes have a sixth item, {(probe kind, target): latency or None}. A download of
+    slots.NO_SPEEDTEST is a minute the light probes found online without a speedtest (see slots.status_of()).
+    :param date: strftime as %d/%m/%Y (or anything to_date() takes). If the day only has a .slot file, the list is
+                 rebuilt from it
     :return: list (see desc)
     """
-    organized = []
-    level = 0
-    with open("data/{}.trck".format(datetime.datetime.strptime(date, "%d/%m/%Y").strftime("%d_%m_%Y")), 'r') as file:
-        lines = file.readlines()
-        lin = []
-        for line in lines:
-            if level == 0:
-                try:
-                    lin.append(int(line.strip(':\n')))
-                except:
-                    pass
-            elif level == 1:
-                lin.append(line.strip('\n'))
-            elif level == 2:
-                lin.append(float(line.strip('\n')))
-            elif level == 3:
-                lin.append(float(line.strip('\n')))
-            elif level == 4:
-                lin.append(float(line.strip('\n')))
-                organized.append(lin)
-                lin = []
-                level = -1
-            level += 1
-
-    return organized
+    day = to_date(date)
+    if trck.find(day) is None:
+        grid = slots.read_day(day)
+        if grid is not None:
+            return rows_from_grid(day, grid)
+
+    with trck.open_day(day) as file:
+        return trck.parse(file.readlines())[0]
+
+
+def rows_from_grid(day: datetime.date, grid: np.ndarray) -> list:
+    """
+    Turns a minute grid back into the list format returned by organize(). Unknown minutes are left out.
+    :param day: the day the grid belongs to
+    :param grid: array of slots.RECORD, one per minute
+    :return: list (see organize())
+    """
+    prefix = day.strftime("%d/%m/%Y")
+    return [[int(grid["run"][m]), "{} {:02d}:{:02d}".format(prefix, m // 60, m % 60),
+             round(float(grid["download"][m]), 2), round(float(grid["upload"][m]), 2), float(grid["ping"][m])]
+            for m in np.flatnonzero(grid["status"] != slots.UNKNOWN)]
+
+
+def minute_of(stamp: str) -> int:
+    """
+    Minute of the day of a '%d/%m/%Y %H:%M' timestamp, using plain integer arithmetic instead of strptime.
+    :param stamp: timestamp as stored in .trck files
+    :return: hour * 60 + minute
+    """
+    # 528 == ord('0') * 11, which takes the ASCII offset off both digits of each field at once
+    return (ord(stamp[11]) * 10 + ord(stamp[12]) - 528) * 60 + ord(stamp[14]) * 10 + ord(stamp[15]) - 528
+
+
+def minute_grid(tracking: list) -> tuple:
+    """
+    Places an organized list into a dense minute grid in a single pass. Rows that don't belong to the day of the first
+    row are ignored, and if a minute has more than one row, the last one wins.
+    :param tracking: a .trck file witch has passed through organize()
+    :return: (grid, unknown): grid is an array of slots.RECORD indexed by minute of the day, unknown is a boolean array
+             that is True for the minutes without a row
+    """
+    grid = slots.empty_grid()
+    if tracking:
+        prefix = tracking[0][1][:10]
+        rows = [line for line in tracking if line[1].startswith(prefix)]
+        minutes = np.fromiter((minute_of(line[1]) for line in rows), dtype=np.intp, count=len(rows))
+        values = np.array([line[:1] + line[2:5] for line in rows], dtype=np.float64).reshape(-1, 4)
+        grid["run"][minutes] = values[:, 0]
+        grid["download"][minutes] = values[:, 1]
+        grid["upload"][minutes] = values[:, 2]
+        grid["ping"][minutes] = values[:, 3]
+        online = (values[:, 1] > 0) | (values[:, 1] == slots.NO_SPEEDTEST)
+        grid["status"][minutes] = np.where(online, slots.ONLINE, slots.OFFLINE)
+    return grid, grid["status"] == slots.UNKNOWN
+
+
+def load_day(date) -> np.ndarray:
+    """
+    Loads a day as a minute grid. The day's .slot file is memory-mapped when it exists, otherwise the .trck file is
+    parsed.
+    :param date: the day to load (see to_date())
+    :return: array of slots.RECORD, one per minute (read-only when mapped)
+    :raises FileNotFoundError: if the day has neither a .slot nor a .trck file
+    """
+    day = to_date(date)
+    grid = slots.read_day(day)
+    if grid is None:
+        grid = minute_grid(organize(day))[0]
+    return grid
+
+
+def day_exists(date) -> bool:
+    """
+    :param date: the day to check (see to_date())
+    :return: True if the day has a .slot or a .trck file (plain or compressed)
+    """
+    day = to_date(date)
+    return os.path.exists(slots.slot_path(day)) or trck.find(day) is not None
+
+
+class DayCache:
+    """
+    LRU cache of the minute grids and analyses of days, keyed on the identity (path, mtime, size) of the file they were
+    read from. A day is only read again when its file changed, which in practice is only today's. Grids read from .trck
+    files of closed days can be spilled to disk as .npy files when evicted, so they don't need to be parsed again.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, spill_dir: str = None):
+        """
+        :param max_bytes: (int, default = 64 MiB) memory limit of the cached arrays, 0 disables the cache
+        :param spill_dir: (str, default = None) directory for spilled grids, None disables spilling
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()      # (kind, day) -> (identity, value, size)
+        self._bytes = 0
+
+    @staticmethod
+    def identity(day: datetime.date):
+        """
+        :return: (path, mtime, size) of the file load_day() would read for day, None if it has no file
+        """
+        for path in [slots.slot_path(day)] + trck.paths(day):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return path, stat.st_mtime_ns, stat.st_size
+        return None
+
+    def _spill_path(self, day: datetime.date, identity: tuple) -> str:
+        return os.path.join(self.spill_dir, "{}_{}_{}.npy".format(day.strftime("%d_%m_%Y"), identity[1], identity[2]))
+
+    def lookup(self, kind: str, day: datetime.date, identity: tuple):
+        """
+        :return: the cached value of kind ("grid" or "analysis") for day if it was built from identity, else None
+        """
+        entry = self._entries.get((kind, day))
+        if entry is not None and entry[0] == identity:
+            self._entries.move_to_end((kind, day))
+            self.hits += 1
+            return entry[1]
+        if kind == "grid" and self.spill_dir is not None and not identity[0].endswith(".slot"):
+            try:
+                grid = np.load(self._spill_path(day, identity), mmap_mode='r')
+            except (FileNotFoundError, ValueError):
+                pass
+            else:
+                self.store(kind, day, identity, grid)
+                self.hits += 1
+                return grid
+        self.misses += 1
+        return None
+
+    def store(self, kind: str, day: datetime.date, identity: tuple, value):
+        """
+        Caches value, evicting the least recently used entries past max_bytes.
+        """
+        size = value.nbytes if isinstance(value, np.ndarray) else value["outages"].nbytes + 256
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop((kind, day), None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[(kind, day)] = (identity, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            (old_kind, old_day), (old_identity, old_value, old_size) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self._spill(old_kind, old_day, old_identity, old_value)
+
+    def _spill(self, kind: str, day: datetime.date, identity: tuple, value):
+        if kind != "grid" or self.spill_dir is None or identity[0].endswith(".slot") or \
+                day >= datetime.date.today() or isinstance(value, np.memmap):
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        prefix = day.strftime("%d_%m_%Y") + "_"
+        for name in os.listdir(self.spill_dir):
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.spill_dir, name))
+        np.save(self._spill_path(day, identity), value)
+
+    def grid(self, date) -> np.ndarray:
+        """
+        Cached load_day().
+        :raises FileNotFoundError: if the day has neither a .slot nor a .trck file
+        """
+        day = to_date(date)
+        identity = self.identity(day)
+        if identity is None:
+            raise FileNotFoundError(trck_path(day))
+        grid = self.lookup("grid", day, identity)
+        if grid is None:
+            grid = np.array(load_day(day))
+            self.store("grid", day, identity, grid)
+        return grid
+
+    def analysis(self, date) -> dict:
+        """
+        Cached analyse() of a single day.
+        :raises FileNotFoundError: if the day has neither a .slot nor a .trck file
+        """
+        day = to_date(date)
+        identity = self.identity(day)
+        if identity is None:
+            raise FileNotFoundError(trck_path(day))
+        ret = self.lookup("analysis", day, identity)
+        if ret is None:
+            ret = analyse(self.grid(day)["status"])
+            self.store("analysis", day, identity, ret)
+        return ret
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+cache = DayCache()
+
+
+PARALLEL_MIN_DAYS = 32      # below this, a range is loaded in-process since the pool costs more than it saves
+_executor = None
+_executor_workers = 0
+
+
+def _load_or_none(day: datetime.date):
+    try:
+        return load_day(day)
+    except FileNotFoundError:
+        return None
+
+
+def _load_chunk(data_dir: str, days: list) -> list:
+    """
+    Worker side of load_range(): loads a chunk of days, None for days without files. Maps are copied into plain
+    arrays so they can be sent back to the parent process.
+    """
+    slots.DATA_DIR = data_dir
+    return [None if grid is None else np.array(grid) for grid in map(_load_or_none, days)]
+
+
+def load_range(start, end, workers: int = None) -> tuple:
+    """
+    Loads every day from start to end (both included). Days are taken from the cache when their files didn't change,
+    the rest are split into chunks, about four per core, and parsed/mapped by a pool of processes when there are many.
+    :param start: first day (see to_date())
+    :param end: last day (see to_date())
+    :param workers: (int, default = None) size of the process pool, defaults to the number of cores. 1 loads in-process
+    :return: (grids, merged): grids is a list with the minute grid of each day in order (None for days without files),
+             merged is a single contiguous grid of all the days, where the missing ones are slots.UNKNOWN
+    """
+    global _executor, _executor_workers
+    first = to_date(start)
+    days = [first + datetime.timedelta(days=i) for i in range((to_date(end) - first).days + 1)]
+    workers = workers or os.cpu_count() or 1
+
+    identities = [cache.identity(day) for day in days]
+    grids = [None if identity is None else cache.lookup("grid", day, identity)
+             for day, identity in zip(days, identities)]
+    missing = [i for i, grid in enumerate(grids) if grid is None and identities[i] is not None]
+
+    if workers == 1 or len(missing) < PARALLEL_MIN_DAYS:
+        loaded = [_load_or_none(days[i]) for i in missing]
+    else:
+        if _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown()
+            _executor = ProcessPoolExecutor(max_workers=workers)
+            _executor_workers = workers
+        size = -(-len(missing) // (workers * 4))
+        chunks = [[days[i] for i in missing[j:j + size]] for j in range(0, len(missing), size)]
+        loaded = [grid for chunk in _executor.map(_load_chunk, [slots.DATA_DIR] * len(chunks), chunks)
+                  for grid in chunk]
+
+    for i, grid in zip(missing, loaded):
+        if grid is not None:
+            grid = np.array(grid)
+            cache.store("grid", days[i], identities[i], grid)
+        grids[i] = grid
+
+    merged = np.zeros(len(days) * slots.MINUTES_PER_DAY, dtype=slots.RECORD)
+    for i, grid in enumerate(grids):
+        if grid is not None:
+            merged[i * slots.MINUTES_PER_DAY:(i + 1) * slots.MINUTES_PER_DAY] = grid
+    return grids, merged
+
+
+def series(start, end, step: int) -> tuple:
+    """
+    Aggregates of a range in buckets of 'step' minutes, each answered from the coarsest tier that has it exactly:
+    daily aggregates when step is a whole number of days, hourly ones when it is a whole number of hours, and minute
+    files otherwise (or when a day still has them). Buckets run from start at 00:00, the last one may be cut short.
+    :param start: first day (see to_date())
+    :param end: last day (see to_date())
+    :param step: minutes per bucket
+    :return: (array of retention.AGGREGATE, exact): compacted days that can't be answered at the step asked for (whose
+             minutes are gone) are left unknown, and exact is False if there was any
+    """
+    first, last = to_date(start), to_date(end)
+    days = [first + datetime.timedelta(days=i) for i in range((last - first).days + 1)]
+    base = slots.MINUTES_PER_DAY if step % slots.MINUTES_PER_DAY == 0 else 60 if step % 60 == 0 else 1
+    exact = True
+    parts = []
+    for day, grid in zip(days, load_range(first, last)[0]):
+        ordinal = day.toordinal()
+        if grid is not None:
+            parts.append(retention.aggregate(grid, ordinal, base))
+            continue
+        found = retention.records(day, base) if base > 1 else None
+        if found is None:
+            exact = exact and not retention.has_day(day)
+            found = np.concatenate([retention.empty(ordinal, m, base) for m in range(0, slots.MINUTES_PER_DAY, base)])
+        parts.append(found)
+    buckets = np.concatenate(parts)
+    group = step // base
+    padding = -len(buckets) % group
+    if padding:
+        end_ordinal = last.toordinal() + 1
+        buckets = np.concatenate([buckets] + [retention.empty(end_ordinal, 0, base)] * padding)
+        result = retention.combine(buckets, group)
+        # The padding isn't part of the range
+        result["minutes"][-1] -= padding * base
+        result["unknown"][-1] -= padding * base
+    else:
+        result = retention.combine(buckets, group)
+    return result, exact
+
+
+def live_status() -> dict:
+    """
+    The collector's live status (see live), read in constant time: "health" ("ok", "speedtest_failed", "offline",
+    "stopped", "paused" or "starting"), "stale", "pid", "tick", "time", "status", "download", "upload", "ping" of the
+    last sample, "last_success", "outage_start", "failures"...
+    :return: dict (see live.read()), None if the collector never published one
+    """
+    return live.read()
+
+
+def quantiles(start, end, qs: tuple = sketch.QUANTILES) -> dict:
+    """
+    Quantiles of the download and upload speeds and of the latency of a range, e.g. quantiles(first, last, (0.05,)) for
+    the speed the connection beat 95% of the time. Answered from the per-day sketches of summary_index, without reading
+    the minute files of any day already indexed.
+    :param start: first day (see to_date())
+    :param end: last day (see to_date())
+    :param qs: (tuple, default = sketch.QUANTILES) the quantiles wanted, from 0 to 1
+    :return: see summary_index.quantiles()
+    """
+    import summary_index    # it is built on this module
+    return summary_index.quantiles(start, end, qs)
+
+
+_CLOCK = ["{:02d}:{:02d}".format(m // 60, m % 60) for m in range(slots.MINUTES_PER_DAY)]
 
 
 def fix(tracking: list) -> list:
     """
     Fixes an organized list with all the minutes. tracking parameter must have at least one valid entry.
     Besides fixing the list, fix() will also return the fixed list itself.
+    Kept for compatibility, new code should use minute_grid(), which doesn't build filler rows.
     :param tracking: a .trck file witch has passed through organize()
-    :return: a fixed list
+    :return: a fixed list, missing minutes are filled with [-1, date and time, -2, -2, -2]
     """
-
-    index = 0
-    for minute in [datetime.datetime.strptime(tracking[0][1].split(' ')[0], '%d/%m/%Y') + datetime.timedelta(minutes=x)
-                   for x in range(60*24)]:
-        try:
-            if datetime.datetime.strptime(tracking[index][1], "%d/%m/%Y %H:%M") != minute:
-                tracking.insert(index, [-1, minute.strftime("%d/%m/%Y %H:%M"), -2, -2, -2])
-        except IndexError:
-            # If tracking has ended but there's still minutes to be checked, it means those minutes are not there.
-            tracking.append([-1, minute.strftime("%d/%m/%Y %H:%M"), -2, -2, -2])
-        index += 1
+    prefix = tracking[0][1][:10]
+    by_minute = [None] * slots.MINUTES_PER_DAY
+    for line in tracking:
+        if line[1].startswith(prefix):
+            by_minute[minute_of(line[1])] = line
+    tracking[:] = [line if line is not None else [-1, "{} {}".format(prefix, _CLOCK[m]), -2, -2, -2]
+                   for m, line in enumerate(by_minute)]
 
     return tracking
 
 
+OSCILLATION_MINUTES = 15
+OUTAGE = np.dtype([("start", "<i8"), ("end", "<i8"), ("duration", "<i8"), ("oscillation", "?"), ("ongoing", "?")])
+
+
+def find_outages(status: np.ndarray) -> np.ndarray:
+    """
+    Finds the outages in a contiguous run of minutes by run-length encoding the known minutes. An outage starts at an
+    offline minute and ends at the next online minute, unknown minutes in between don't end it.
+    :param status: array of slots statuses, one per minute, may span any number of days
+    :return: array of OUTAGE: "start" and "end" are minute indexes into status ("end" is the first online minute, or
+             len(status) if the outage is still going on at the end of the array), "duration" is end - start in minutes,
+             "oscillation" is True for finished outages that lasted OSCILLATION_MINUTES or less
+    """
+    known = np.flatnonzero(status != slots.UNKNOWN)
+    offline = (status[known] == slots.OFFLINE).view(np.int8)
+    edges = np.diff(offline, prepend=0, append=0)
+    first = np.flatnonzero(edges == 1)
+    after = np.flatnonzero(edges == -1)
+
+    outages = np.empty(len(first), dtype=OUTAGE)
+    outages["start"] = known[first]
+    outages["ongoing"] = after == len(known)
+    outages["end"] = np.where(outages["ongoing"], len(status), known[np.minimum(after, len(known) - 1)])
+    outages["duration"] = outages["end"] - outages["start"]
+    outages["oscillation"] = ~outages["ongoing"] & (outages["duration"] <= OSCILLATION_MINUTES)
+    return outages
+
+
+def analyse(status: np.ndarray) -> dict:
+    """
+    Vectorized analysis of a contiguous run of minutes, see get_analysis() for the meaning of the totals. Outages that
+    cross midnight are counted once, as long as status holds both days.
+    :param status: array of slots statuses, one per minute
+    :return: dict with "outages" (see find_outages()) and the totals of get_analysis(), without "outage_times"
+    """
+    outages = find_outages(status)
+    test_time = int(np.count_nonzero(status != slots.UNKNOWN))
+    mins = int(np.count_nonzero(status == slots.OFFLINE))
+    fluc_mins = int(outages["duration"][outages["oscillation"]].sum())
+    return {"outages": outages,
+            "outage_count": len(outages),
+            "oscillation_count": int(np.count_nonzero(outages["oscillation"])),
+            "total_test_minutes": test_time,
+            "total_minutes_lost": mins,
+            "oscillation_minutes": fluc_mins,
+            "total_loss_percentage": 100 * (mins / test_time) if test_time else 0,
+            "oscillation_loss_percentage": 100 * (fluc_mins / test_time) if test_time else 0}
+
+
+def outage_times(outages: np.ndarray, first: datetime.datetime) -> list:
+    """
+    Formats outages as the strings shown in the GUI.
+    :param outages: array of OUTAGE (see find_outages())
+    :param first: date and time of minute index 0
+    :return: list of str
+    """
+    times = []
+    for outage in outages:
+        start = (first + datetime.timedelta(minutes=int(outage["start"]))).strftime('%d/%m/%Y %H:%M')
+        end = "now" if outage["ongoing"] else \
+            (first + datetime.timedelta(minutes=int(outage["end"]))).strftime('%d/%m/%Y %H:%M')
+        times.append("From {} to {}  -->  {} mins".format(start, end, outage["duration"]))
+    return times
+
+
 def get_analysis(tracking: list) -> dict:
     """
     Analyses the tracking passed, returns a dict with 8 keys:
@@ -69,59 +474,24 @@ def get_analysis(tracking: list) -> dict:
     "outage_count" - (int) amount of outages (includes oscillations)
     "oscillation_count" - (int) amount of oscillations (outages shorter than 15 minutes)
     "total_test_minutes" - (int) amount of minutes tested. lines marked with -2 (unknown) are not counted
-    "total_minutes_lost" - (int) sum of the duration of all outages
+    "total_minutes_lost" - (int) amount of offline minutes
     "oscillation_minutes" - (int) sum of the duration of all oscillations
     "total_loss_percentage" - (int) percentage that "total_minutes_lost" represents of "total_test_minutes"
     "oscillation_loss_percentage" - (int) percentage that "oscillation_minutes" represents of "total_test_minutes"
+    For multi-day ranges, analyse() on the concatenated minute grids gets outages crossing midnight right.
     :param tracking: an organized list, may or may not be fixed, doesn't really matter
     :return: dics (see desc)
     """
-    ret = {"outage_times": [],
-           "outage_count": -1,
-           "oscillation_count": -1,
-           "total_test_minutes": -1,
-           "total_minutes_lost": -1,
-           "oscillation_minutes": -1,
-           "total_loss_percentage": -1,
-           "oscillation_loss_percentage": -1}
-    out = False
-    endt = None
-    stst = None
-    mins = 0
-    fluc_mins = 0
-    tot = 0
-    osc = 0
-    test_time = 0
-    for line in tracking:
-        if line[2] > -2:
-            test_time += 1
-        if not out:
-            if -2 < line[2] <= 0:
-                out = True
-                stst = line[1]
-                mins += 1
-        else:
-            if line[2] > 0:
-                out = False
-                endt = line[1]
-                ini = datetime.datetime.strptime(stst, '%d/%m/%Y %H:%M')
-                end = datetime.datetime.strptime(endt, '%d/%m/%Y %H:%M')
-                out_time = (end - ini).seconds // 60
-                ret["outage_times"].append("From {} to {}  -->  {} mins".format(stst, endt, out_time))
-                if out_time <= 15:
-                    fluc_mins += out_time
-                    osc += 1
-                tot += 1
-            else:
-                mins += 1
-
-    ret["outage_count"] = tot
-    ret["oscillation_count"] = osc
-    ret["total_test_minutes"] = test_time
-    ret["total_minutes_lost"] = mins
-    ret["total_lost_percentage"] = 100 * (mins/test_time)
-    ret["oscillation_minutes"] = fluc_mins
-    ret["oscillation_lost_percentage"] = 100 * (fluc_mins/test_time)
+    grid = minute_grid([line for line in tracking if line[2] != -2])[0]
+    if not tracking:
+        first = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    else:
+        first = datetime.datetime.strptime(tracking[0][1][:10], '%d/%m/%Y')
+    ret = analyse(grid["status"])
+    ret["outage_times"] = outage_times(ret.pop("outages"), first)
+    # Older callers used these spellings
+    ret["total_lost_percentage"] = ret["total_loss_percentage"]
+    ret["oscillation_lost_percentage"] = ret["oscillation_loss_percentage"]
 
     return ret
 
@@ -140,5 +510,6 @@ if __name__ == "__main__":
                        Line2D([0], [0], marker='o', color='blue', label='Unknown')])
     ax.grid(True)
     for li in a:
-        ax.scatter("Today", li[1], color=('lime' if li[2] > 0 else 'r' if li[2] > -2 else 'b'))
+        ax.scatter("Today", li[1], color=('b' if li[2] == -2 else 'lime' if slots.status_of(li[2]) == slots.ONLINE else
+                                          'r'))
     plt.show()
@@ -0,0 +1,299 @@
+"""
+Retention tiers. Days keep their minute files (.trck/.slot) for MINUTE_DAYS days; compact() then rolls them up into
+hourly aggregates (data/MM_YYYY.hourly.npz, one file a month) and daily aggregates (data/YYYY.daily.npz, one file a
+year) and deletes the minute files. Hourly aggregates are dropped after HOURLY_DAYS days, daily ones are kept forever.
+The collector's per-day probe and metrics logs (.probes/.metrics) are deleted on the same schedule as the minute files.
+
+Every aggregate holds the online/offline/unknown minute counts, the first known minute, the min/mean/max speeds and the
+mean latency of its online minutes. Daily files also hold each day's outages, as summary_index does, so summaries and
+outage lists of compacted days are still exact. reader.series() picks the coarsest tier that answers a query exactly.
+    python retention.py [--minute-days N] [--hourly-days N]
+"""
+
+import datetime
+import os
+import sys
+import numpy as np
+import reader
+import slots
+import trck
+
+MINUTE_DAYS = 90
+HOURLY_DAYS = 2 * 365
+LOGS = (".probes", ".metrics")      # see probes.log_path() and metrics.log_path()
+
+AGGREGATE = np.dtype([("ordinal", "<i4"),         # day
+                      ("minute", "<i2"),          # minute of the day the bucket starts at
+                      ("minutes", "<i4"),         # length of the bucket
+                      ("online", "<i4"), ("offline", "<i4"), ("unknown", "<i4"),
+                      ("first_known", "<i4"),     # minutes from the bucket's start to its first known minute, or -1
+                      ("download_min", "<f4"), ("download_mean", "<f4"), ("download_max", "<f4"),
+                      ("upload_min", "<f4"), ("upload_mean", "<f4"), ("upload_max", "<f4"),
+                      ("ping_mean", "<f4")])      # speeds and latency over the online minutes, nan without any
+SPAN = np.dtype([("ordinal", "<i4"), ("start", "<i2"), ("end", "<i2")])     # end == MINUTES_PER_DAY: still offline
+
+_loaded = {}        # path -> ((mtime, size), aggregates, outages)
+
+
+def hourly_path(day: datetime.date) -> str:
+    return os.path.join(slots.DATA_DIR, "{}.hourly.npz".format(day.strftime("%m_%Y")))
+
+
+def daily_path(day: datetime.date) -> str:
+    return os.path.join(slots.DATA_DIR, "{}.daily.npz".format(day.year))
+
+
+def aggregate(grid: np.ndarray, ordinal: int, bucket: int) -> np.ndarray:
+    """
+    :param grid: array of slots.RECORD, one per minute of a day
+    :param ordinal: the day's ordinal
+    :param bucket: minutes per aggregate, must divide MINUTES_PER_DAY
+    :return: array of AGGREGATE, one per bucket
+    """
+    count = slots.MINUTES_PER_DAY // bucket
+    status = grid["status"].reshape(count, bucket)
+    online = status == slots.ONLINE
+    known = status != slots.UNKNOWN
+    out = np.zeros(count, dtype=AGGREGATE)
+    out["ordinal"] = ordinal
+    out["minute"] = np.arange(count) * bucket
+    out["minutes"] = bucket
+    out["online"] = online.sum(axis=1)
+    out["offline"] = (status == slots.OFFLINE).sum(axis=1)
+    out["unknown"] = bucket - known.sum(axis=1)
+    out["first_known"] = np.where(known.any(axis=1), known.argmax(axis=1), -1)
+    # Online minutes without a speedtest (see slots.NO_SPEEDTEST) have no speeds to aggregate
+    measured = online & (grid["download"].reshape(count, bucket) > 0)
+    tested = measured.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for field in ("download", "upload", "ping"):
+            values = grid[field].reshape(count, bucket).astype(np.float64)
+            out[field + "_mean"] = np.where(measured, values, 0).sum(axis=1) / tested
+            if field != "ping":
+                out[field + "_min"] = np.where(tested > 0, np.where(measured, values, np.inf).min(axis=1), np.nan)
+                out[field + "_max"] = np.where(tested > 0, np.where(measured, values, -np.inf).max(axis=1), np.nan)
+    return out
+
+
+def empty(ordinal: int, minute: int, minutes: int) -> np.ndarray:
+    """
+    :return: an AGGREGATE of 'minutes' unknown minutes
+    """
+    out = np.zeros(1, dtype=AGGREGATE)
+    out["ordinal"], out["minute"], out["minutes"], out["unknown"], out["first_known"] = \
+        ordinal, minute, minutes, minutes, -1
+    for field in AGGREGATE.names[7:]:
+        out[field] = np.nan
+    return out
+
+
+def combine(records: np.ndarray, group: int) -> np.ndarray:
+    """
+    Merges every 'group' consecutive aggregates into one. Counts add up, extremes and means (weighted by online
+    minutes) are exact.
+    :param records: array of AGGREGATE, its length a multiple of group
+    :return: array of AGGREGATE
+    """
+    blocks = records.reshape(-1, group)
+    out = np.zeros(len(blocks), dtype=AGGREGATE)
+    out["ordinal"] = blocks["ordinal"][:, 0]
+    out["minute"] = blocks["minute"][:, 0]
+    for field in ("minutes", "online", "offline", "unknown"):
+        out[field] = blocks[field].sum(axis=1)
+    known = blocks["first_known"] >= 0
+    first = known.argmax(axis=1)
+    before = np.cumsum(blocks["minutes"], axis=1) - blocks["minutes"]
+    rows = np.arange(len(blocks))
+    out["first_known"] = np.where(known.any(axis=1), before[rows, first] + blocks["first_known"][rows, first], -1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for field in ("download", "upload", "ping"):
+            weighted = np.where(blocks["online"] > 0, blocks[field + "_mean"].astype(np.float64) * blocks["online"], 0)
+            out[field + "_mean"] = weighted.sum(axis=1) / out["online"]
+            if field != "ping":
+                out[field + "_min"] = np.fmin.reduce(blocks[field + "_min"], axis=1)
+                out[field + "_max"] = np.fmax.reduce(blocks[field + "_max"], axis=1)
+    return out
+
+
+def _load(path: str) -> tuple:
+    """
+    :return: (aggregates, outages) of a tier file, empty arrays if it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return np.zeros(0, dtype=AGGREGATE), np.zeros(0, dtype=SPAN)
+    identity = (stat.st_mtime_ns, stat.st_size)
+    cached = _loaded.get(path)
+    if cached is None or cached[0] != identity:
+        with np.load(path) as data:
+            cached = (identity, data["aggregates"], data["outages"])
+        _loaded[path] = cached
+    return cached[1], cached[2]
+
+
+def _save(path: str, aggregates: np.ndarray, outages: np.ndarray):
+    if not len(aggregates):
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    order = np.lexsort((aggregates["minute"], aggregates["ordinal"]))
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as file:
+        np.savez(file, aggregates=aggregates[order], outages=outages[np.argsort(outages["ordinal"], kind="stable")])
+    os.replace(tmp, path)
+
+
+def _merge(path: str, aggregates: np.ndarray, outages: np.ndarray, ordinals: set):
+    """
+    Replaces the records of 'ordinals' in a tier file with the ones given.
+    """
+    old_aggregates, old_outages = _load(path)
+    keep = ~np.isin(old_aggregates["ordinal"], list(ordinals))
+    keep_outages = ~np.isin(old_outages["ordinal"], list(ordinals))
+    _save(path, np.concatenate([old_aggregates[keep], aggregates]),
+          np.concatenate([old_outages[keep_outages], outages]))
+
+
+def minute_days() -> list:
+    """
+    :return: every day with a .trck (plain or compressed) or .slot file, sorted
+    """
+    days = set()
+    for name in os.listdir(slots.DATA_DIR):
+        day = slots.day_of(name) or trck.day_of(name)
+        if day is not None:
+            days.add(day)
+    return sorted(days)
+
+
+def log_day(name: str) -> datetime.date:
+    """
+    :param name: a file name, e.g. "01_02_2019.probes"
+    :return: the day of a probe or metrics log, None for other files
+    """
+    for suffix in LOGS:
+        if name.endswith(suffix):
+            try:
+                return datetime.datetime.strptime(name[:-len(suffix)], "%d_%m_%Y").date()
+            except ValueError:
+                return None
+    return None
+
+
+def compact(today: datetime.date = None, keep_minutes: int = MINUTE_DAYS, keep_hourly: int = HOURLY_DAYS) -> tuple:
+    """
+    Rolls the minute files of days older than keep_minutes days up into the hourly and daily tiers and deletes them,
+    then drops hourly aggregates older than keep_hourly days. Files are only deleted once their aggregates are on disk
+    and their rows (with their quantile sketches) are in the summary index. Probe and metrics logs older than
+    keep_minutes days are deleted too, nothing is rolled up from them.
+    :param today: (datetime.date, default = None) the current day, None for today
+    :param keep_minutes: (int, default = MINUTE_DAYS) days kept at minute resolution
+    :param keep_hourly: (int, default = HOURLY_DAYS) days kept at hourly resolution
+    :return: (days compacted, days whose hourly aggregates were dropped)
+    """
+    today = datetime.date.today() if today is None else today
+    minute_cutoff = today - datetime.timedelta(days=keep_minutes)
+    hourly_cutoff = (today - datetime.timedelta(days=keep_hourly)).toordinal()
+    days = [day for day in minute_days() if day < minute_cutoff]
+
+    hourly, daily = {}, {}
+    for day in days:
+        grid = reader.load_day(day)
+        ordinal = day.toordinal()
+        found = reader.find_outages(grid["status"])
+        spans = np.zeros(len(found), dtype=SPAN)
+        spans["ordinal"], spans["start"], spans["end"] = ordinal, found["start"], found["end"]
+        if ordinal >= hourly_cutoff:
+            hourly.setdefault(hourly_path(day), []).append((ordinal, aggregate(grid, ordinal, 60)))
+        daily.setdefault(daily_path(day), []).append((ordinal, aggregate(grid, ordinal, slots.MINUTES_PER_DAY), spans))
+
+    for path, entries in hourly.items():
+        _merge(path, np.concatenate([e[1] for e in entries]), np.zeros(0, dtype=SPAN), {e[0] for e in entries})
+    for path, entries in daily.items():
+        _merge(path, np.concatenate([e[1] for e in entries]), np.concatenate([e[2] for e in entries]),
+               {e[0] for e in entries})
+    # The summary index keeps the day's sketches, which can't be rebuilt from the tiers, so it must hold them before the
+    # minute files go
+    import summary_index    # it is built on this module
+    for day in days:
+        summary_index.update(day)
+    for day in days:
+        for path in trck.paths(day) + [slots.slot_path(day)]:
+            if os.path.exists(path):
+                os.remove(path)
+    # A day may have logs without minute files, so they are looked for on their own
+    for name in os.listdir(slots.DATA_DIR):
+        day = log_day(name)
+        if day is not None and day < minute_cutoff:
+            os.remove(os.path.join(slots.DATA_DIR, name))
+
+    dropped = set()
+    for name in os.listdir(slots.DATA_DIR):
+        if name.endswith(".hourly.npz"):
+            path = os.path.join(slots.DATA_DIR, name)
+            aggregates, outages = _load(path)
+            old = aggregates["ordinal"] < hourly_cutoff
+            if old.any():
+                dropped.update(aggregates["ordinal"][old].tolist())
+                _save(path, aggregates[~old], outages)
+    return len(days), len(dropped)
+
+
+def records(day: datetime.date, bucket: int) -> np.ndarray:
+    """
+    :param day: the day wanted
+    :param bucket: 60 for hourly aggregates, MINUTES_PER_DAY for the daily one
+    :return: the day's aggregates from its tier files (daily ones are built from hourly ones if needed), or None if the
+             tiers don't have the day at that resolution
+    """
+    ordinal = day.toordinal()
+    if bucket == slots.MINUTES_PER_DAY:
+        aggregates = _load(daily_path(day))[0]
+        found = aggregates[aggregates["ordinal"] == ordinal]
+        if len(found):
+            return found
+    aggregates = _load(hourly_path(day))[0]
+    found = aggregates[aggregates["ordinal"] == ordinal]
+    if len(found) != 24:
+        return None
+    return found if bucket == 60 else combine(found, 24)
+
+
+def has_day(day: datetime.date) -> bool:
+    """
+    :return: True if the day was compacted into the tiers
+    """
+    return records(day, slots.MINUTES_PER_DAY) is not None
+
+
+def daily_days(path: str) -> set:
+    """
+    :param path: a daily tier file
+    :return: the days it holds
+    """
+    return {datetime.date.fromordinal(int(o)) for o in _load(path)[0]["ordinal"]}
+
+
+def day_rows(first: datetime.date, last: datetime.date) -> list:
+    """
+    Per-day summary rows of the compacted days of a range, in the form summary_index.summary() joins.
+    :return: list of (ordinal, first known minute, test minutes, lost minutes, outages as [[start, end], ...])
+    """
+    rows = []
+    for year in range(first.year, last.year + 1):
+        path = daily_path(datetime.date(year, 1, 1))
+        aggregates, outages = _load(path)
+        wanted = (aggregates["ordinal"] >= first.toordinal()) & (aggregates["ordinal"] <= last.toordinal())
+        for record in aggregates[wanted]:
+            spans = outages[outages["ordinal"] == record["ordinal"]]
+            rows.append((int(record["ordinal"]), int(record["first_known"]), int(record["online"] + record["offline"]),
+                         int(record["offline"]), [[int(s), int(e)] for s, e in zip(spans["start"], spans["end"])]))
+    return rows
+
+
+if __name__ == "__main__":
+    minutes = int(sys.argv[sys.argv.index("--minute-days") + 1]) if "--minute-days" in sys.argv else MINUTE_DAYS
+    hours = int(sys.argv[sys.argv.index("--hourly-days") + 1]) if "--hourly-days" in sys.argv else HOURLY_DAYS
+    compacted, pruned = compact(keep_minutes=minutes, keep_hourly=hours)
+    print("Compacted {} day(s), dropped the hourly aggregates of {} day(s)".format(compacted, pruned))
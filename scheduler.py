@@ -0,0 +1,94 @@
+"""
+Drift-free scheduler. Ticks sit on a fixed grid of the monotonic clock (start + n * interval), and the scheduler sleeps
+until the next one instead of polling the time, so it costs no CPU while idle and a slow tick doesn't push the ones
+after it later.
+"""
+
+import math
+import threading
+import time
+
+SKIP = "skip"               # ticks that passed while a task was running are dropped
+QUEUE = "queue"             # ticks that passed while a task was running are run back to back afterwards
+CONCURRENT = "concurrent"   # every tick starts its task on time, in its own thread, even if others are running
+
+
+class Scheduler:
+
+    def __init__(self, interval: float, task, overlap: str = SKIP, on_missed=None, clock=time.monotonic,
+                 tick: int = 0):
+        """
+        :param interval: seconds between ticks, positive and finite
+        :param task: called as task(tick, lag) for every tick: tick counts from 1, lag is how many seconds late the
+                     task started
+        :param overlap: (str, default = SKIP) what happens to ticks that come while a task is still running, one of
+                        SKIP, QUEUE and CONCURRENT
+        :param on_missed: (default = None) called as on_missed(count) when ticks are skipped
+        :param clock: (default = time.monotonic) clock the grid is laid on
+        :param tick: (int, default = 0) ticks already run, e.g. by a scheduler this one replaces: the first tick is
+                     tick + 1, and is due as soon as run() starts
+        """
+        if not math.isfinite(interval) or interval <= 0:
+            raise ValueError("The interval must be a positive number of seconds, not {!r}".format(interval))
+        if overlap not in (SKIP, QUEUE, CONCURRENT):
+            raise ValueError("Unknown overlap policy: {}".format(overlap))
+        self.interval = interval
+        self.task = task
+        self.overlap = overlap
+        self.on_missed = on_missed
+        self.clock = clock
+        self.tick = tick
+        self.first_tick = tick + 1
+        self.missed = 0
+        self.start = None
+        self._stop = threading.Event()
+
+    def due(self, tick: int) -> float:
+        """
+        :return: clock time at which tick is due
+        """
+        return self.start + (tick - self.first_tick) * self.interval
+
+    def stop(self):
+        """
+        Makes run() return once the running task (if any) finishes, or as soon as it is called if it hasn't been yet. A
+        stopped scheduler stays stopped. Can be called from any thread.
+        """
+        self._stop.set()
+
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def run(self, ticks: int = None):
+        """
+        Runs ticks until stop() is called, or until tick number 'ticks' has run (skipped ticks count).
+        :param ticks: (int, default = None) last tick to run, None runs forever
+        """
+        self.start = self.clock()
+        workers = []
+        while not self._stop.is_set() and (ticks is None or self.tick < ticks):
+            next_tick = self.tick + 1
+            wait = self.due(next_tick) - self.clock()
+            if wait > 0 and self._stop.wait(wait):
+                break
+
+            if self.overlap == SKIP:
+                # Jump to the latest tick that is already due, dropping the ones before it
+                late = int((self.clock() - self.due(next_tick)) // self.interval)
+                if late > 0:
+                    self.missed += late
+                    next_tick += late
+                    if self.on_missed is not None:
+                        self.on_missed(late)
+
+            self.tick = next_tick
+            lag = max(self.clock() - self.due(next_tick), 0)
+            if self.overlap == CONCURRENT:
+                worker = threading.Thread(target=self.task, args=(next_tick, lag), daemon=True)
+                worker.start()
+                workers = [w for w in workers if w.is_alive()] + [worker]
+            else:
+                self.task(next_tick, lag)
+
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,101 @@
+"""
+Mergeable quantile sketches of the speeds and latency. A sketch counts values in logarithmic buckets, each ACCURACY
+wider than the previous one (as DDSketch does), so any quantile it answers is within ACCURACY of the exact one,
+relatively, and merging sketches is adding up their counts: the sketches of single days merge into the sketch of any
+range, in a few KB whatever its length. summary_index keeps one sketch per day and metric.
+"""
+
+import math
+import struct
+import numpy as np
+
+ACCURACY = 0.01
+GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+METRICS = ("download", "upload", "ping")
+QUANTILES = (0.5, 0.95, 0.99)
+
+_HEADER = struct.Struct("<II")      # values <= 0, number of buckets
+MAX_COUNT = 2 ** 32 - 1             # counts are stored as 32 bit unsigned integers
+
+
+class Sketch:
+
+    def __init__(self, keys: np.ndarray = None, counts: np.ndarray = None, zeros: int = 0):
+        """
+        :param keys: (np.ndarray, default = None) sorted bucket indexes, bucket k holding values in
+                     (GAMMA ** (k - 1), GAMMA ** k]
+        :param counts: (np.ndarray, default = None) values in each bucket
+        :param zeros: (int, default = 0) values <= 0
+        """
+        self.keys = np.zeros(0, dtype=np.int32) if keys is None else keys
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+        self.zeros = zeros
+
+    @classmethod
+    def of(cls, values: np.ndarray):
+        """
+        :param values: the values to count
+        :return: the sketch of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        keys, counts = np.unique(np.ceil(np.log(positive) / math.log(GAMMA)).astype(np.int32), return_counts=True)
+        return cls(keys, counts.astype(np.int64), len(values) - len(positive))
+
+    @classmethod
+    def merge(cls, sketches: list):
+        """
+        :return: the sketch of all the values of sketches
+        """
+        sketches = list(sketches)
+        if not sketches:
+            return cls()
+        keys = np.concatenate([s.keys for s in sketches])
+        counts = np.concatenate([s.counts for s in sketches])
+        merged, where = np.unique(keys, return_inverse=True)
+        return cls(merged, np.bincount(where, weights=counts, minlength=len(merged)).astype(np.int64),
+                   sum(s.zeros for s in sketches))
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + self.zeros
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: the quantile, from 0 to 1
+        :return: the value of rank q * (count - 1), within ACCURACY of it, nan for an empty sketch
+        """
+        if not self.count:
+            return math.nan
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        k = self.keys[np.searchsorted(np.cumsum(self.counts), rank - self.zeros, side='right')]
+        # The middle of the bucket, relatively
+        return 2 * GAMMA ** int(k) / (GAMMA + 1)
+
+    def to_bytes(self) -> bytes:
+        """
+        :raises OverflowError: if a count doesn't fit the 32 bits it is stored in, which takes a merged sketch of
+                               thousands of years of minutes; a day's sketch holds 1440 values at most
+        """
+        if self.zeros > MAX_COUNT or (len(self.counts) and int(self.counts.max()) > MAX_COUNT):
+            raise OverflowError("A count of the sketch doesn't fit in 32 bits")
+        return _HEADER.pack(self.zeros, len(self.keys)) + self.keys.astype("<i4").tobytes() + \
+            self.counts.astype("<u4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        zeros, length = _HEADER.unpack_from(data)
+        keys = np.frombuffer(data, dtype="<i4", count=length, offset=_HEADER.size).astype(np.int32)
+        counts = np.frombuffer(data, dtype="<u4", count=length, offset=_HEADER.size + 4 * length).astype(np.int64)
+        return cls(keys, counts, zeros)
+
+
+def of_grid(grid: np.ndarray) -> dict:
+    """
+    :param grid: array of slots.RECORD, one per minute
+    :return: a Sketch per metric, of the minutes with a speedtest result
+    """
+    tested = grid["download"] > 0
+    return {metric: Sketch.of(grid[metric][tested]) for metric in METRICS}
@@ -0,0 +1,139 @@
+"""
+Fixed-slot binary day files (.slot). Every file has a small header followed by 1440 preallocated records, one for each
+minute of the day. The collector writes each sample straight into its minute's slot, and the reader maps the whole file
+into a numpy array, so nothing has to be parsed. Slots that were never written stay zeroed, which reads as UNKNOWN.
+"""
+
+import datetime
+import os
+import struct
+import numpy as np
+
+DATA_DIR = "data"
+MINUTES_PER_DAY = 60 * 24
+
+MAGIC = b"ICTS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHi4x")      # magic, version, record size, date as a proleptic ordinal, padding
+HEADER_SIZE = HEADER.size
+
+UNKNOWN = 0
+ONLINE = 1
+OFFLINE = 2
+
+# Download (and upload) stored for minutes whose speedtest failed while the light probes answered: online, no speeds
+NO_SPEEDTEST = -3
+
+RECORD = np.dtype({"names": ["run", "download", "upload", "ping", "status"],
+                   "formats": ["<i4", "<f4", "<f4", "<f4", "u1"],
+                   "offsets": [0, 4, 8, 12, 16],
+                   "itemsize": 20})
+_RECORD_STRUCT = struct.Struct("<ifffB3x")
+FILE_SIZE = HEADER_SIZE + MINUTES_PER_DAY * RECORD.itemsize
+
+
+def slot_path(day: datetime.date) -> str:
+    """
+    :param day: the day whose file is wanted
+    :return: path to the day's .slot file inside DATA_DIR
+    """
+    return os.path.join(DATA_DIR, "{}.slot".format(day.strftime("%d_%m_%Y")))
+
+
+def day_of(name: str) -> datetime.date:
+    """
+    :param name: a file name, e.g. "01_02_2019.slot"
+    :return: the day of a .slot file, None for other files
+    """
+    if not name.endswith(".slot"):
+        return None
+    try:
+        return datetime.datetime.strptime(name[:-len(".slot")], "%d_%m_%Y").date()
+    except ValueError:
+        return None
+
+
+def status_of(download: float) -> int:
+    """
+    Maps a download speed, as stored in .trck files, to a slot status. The collector stores -1 for failed tests and
+    NO_SPEEDTEST for minutes the light probes found online without a speedtest; any other download speed <= 0 is
+    offline.
+    """
+    return ONLINE if download > 0 or download == NO_SPEEDTEST else OFFLINE
+
+
+def empty_grid() -> np.ndarray:
+    """
+    :return: an in-memory grid of MINUTES_PER_DAY records, all UNKNOWN
+    """
+    return np.zeros(MINUTES_PER_DAY, dtype=RECORD)
+
+
+def create(day: datetime.date) -> str:
+    """
+    Preallocates the day's .slot file if it does not exist yet.
+    :param day: the day to create
+    :return: path to the file
+    """
+    path = slot_path(day)
+    if not os.path.exists(path):
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, day.toordinal()))
+            file.write(bytes(MINUTES_PER_DAY * RECORD.itemsize))
+        os.replace(tmp, path)
+    return path
+
+
+def write_sample(when: datetime.datetime, run: int, download: float, upload: float, ping: float, status: int = None):
+    """
+    Writes one sample into the slot of the minute it was taken, creating the day's file if needed.
+    :param when: time the sample was taken
+    :param run: run's #
+    :param download: download speed as KiloBits per second (-1 if the test failed, NO_SPEEDTEST if the light probes
+                     answered instead)
+    :param upload: upload speed as KiloBits per second (same as download without one)
+    :param ping: latency as MilliSeconds (-1 if the test failed)
+    :param status: (int, default = None) the slot's status, None derives it from download (see status_of())
+    :return: nothing
+    """
+    path = create(when.date())
+    with open(path, 'r+b') as file:
+        file.seek(HEADER_SIZE + (when.hour * 60 + when.minute) * RECORD.itemsize)
+        file.write(_RECORD_STRUCT.pack(run, download, upload, ping, status_of(download) if status is None else status))
+
+
+def write_grid(day: datetime.date, grid: np.ndarray) -> str:
+    """
+    Writes a whole grid as the day's .slot file, replacing any existing one.
+    :param day: the day the grid belongs to
+    :param grid: array of MINUTES_PER_DAY RECORDs
+    :return: path to the file
+    """
+    path = slot_path(day)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, day.toordinal()))
+        file.write(np.ascontiguousarray(grid, dtype=RECORD).tobytes())
+    os.replace(tmp, path)
+    return path
+
+
+def read_day(day: datetime.date):
+    """
+    Maps the day's .slot file read-only.
+    :param day: the day to read
+    :return: a read-only numpy memmap of MINUTES_PER_DAY RECORDs, or None if the day has no .slot file
+    """
+    path = slot_path(day)
+    try:
+        with open(path, 'rb') as file:
+            header = file.read(HEADER_SIZE)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER_SIZE or os.path.getsize(path) != FILE_SIZE:
+        raise ValueError("{} is not a valid slot file".format(path))
+    magic, version, record_size, ordinal = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.itemsize or ordinal != day.toordinal():
+        raise ValueError("{} is not a valid slot file for {}".format(path, day.strftime("%d/%m/%Y")))
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(MINUTES_PER_DAY,))
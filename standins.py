@@ -0,0 +1,347 @@
+"""
+Local stand-ins for the collector's probe targets, so probing can be exercised without touching the network. Every
+stand-in listens on 127.0.0.1 on a free port and can be told to add latency or to fail.
+
+SpeedtestStandIn speaks the subset of the speedtest.net protocol that data_collector.test() uses (config, server list,
+latency, download and upload), with bandwidth shaping, latency and scheduled outages, and local_speedtest() builds
+speedtest clients that talk to it instead of speedtest.net.
+
+Running this script fans a round of probes out to a set of stand-ins with injected latency and failures, and shows
+that the round takes about as long as its slowest probe rather than the sum of all of them.
+"""
+
+import http.server
+import multiprocessing
+import re
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+import speedtest
+import probes
+
+OK = "ok"           # answer normally
+ERROR = "error"     # HTTP: answer 503
+HANG = "hang"       # HTTP: accept the request and never answer
+DROP = "drop"       # HTTP: close the connection without answering. TCP: stop listening, so connections are refused
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    def _answer(self, body: bytes = b""):
+        stand_in = self.server.stand_in
+        stand_in.requests += 1
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        if stand_in.mode == HANG:
+            stand_in.released.wait()
+            return
+        if stand_in.mode == DROP:
+            self.close_connection = True
+            return
+        self.send_response(503 if stand_in.mode == ERROR else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._answer()
+
+    def do_GET(self):
+        self._answer(b"OK")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpStandIn:
+    """
+    HTTP server answering HEAD and GET with an empty 200, after 'latency' seconds, unless told to fail.
+    """
+
+    handler = _Handler
+
+    def __init__(self, latency: float = 0, mode: str = OK):
+        self.latency = latency
+        self.mode = mode
+        self.requests = 0
+        self.released = threading.Event()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self.server.daemon_threads = True
+        self.server.stand_in = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="HttpStandIn", daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:{}/".format(self.port)
+
+    def close(self):
+        self.released.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TcpStandIn:
+    """
+    TCP listener that accepts connections and closes them right away. DROP closes the listener, so connections are
+    refused until the mode is set back to OK. The connect itself is done by the kernel, so latency can't be injected.
+    """
+
+    def __init__(self, mode: str = OK):
+        self.port = None
+        self._socket = None
+        self._mode = None
+        self.mode = mode
+
+    @property
+    def target(self) -> str:
+        return "127.0.0.1:{}".format(self.port)
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: str):
+        self._mode = mode
+        if mode == DROP and self.port is None:
+            # Pick a free port nobody listens on
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as reserved:
+                reserved.bind(("127.0.0.1", 0))
+                self.port = reserved.getsockname()[1]
+        if mode == DROP and self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        elif mode != DROP and self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._socket.bind(("127.0.0.1", self.port or 0))
+            self._socket.listen(16)
+            self.port = self._socket.getsockname()[1]
+            threading.Thread(target=self._accept, args=(self._socket,), name="TcpStandIn", daemon=True).start()
+
+    def _accept(self, listener: socket.socket):
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            connection.close()
+
+    def close(self):
+        self.mode = DROP
+
+
+SPEEDTEST_CONFIG = """<?xml version="1.0" encoding="UTF-8"?>
+<settings>
+<client ip="127.0.0.1" lat="0.0" lon="0.0" isp="Stand-in" isprating="3.7" rating="0" ispdlavg="0" ispulavg="0"
+        loggedin="0" country="XX"/>
+<server-config threadcount="{threads}" ignoreids="" notonmap="" forcepingid="" preferredserverid=""/>
+<download testlength="{length}" initialtest="250K" mintestsize="250K" threadsperurl="1"/>
+<upload testlength="{length}" ratio="{ratio}" initialtest="0" mintestsize="32K" threads="{threads}" maxchunksize="512K"
+        maxchunkcount="{chunks}" threadsperurl="1"/>
+</settings>
+"""
+
+SPEEDTEST_SERVERS = """<?xml version="1.0" encoding="UTF-8"?>
+<settings><servers>
+<server url="{url}speedtest/upload.php" lat="0.0" lon="0.0" name="Stand-in" country="Nowhere" cc="XX"
+        sponsor="Stand-in" id="1" host="{host}"/>
+</servers></settings>
+"""
+
+
+class _SpeedtestHandler(_Handler):
+
+    def setup(self):
+        # speedtest clients stop sending uploads mid-body when the test length runs out, and then wait for the answer
+        self.timeout = self.server.stand_in.length + 1
+        super().setup()
+
+    def _fail(self) -> bool:
+        stand_in = self.server.stand_in
+        stand_in.requests += 1
+        if stand_in.latency:
+            time.sleep(stand_in.latency)
+        mode = stand_in.current_mode()
+        if mode == HANG:
+            stand_in.released.wait()
+        elif mode == DROP:
+            self.close_connection = True
+        elif mode == ERROR:
+            self.send_error(503)
+        return mode != OK
+
+    def _send(self, body: bytes, content_type: str = "text/plain"):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.server.stand_in.shaped(self.wfile.write, body)
+
+    def do_GET(self):
+        if self._fail():
+            return
+        stand_in = self.server.stand_in
+        path = urllib.parse.urlsplit(self.path).path
+        if path.endswith("speedtest-config.php"):
+            self._send(stand_in.config.encode(), "text/xml")
+        elif "speedtest-servers" in path:
+            self._send(SPEEDTEST_SERVERS.format(url=stand_in.url, host="127.0.0.1:{}".format(stand_in.port)).encode(),
+                       "text/xml")
+        elif path.endswith("latency.txt"):
+            self._send(b"test=test")
+        else:
+            size = re.search(r"random(\d+)x\d+\.jpg$", path)
+            if size is None:
+                self.send_error(404)
+                return
+            # The real images weigh about 2 bytes per pixel; scaled down so tests stay short
+            self._send(bytes(int(size.group(1)) ** 2 * 2 // stand_in.scale), "image/jpeg")
+
+    def do_POST(self):
+        if self._fail():
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        received = [0]
+
+        def read(chunk: bytes):
+            received[0] += len(chunk)
+
+        remaining = length
+        while remaining > 0:
+            try:
+                chunk = self.rfile.read(min(remaining, 65536))
+            except OSError:
+                break
+            if not chunk:
+                break
+            self.server.stand_in.shaped(read, chunk)
+            remaining -= len(chunk)
+        self._send("size={}".format(received[0]).encode())
+
+
+class SpeedtestStandIn(HttpStandIn):
+    """
+    Local speedtest.net. Serves the config, a one-server list pointing back at itself, latency.txt, the random*.jpg
+    downloads (scaled down by 'scale') and upload.php.
+    """
+
+    handler = _SpeedtestHandler
+
+    def __init__(self, latency: float = 0, mode: str = OK, bandwidth: float = None, outages: list = (),
+                 length: int = 1, threads: int = 2, ratio: int = 1, chunks: int = 7, scale: int = 16,
+                 started: float = None):
+        """
+        :param latency: (float, default = 0) seconds added before every answer
+        :param mode: (str, default = OK) failure mode outside of scheduled outages
+        :param bandwidth: (float, default = None) bytes per second each connection is shaped to, None is unshaped
+        :param outages: (list, default = ()) (start, end) windows, in seconds since 'started', during which every
+                        request is dropped
+        :param length: (int, default = 1) test length of the config, in seconds
+        :param threads: (int, default = 2) thread count of the config
+        :param ratio: (int, default = 1) upload size ratio of the config
+        :param chunks: (int, default = 7) upload chunk count of the config
+        :param scale: (int, default = 16) the downloads are this many times smaller than the real ones
+        :param started: (float, default = None) time.monotonic() the outages are relative to, None is now
+        """
+        self.bandwidth = bandwidth
+        self.length = length
+        self.outages = list(outages)
+        self.scale = scale
+        self.config = SPEEDTEST_CONFIG.format(length=length, threads=threads, ratio=ratio, chunks=chunks)
+        self.started = time.monotonic() if started is None else started
+        super().__init__(latency, mode)
+        # Clients hanging up mid-transfer is part of the protocol, not worth a traceback
+        self.server.handle_error = lambda request, client_address: None
+
+    def current_mode(self) -> str:
+        elapsed = time.monotonic() - self.started
+        if any(start <= elapsed < end for start, end in self.outages):
+            return DROP
+        return self.mode
+
+    def shaped(self, write, data: bytes):
+        """
+        Passes data to write in chunks, sleeping as needed to stay under 'bandwidth' bytes per second.
+        """
+        if not self.bandwidth:
+            write(data)
+            return
+        chunk = max(int(self.bandwidth / 50), 1024)
+        start = time.monotonic()
+        for offset in range(0, len(data), chunk):
+            write(data[offset:offset + chunk])
+            ahead = (offset + chunk) / self.bandwidth - (time.monotonic() - start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def local_speedtest(url: str, timeout: float = 10):
+    """
+    :param url: base URL of a SpeedtestStandIn
+    :param timeout: (float, default = 10) socket timeout of the client
+    :return: a factory of speedtest.Speedtest clients whose speedtest.net requests go to the stand-in, for
+             data_collector.SpeedtestClient
+    """
+
+    class LocalSpeedtest(speedtest.Speedtest):
+
+        def get_config(self):
+            # speedtest.net's URLs are hard-coded, so its requests are proxied to the stand-in, which serves them by
+            # path
+            self._opener = speedtest.build_opener(timeout=timeout)
+            self._opener.add_handler(urllib.request.ProxyHandler({"http": url, "https": url}))
+            return super().get_config()
+
+    return lambda: LocalSpeedtest(timeout=timeout)
+
+
+def _serve_speedtest(ports, kwargs: dict):
+    stand_in = SpeedtestStandIn(**kwargs)
+    ports.put(stand_in.port)
+    threading.Event().wait()
+
+
+def speedtest_process(**kwargs) -> tuple:
+    """
+    Runs a SpeedtestStandIn in a child process, so its CPU time isn't counted as the caller's.
+    :param kwargs: arguments of SpeedtestStandIn
+    :return: (process, base URL); terminate() the process when done
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve_speedtest, args=(ports, kwargs), daemon=True)
+    process.start()
+    return process, "http://127.0.0.1:{}/".format(ports.get(timeout=10))
+
+
+def demo():
+    timeout = 1.0
+    stand_ins = [HttpStandIn(0.1), HttpStandIn(0.5), HttpStandIn(0.8), HttpStandIn(0.2, ERROR),
+                 HttpStandIn(mode=HANG), HttpStandIn(mode=DROP)]
+    tcp = [TcpStandIn(), TcpStandIn(DROP)]
+    probe_list = [probes.HttpHeadProbe(s.url, timeout) for s in stand_ins] + \
+                 [probes.TcpProbe(t.target, timeout) for t in tcp]
+
+    start = time.perf_counter()
+    sequential = [p.run() for p in probe_list]
+    sequential_time = time.perf_counter() - start
+    start = time.perf_counter()
+    concurrent = probes.fan_out(probe_list)
+    concurrent_time = time.perf_counter() - start
+
+    for probe, result in zip(probe_list, concurrent):
+        print("{:<45} {:<6} {}".format(repr(probe), "ok" if result.ok else "FAILED",
+                                       "" if result.latency is None else "{:.0f} ms".format(result.latency)))
+    print("Verdict: {}".format("online" if probes.verdict(concurrent) else "offline"))
+    print("Sequential round: {:.2f} s, concurrent round: {:.2f} s (probe timeout {:.2f} s)".format(
+        sequential_time, concurrent_time, timeout))
+    for s in stand_ins + tcp:
+        s.close()
+
+
+if __name__ == "__main__":
+    demo()
@@ -0,0 +1,222 @@
+"""
+Persistent per-day summary index. Every day with a data file gets one row in data/summary.sqlite holding the totals of
+its analysis and its outages, along with the identity of the file they were computed from. Range summaries are then
+built from those rows, so they cost O(days) instead of a scan of every minute ever collected. Rows are refreshed
+whenever their day's file changes; the collector updates a day's row when it rolls over to the next one, and running
+this script refreshes the whole index.
+
+Each day also gets a quantile sketch of its speeds and latency (see sketch), which quantiles() merges over a range.
+Sketches outlive the minute files of days compacted into the retention tiers, so percentiles of old ranges stay
+available.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import numpy as np
+import reader
+import retention
+import sketch
+import slots
+import trck
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS days (
+    ordinal INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    first_known INTEGER NOT NULL,
+    outage_count INTEGER NOT NULL,
+    oscillation_count INTEGER NOT NULL,
+    test_minutes INTEGER NOT NULL,
+    lost_minutes INTEGER NOT NULL,
+    oscillation_minutes INTEGER NOT NULL,
+    outages TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sketches (
+    ordinal INTEGER PRIMARY KEY,
+    download BLOB NOT NULL,
+    upload BLOB NOT NULL,
+    ping BLOB NOT NULL
+);
+"""
+
+
+def index_path() -> str:
+    return os.path.join(slots.DATA_DIR, "summary.sqlite")
+
+
+def connect() -> sqlite3.Connection:
+    """
+    :return: a connection to the index, creating it if needed
+    """
+    connection = sqlite3.connect(index_path())
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _update(connection: sqlite3.Connection, day: datetime.date, identity: tuple):
+    grid = reader.cache.grid(day)
+    analysis = reader.cache.analysis(day)
+    known = np.flatnonzero(grid["status"] != slots.UNKNOWN)
+    outages = [[int(o["start"]), int(o["end"])] for o in analysis["outages"]]
+    connection.execute("INSERT OR REPLACE INTO days VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (day.toordinal(), identity[0], identity[1], identity[2],
+                        int(known[0]) if len(known) else -1,
+                        analysis["outage_count"], analysis["oscillation_count"], analysis["total_test_minutes"],
+                        analysis["total_minutes_lost"], analysis["oscillation_minutes"], json.dumps(outages)))
+    sketches = sketch.of_grid(grid)
+    connection.execute("INSERT OR REPLACE INTO sketches VALUES (?, ?, ?, ?)",
+                       (day.toordinal(),) + tuple(sketches[metric].to_bytes() for metric in sketch.METRICS))
+
+
+def update(date) -> bool:
+    """
+    Refreshes the row of a day if its file changed since it was indexed.
+    :param date: the day to update (see reader.to_date())
+    :return: True if the row was (re)written
+    """
+    day = reader.to_date(date)
+    identity = reader.cache.identity(day)
+    if identity is None:
+        return False
+    with contextlib.closing(connect()) as connection, connection:
+        row = connection.execute("SELECT path, mtime, size FROM days JOIN sketches USING (ordinal) WHERE ordinal = ?",
+                                 (day.toordinal(),)).fetchone()
+        if row == identity:
+            return False
+        _update(connection, day, identity)
+    return True
+
+
+def refresh(start, end) -> int:
+    """
+    Refreshes the rows of every day from start to end (both included) whose file changed, and drops the rows of days
+    whose files are gone.
+    :return: number of rows (re)written or dropped
+    """
+    first, last = reader.to_date(start), reader.to_date(end)
+    changed = 0
+    with contextlib.closing(connect()) as connection, connection:
+        # Rows without a sketch (indexed before there were sketches) are rebuilt like changed ones
+        indexed = {row[0]: tuple(row[1:4]) if row[4] else None for row in
+                   connection.execute("SELECT days.ordinal, path, mtime, size, sketches.ordinal IS NOT NULL FROM days "
+                                      "LEFT JOIN sketches USING (ordinal) WHERE days.ordinal BETWEEN ? AND ?",
+                                      (first.toordinal(), last.toordinal()))}
+        for ordinal in range(first.toordinal(), last.toordinal() + 1):
+            day = datetime.date.fromordinal(ordinal)
+            identity = reader.cache.identity(day)
+            if identity is None:
+                if ordinal in indexed:
+                    connection.execute("DELETE FROM days WHERE ordinal = ?", (ordinal,))
+                    if not retention.has_day(day):
+                        connection.execute("DELETE FROM sketches WHERE ordinal = ?", (ordinal,))
+                    changed += 1
+            elif indexed.get(ordinal) != identity:
+                _update(connection, day, identity)
+                changed += 1
+    return changed
+
+
+def update_all() -> int:
+    """
+    Refreshes the rows of every day in the data directory.
+    :return: number of rows (re)written
+    """
+    days = set()
+    for name in os.listdir(slots.DATA_DIR):
+        day = slots.day_of(name) or trck.day_of(name)
+        if day is not None:
+            days.add(day)
+    return sum(update(day) for day in sorted(days))
+
+
+def summary(start, end, refresh_rows: bool = True) -> dict:
+    """
+    Summary of a range built from the index, and from the daily tier (see retention) for days whose minute files were
+    compacted. Outages that run across midnight (or across days without data) are joined back together, so the result
+    matches reader.analyse() on the merged grids of the range.
+    :param start: first day (see reader.to_date())
+    :param end: last day (see reader.to_date())
+    :param refresh_rows: (bool, default = True) refreshes the rows of days whose files changed first
+    :return: same dict as reader.analyse(), minute indexes of "outages" count from start at 00:00
+    """
+    first, last = reader.to_date(start), reader.to_date(end)
+    if refresh_rows:
+        refresh(first, last)
+    with contextlib.closing(connect()) as connection:
+        rows = connection.execute("SELECT ordinal, first_known, test_minutes, lost_minutes, outages FROM days "
+                                  "WHERE ordinal BETWEEN ? AND ? ORDER BY ordinal",
+                                  (first.toordinal(), last.toordinal())).fetchall()
+    rows = [row[:4] + (json.loads(row[4]),) for row in rows]
+    indexed = {row[0] for row in rows}
+    rows = sorted(rows + [row for row in retention.day_rows(first, last) if row[0] not in indexed])
+
+    end_index = ((last - first).days + 1) * slots.MINUTES_PER_DAY
+    outages = []
+    day_end = None
+    test_time = 0
+    mins = 0
+    for ordinal, first_known, test_minutes, lost_minutes, day_outages in rows:
+        if first_known < 0:
+            continue
+        base = (ordinal - first.toordinal()) * slots.MINUTES_PER_DAY
+        test_time += test_minutes
+        mins += lost_minutes
+        day_outages = [[base + s, base + e] for s, e in day_outages]
+        if outages and outages[-1][1] == day_end:
+            # The previous day ended offline: its outage goes on until this day's first online minute
+            if day_outages and day_outages[0][0] == base + first_known:
+                outages[-1][1] = day_outages.pop(0)[1]
+            else:
+                outages[-1][1] = base + first_known
+        outages.extend(day_outages)
+        day_end = base + slots.MINUTES_PER_DAY
+
+    ret = np.zeros(len(outages), dtype=reader.OUTAGE)
+    if outages:
+        ret["start"], ret["end"] = np.array(outages).T
+    ret["ongoing"] = ret["end"] == day_end
+    ret["end"][ret["ongoing"]] = end_index
+    ret["duration"] = ret["end"] - ret["start"]
+    ret["oscillation"] = ~ret["ongoing"] & (ret["duration"] <= reader.OSCILLATION_MINUTES)
+    fluc_mins = int(ret["duration"][ret["oscillation"]].sum())
+    return {"outages": ret,
+            "outage_count": len(ret),
+            "oscillation_count": int(np.count_nonzero(ret["oscillation"])),
+            "total_test_minutes": test_time,
+            "total_minutes_lost": mins,
+            "oscillation_minutes": fluc_mins,
+            "total_loss_percentage": 100 * (mins / test_time) if test_time else 0,
+            "oscillation_loss_percentage": 100 * (fluc_mins / test_time) if test_time else 0}
+
+
+def quantiles(start, end, qs: tuple = sketch.QUANTILES, refresh_rows: bool = True) -> dict:
+    """
+    Quantiles of the speeds and latency of a range, from the merged sketches of its days, in O(days).
+    :param start: first day (see reader.to_date())
+    :param end: last day (see reader.to_date())
+    :param qs: (tuple, default = sketch.QUANTILES) the quantiles wanted, from 0 to 1
+    :param refresh_rows: (bool, default = True) refreshes the rows of days whose files changed first
+    :return: {"samples": number of speedtests, "download": {q: KiloBits per second}, "upload": {...},
+              "ping": {q: MilliSeconds}}, within sketch.ACCURACY of the exact quantiles. nan without any speedtest
+    """
+    first, last = reader.to_date(start), reader.to_date(end)
+    if refresh_rows:
+        refresh(first, last)
+    with contextlib.closing(connect()) as connection:
+        rows = connection.execute("SELECT download, upload, ping FROM sketches WHERE ordinal BETWEEN ? AND ?",
+                                  (first.toordinal(), last.toordinal())).fetchall()
+    ret = {}
+    for i, metric in enumerate(sketch.METRICS):
+        merged = sketch.Sketch.merge(sketch.Sketch.from_bytes(row[i]) for row in rows)
+        ret["samples"] = merged.count
+        ret[metric] = {q: merged.quantile(q) for q in qs}
+    return ret
+
+
+if __name__ == "__main__":
+    print("Updated {} day(s)".format(update_all()))
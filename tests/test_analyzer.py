@@ -0,0 +1,131 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import analyzer
+import reader
+import slots
+import trck
+
+FIRST = datetime.date(2020, 3, 1)
+
+
+def at(day: int, minute: int) -> datetime.datetime:
+    return datetime.datetime.combine(FIRST + datetime.timedelta(days=day), datetime.time()) + \
+        datetime.timedelta(minutes=minute)
+
+
+class AnalyzerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        reader.cache.clear()
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        reader.cache.clear()
+        shutil.rmtree(self.data_dir)
+
+    def assert_same(self, result: dict, expected: dict):
+        self.assertEqual(result.keys(), expected.keys())
+        for key in expected:
+            if key == "outages":
+                np.testing.assert_array_equal(result[key], expected[key])
+            else:
+                self.assertEqual(result[key], expected[key], key)
+
+    def test_days_fed_equal_the_analysis_of_their_merged_grids(self):
+        rng = np.random.default_rng(1)
+        days = 4
+        status = rng.choice([slots.ONLINE, slots.ONLINE, slots.ONLINE, slots.OFFLINE, slots.UNKNOWN],
+                            days * slots.MINUTES_PER_DAY).astype(np.uint8)
+        # An outage open across midnight, and one still going on at the end
+        status[slots.MINUTES_PER_DAY - 30:slots.MINUTES_PER_DAY + 40] = slots.OFFLINE
+        status[-25:] = slots.OFFLINE
+        for day in range(days):
+            grid = slots.empty_grid()
+            grid["status"] = status[day * slots.MINUTES_PER_DAY:(day + 1) * slots.MINUTES_PER_DAY]
+            slots.write_grid(FIRST + datetime.timedelta(days=day), grid)
+
+        last = FIRST + datetime.timedelta(days=days - 1)
+        live = analyzer.Analyzer(FIRST)
+        live.catch_up(last)
+        expected = reader.analyse(status)
+        self.assert_same(live.result(last), expected)
+        self.assertTrue(any(o["start"] < slots.MINUTES_PER_DAY < o["end"] for o in expected["outages"]))
+        self.assertTrue(expected["outages"]["ongoing"][-1])
+
+    def write(self, data: bytes):
+        with open(trck.path(FIRST), 'ab') as file:
+            file.write(data)
+
+    def test_consume_reads_appended_records_only(self):
+        self.write(b"".join(trck.frame(m, at(0, m), 1000, 100, 20) for m in (1, 2, 3)))
+        live = analyzer.Analyzer(FIRST)
+        self.assertEqual(live.consume(FIRST), 3)
+        self.assertEqual(live.consume(FIRST), 0)
+
+        offline = trck.frame(5, at(0, 5), -1, -1, -1)
+        self.write(trck.frame(4, at(0, 4), 1000, 100, 20) + offline[:10])
+        self.assertEqual(live.consume(FIRST), 1)
+        # The record still being written is left for the next call
+        self.assertEqual(live.offsets[trck.path(FIRST)], os.path.getsize(trck.path(FIRST)) - 10)
+        self.write(offline[10:])
+        self.assertEqual(live.consume(FIRST), 1)
+        self.assertEqual(live.offsets[trck.path(FIRST)], os.path.getsize(trck.path(FIRST)))
+        self.assertEqual((live.test_minutes, live.lost_minutes, live.open), (5, 1, 5))
+
+    def test_a_rewritten_file_loses_the_state(self):
+        self.write(b"".join(trck.frame(m, at(0, m), 1000, 100, 20) for m in (1, 2, 3)))
+        live = analyzer.Analyzer(FIRST)
+        live.consume(FIRST)
+        with open(trck.path(FIRST), 'wb') as file:
+            file.write(trck.frame(1, at(0, 1), 1000, 100, 20))
+        with self.assertRaises(analyzer.StateLost):
+            live.consume(FIRST)
+
+    def test_checkpoint_round_trip(self):
+        self.write(b"".join(trck.frame(m, at(0, m), -1 if m in (3, 4, 9) else 1000, 100, 20) for m in range(1, 11)))
+        live = analyzer.Analyzer(FIRST)
+        live.consume(FIRST)
+        path = analyzer.checkpoint_path("test")
+        live.save(path)
+        loaded = analyzer.Analyzer.load(path)
+        self.assert_same(loaded.result(FIRST), live.result(FIRST))
+        self.assertEqual((loaded.day, loaded.last, loaded.offsets), (live.day, live.last, live.offsets))
+        # It goes on from where the saved one was
+        self.write(trck.frame(11, at(0, 11), 1000, 100, 20))
+        self.assertEqual(loaded.consume(FIRST), 1)
+
+    def test_checkpoints_of_another_version_are_not_loaded(self):
+        live = analyzer.Analyzer(FIRST)
+        path = analyzer.checkpoint_path("test")
+        live.save(path)
+        with open(path) as file:
+            state = json.load(file)
+
+        def load(**changes):
+            with open(path, 'w') as file:
+                json.dump({k: v for k, v in dict(state, **changes).items() if v is not ...}, file)
+            return analyzer.Analyzer.load(path)
+
+        # Unknown fields are left out
+        loaded = load(feed="not a method", extra=1)
+        self.assertEqual(loaded.result(FIRST)["total_test_minutes"], 0)
+        self.assertTrue(callable(loaded.feed))
+        self.assertFalse(hasattr(loaded, "extra"))
+        # Missing or mistyped ones lose the checkpoint
+        self.assertIsNone(load(offsets=...))
+        self.assertIsNone(load(last="12"))
+        self.assertIsNone(load(outages=[[1]]))
+        self.assertIsNone(load(offsets=[]))
+        self.assertIsNone(load(open=1.5))
+        self.assertIsNone(load(origin=None))
+
+
+if __name__ == "__main__":
+    unittest.main()
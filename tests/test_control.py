@@ -0,0 +1,127 @@
+import contextlib
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import control
+import data_collector
+import scheduler
+import slots
+
+
+class FakeClient:
+    """
+    Stands in for data_collector.SpeedtestClient, answering at once.
+    """
+
+    phases = {}
+
+    def test(self) -> tuple:
+        return 10 ** 7, 10 ** 6, 20.0
+
+
+class ControlServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old = slots.DATA_DIR, data_collector._client
+        slots.DATA_DIR, data_collector._client = self.data_dir, FakeClient()
+        self.control = data_collector.Control(0.1)
+        self.server = data_collector.ControlServer(self.control, exit_on_stop=False)
+        self.output = io.StringIO()
+        self.monitor = threading.Thread(target=self.run_monitor, daemon=True)
+        self.monitor.start()
+
+    def run_monitor(self):
+        with contextlib.redirect_stdout(self.output):
+            data_collector.monitor(0.1, light_probes=(), keep_minutes=None, compression=None,
+                                   collector_control=self.control)
+
+    def tearDown(self):
+        self.control.stop()
+        self.server.close()
+        self.monitor.join(5)
+        slots.DATA_DIR, data_collector._client = self.old
+        shutil.rmtree(self.data_dir)
+
+    def send(self, line: bytes) -> dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(5)
+            connection.connect(self.server.path)
+            connection.sendall(line + b"\n")
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        return json.loads(data)
+
+    def tick(self) -> int:
+        return control.Request("status", self.server.path).wait(5)["tick"]
+
+    def assert_still_running(self):
+        tick = self.tick()
+        time.sleep(0.35)
+        self.assertTrue(self.monitor.is_alive())
+        self.assertGreater(self.tick(), tick)
+
+    def test_requests_that_are_not_objects(self):
+        for line in (b"[1, 2]", b'"stop"', b"42", b"null", b"{not json"):
+            response = self.send(line)
+            self.assertFalse(response["ok"], line)
+            self.assertTrue(response["error"].startswith("Bad request"), line)
+        self.assert_still_running()
+
+    def test_intervals_that_are_not_finite(self):
+        for interval in ("nan", "inf", "-inf", "0", "-5", "soon"):
+            response = self.send(json.dumps({"command": "reconfigure", "interval": interval}).encode())
+            self.assertFalse(response["ok"], interval)
+        self.assertEqual(self.control.interval, 0.1)
+        self.assert_still_running()
+
+    def test_reconfigure(self):
+        self.assertTrue(self.send(b'{"command": "reconfigure", "interval": 0.05}')["ok"])
+        self.assert_still_running()
+        self.assertEqual(self.control.scheduler.interval, 0.05)
+
+
+class MonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old = slots.DATA_DIR, data_collector._client
+        slots.DATA_DIR, data_collector._client = self.data_dir, FakeClient()
+
+    def tearDown(self):
+        slots.DATA_DIR, data_collector._client = self.old
+        shutil.rmtree(self.data_dir)
+
+    def test_returns_once_its_compaction_is_done(self):
+        done = threading.Event()
+
+        def compact(today, keep_minutes):
+            time.sleep(0.5)
+            done.set()
+            return 0, 0
+
+        with mock.patch("data_collector.retention.compact", compact), contextlib.redirect_stdout(io.StringIO()):
+            data_collector.monitor(0.05, ticks=1, light_probes=(), compression=None)
+        self.assertTrue(done.is_set())
+
+
+class SchedulerIntervalTest(unittest.TestCase):
+
+    def test_interval_must_be_positive_and_finite(self):
+        for interval in (float("nan"), float("inf"), 0, -1):
+            with self.assertRaises(ValueError):
+                scheduler.Scheduler(interval, lambda tick, lag: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import heatmap
+import reader
+import slots
+
+
+class PickLevelTest(unittest.TestCase):
+
+    def heatmap(self, days: int) -> heatmap.ZoomableHeatmap:
+        fig, ax = plt.subplots()
+        self.addCleanup(plt.close, fig)
+        return heatmap.ZoomableHeatmap(ax, np.full((days, slots.MINUTES_PER_DAY), slots.ONLINE, dtype=np.uint8),
+                                       datetime.date(2020, 1, 1))
+
+    def test_short_histories_only_pick_existing_levels(self):
+        for days in (1, 5, 10, 29):
+            zoomable = self.heatmap(days)
+            level = zoomable.pick_level(3000, slots.MINUTES_PER_DAY, 1, 1)
+            self.assertIn(level, zoomable.levels)
+            self.assertLessEqual(level[0], days)
+
+    def test_zooming_out_a_short_history(self):
+        zoomable = self.heatmap(10)
+        zoomable.ax.set_xlim(zoomable.x0 - 50000, zoomable.x0 + 50000)
+        self.assertIn(zoomable.level, zoomable.levels)
+
+    def test_long_histories_pick_the_coarsest_level(self):
+        self.assertEqual(self.heatmap(90).pick_level(3000, slots.MINUTES_PER_DAY, 1, 1), (30, 1440))
+
+
+class UpdateDaysTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        reader.cache.clear()
+        self.first = datetime.date(2020, 1, 1)
+        self.last = self.first + datetime.timedelta(days=39)
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        reader.cache.clear()
+        shutil.rmtree(self.data_dir)
+
+    def write(self, day: datetime.date, minute: int, status: int):
+        slots.write_sample(datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(minutes=minute), 1,
+                           10000 if status == slots.ONLINE else -1, 1000, 20)
+
+    def test_matches_a_full_rebuild(self):
+        for i in range(0, 40, 3):
+            self.write(self.first + datetime.timedelta(days=i), i * 7, slots.ONLINE)
+        matrix = heatmap.status_matrix(self.first, self.last)
+        levels = heatmap.pyramid(matrix)
+        changed = {self.first + datetime.timedelta(days=i) for i in (0, 31, 39)}
+        for day in changed:
+            self.write(day, 600, slots.OFFLINE)
+        reader.cache.clear()
+
+        updated, updated_levels = heatmap.update_days(matrix, levels, self.first, changed | {self.last.replace(2021)})
+        rebuilt = heatmap.status_matrix(self.first, self.last)
+        np.testing.assert_array_equal(updated, rebuilt)
+        expected = heatmap.pyramid(rebuilt)
+        self.assertEqual(updated_levels.keys(), expected.keys())
+        for key in expected:
+            np.testing.assert_array_equal(updated_levels[key], expected[key], err_msg=str(key))
+        # the arguments are left alone, the GUI may still be drawing them
+        self.assertFalse((matrix == slots.OFFLINE).any())
+        self.assertFalse((levels[(30, 1440)] == slots.OFFLINE).any())
+
+    def test_nothing_changed_in_range(self):
+        matrix = heatmap.status_matrix(self.first, self.last)
+        levels = heatmap.pyramid(matrix)
+        self.assertIs(heatmap.update_days(matrix, levels, self.first, {self.last.replace(2021)})[0], matrix)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import datetime
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import probes
+import slots
+import standins
+
+
+class SlowProbe(probes.Probe):
+    """
+    Ignores its own timeout, like a probe stuck in a call that can't be interrupted.
+    """
+
+    kind = "slow"
+
+    def __init__(self, target: str, seconds: float, timeout: float = 0.2):
+        super().__init__(target, timeout)
+        self.seconds = seconds
+        self.released = threading.Event()
+
+    def measure(self) -> tuple:
+        self.released.wait(self.seconds)
+        return None, None
+
+
+def result(ok: bool) -> probes.Result:
+    return probes.Result(datetime.datetime.now(), "tcp", "127.0.0.1:1", ok, 1.0 if ok else None, None, None)
+
+
+class FanOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stand_ins = []
+
+    def tearDown(self):
+        for stand_in in self.stand_ins:
+            stand_in.close()
+
+    def stand_in(self, stand_in):
+        self.stand_ins.append(stand_in)
+        return stand_in
+
+    def test_results_keep_the_order_of_the_probes(self):
+        up, down = self.stand_in(standins.TcpStandIn()), self.stand_in(standins.TcpStandIn(standins.DROP))
+        probe_list = [probes.TcpProbe(down.target, 1), probes.TcpProbe(up.target, 1), probes.TcpProbe(down.target, 1)]
+        results = probes.fan_out(probe_list)
+        self.assertEqual([r.ok for r in results], [False, True, False])
+        self.assertEqual([r.target for r in results], [p.target for p in probe_list])
+        self.assertIsNotNone(results[1].latency)
+        self.assertIsNone(results[0].latency)
+
+    def test_probes_run_concurrently(self):
+        probe_list = [probes.HttpHeadProbe(self.stand_in(standins.HttpStandIn(0.3)).url, 2) for _ in range(5)]
+        start = time.perf_counter()
+        results = probes.fan_out(probe_list)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_a_hanging_target_times_out_alone(self):
+        hanging = self.stand_in(standins.HttpStandIn(mode=standins.HANG))
+        fast = self.stand_in(standins.HttpStandIn())
+        start = time.perf_counter()
+        results = probes.fan_out([probes.HttpHeadProbe(hanging.url, 0.3), probes.HttpHeadProbe(fast.url, 0.3)])
+        hanging.released.set()
+        self.assertEqual([r.ok for r in results], [False, True])
+        self.assertLess(time.perf_counter() - start, 0.3 + probes.FAN_OUT_GRACE)
+
+    def test_probes_past_the_deadline_count_as_failed(self):
+        stuck = SlowProbe("stuck", 10)
+        start = time.perf_counter()
+        results = probes.fan_out([stuck, SlowProbe("quick", 0)])
+        elapsed = time.perf_counter() - start
+        stuck.released.set()
+        self.assertEqual([r.ok for r in results], [False, True])
+        self.assertEqual(results[0].target, "stuck")
+        self.assertLess(elapsed, stuck.timeout + probes.FAN_OUT_GRACE + 0.5)
+
+    def test_one_pool_is_shared_by_concurrent_callers(self):
+        pool = probes._pool
+        threads = [threading.Thread(target=probes.fan_out, args=([SlowProbe(str(i), 0.05)],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertIs(probes._pool, pool)
+
+
+class VerdictTest(unittest.TestCase):
+
+    def test_one_answering_target_is_enough(self):
+        self.assertTrue(probes.verdict([result(False), result(True), result(False)]))
+
+    def test_every_target_failing_is_an_outage(self):
+        self.assertFalse(probes.verdict([result(False), result(False)]))
+        self.assertFalse(probes.verdict([]))
+
+    def test_quorum(self):
+        mixed = [result(True), result(False), result(True)]
+        self.assertTrue(probes.verdict(mixed, quorum=2))
+        self.assertFalse(probes.verdict(mixed, quorum=3))
+
+
+class MinuteVerdictTest(unittest.TestCase):
+
+    def test_most_rounds_decide(self):
+        self.assertTrue(probes.minute_verdict([[result(True)], [result(False)]])[0])
+        self.assertFalse(probes.minute_verdict([[result(False)], [result(True)], [result(False)]])[0])
+
+    def test_median_latency_per_target(self):
+        rounds = [[result(True)._replace(latency=latency), result(False)._replace(target="b")]
+                  for latency in (1.0, 5.0, 2.0)]
+        self.assertEqual(probes.minute_verdict(rounds)[1], [("tcp", "127.0.0.1:1", 2.0), ("tcp", "b", None)])
+
+
+class LogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        shutil.rmtree(self.data_dir)
+
+    def test_results_go_to_the_logs_of_their_days(self):
+        midnight = datetime.datetime(2020, 1, 2)
+        found = [result(i % 2 == 0)._replace(when=midnight + datetime.timedelta(seconds=s), target="a,{}".format(i))
+                 for i, s in enumerate((-2, -1, 0, 1, 2))]
+        with mock.patch("builtins.open", wraps=open) as opened:
+            probes.log(found)
+        # One open per day, not per result
+        self.assertEqual(opened.call_count, 2)
+        self.assertEqual(probes.read_log(midnight.date() - datetime.timedelta(days=1)), found[:2])
+        self.assertEqual(probes.read_log(midnight.date()), found[2:])
+
+
+if __name__ == "__main__":
+    unittest.main()
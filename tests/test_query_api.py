@@ -0,0 +1,175 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import numpy as np
+import query_api
+import reader
+import slots
+
+
+def grid(statuses: dict) -> np.ndarray:
+    """
+    :param statuses: {minute: status}
+    :return: a day grid with those minutes written, online ones at 10 Mbps
+    """
+    day = slots.empty_grid()
+    for minute, status in statuses.items():
+        day[minute] = (1, 10000 if status == slots.ONLINE else -1, 1000 if status == slots.ONLINE else -1, 20, status)
+    return day
+
+
+class QueryServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        reader.cache.clear()
+        self.today = datetime.date.today()
+        self.yesterday = self.today - datetime.timedelta(days=1)
+        slots.write_grid(self.yesterday, grid({600: slots.ONLINE, 601: slots.OFFLINE, 602: slots.OFFLINE,
+                                               603: slots.ONLINE}))
+        slots.write_grid(self.today, grid({0: slots.ONLINE, 1: slots.ONLINE}))
+        self.server = query_api.QueryServer(0)
+
+    def tearDown(self):
+        self.server.close()
+        slots.DATA_DIR = self.old_data_dir
+        reader.cache.clear()
+        shutil.rmtree(self.data_dir)
+
+    def get(self, path: str, headers: dict = None) -> tuple:
+        """
+        :return: (status code, headers, body decoded from JSON or None without one)
+        """
+        request = urllib.request.Request(self.server.url + path.lstrip('/'), headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                body = response.read()
+                return response.status, response.headers, json.loads(body) if body else None
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            return e.code, e.headers, json.loads(body) if body else None
+
+    def test_status_is_the_latest_known_minute(self):
+        code, _, body = self.get("/status")
+        self.assertEqual(code, 200)
+        self.assertEqual(body["status"], "online")
+        self.assertEqual(body["time"], "{}T00:01".format(self.today.isoformat()))
+        self.assertEqual(body["download"], 10000)
+
+    def test_summary_and_outages(self):
+        code, _, body = self.get("/summary?start={}&end={}".format(self.yesterday.isoformat(), self.today.isoformat()))
+        self.assertEqual(code, 200)
+        self.assertEqual(body["outage_count"], 1)
+        self.assertEqual(body["total_minutes_lost"], 2)
+        self.assertNotIn("outages", body)
+        code, _, body = self.get("/outages?start={}".format(self.yesterday.strftime("%d/%m/%Y")))
+        self.assertEqual(code, 200)
+        self.assertEqual(len(body["outages"]), 1)
+        self.assertEqual(body["outages"][0]["start"], "{}T10:01".format(self.yesterday.isoformat()))
+
+    def test_series_is_streamed(self):
+        code, headers, body = self.get("/series?start={0}&end={0}&step=60".format(self.yesterday.isoformat()))
+        self.assertEqual(code, 200)
+        self.assertEqual(headers["Transfer-Encoding"], "chunked")
+        self.assertEqual(len(body["points"]), 24)
+        self.assertEqual(body["points"][10][1], "offline")
+        self.assertEqual(body["points"][10][5:], [2, 2])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get("/nothing")[0], 404)
+        code, _, body = self.get("/summary?start=yesterday")
+        self.assertEqual(code, 400)
+        self.assertIn("Bad date", body["error"])
+        self.assertEqual(self.get("/summary?start={}&end={}".format(self.today, self.yesterday))[0], 400)
+        self.assertEqual(self.get("/quantiles?q=2")[0], 400)
+        self.assertEqual(self.get("/series?step=0")[0], 400)
+
+    def test_etag(self):
+        code, headers, _ = self.get("/status")
+        self.assertEqual(code, 200)
+        code, _, body = self.get("/status", {"If-None-Match": headers["ETag"]})
+        self.assertEqual(code, 304)
+        self.assertIsNone(body)
+
+    def test_results_are_cached_until_their_day_changes(self):
+        first = self.get("/status")
+        self.assertEqual(self.server.results.misses, 1)
+        self.assertEqual(self.get("/status")[2], first[2])
+        self.assertEqual(self.server.results.hits, 1)
+
+        slots.write_sample(datetime.datetime.combine(self.today, datetime.time(0, 5)), 2, -1, -1, -1)
+        path = slots.slot_path(self.today)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        code, headers, body = self.get("/status", {"If-None-Match": first[1]["ETag"]})
+        self.assertEqual(code, 200)
+        self.assertNotEqual(headers["ETag"], first[1]["ETag"])
+        self.assertEqual(body["status"], "offline")
+        self.assertEqual(body["time"], "{}T00:05".format(self.today.isoformat()))
+        self.assertEqual(self.server.results.misses, 2)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_concurrent_requests_share_one_build(self):
+        results = query_api.ResultCache()
+        started, release = threading.Event(), threading.Event()
+        builds = []
+
+        def build():
+            builds.append(1)
+            started.set()
+            release.wait(5)
+            return "built"
+
+        got = []
+        threads = [threading.Thread(target=lambda: got.append(results.get(("/x", ()), (1,), build))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(got, ["built"] * 4)
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results.misses, 1)
+
+    def test_hits_do_not_wait_for_a_build(self):
+        results = query_api.ResultCache()
+        results.get(("/cached", ()), (1,), lambda: "cached")
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return "slow"
+
+        thread = threading.Thread(target=results.get, args=(("/slow", ()), (1,), slow))
+        thread.start()
+        started.wait(5)
+        try:
+            self.assertEqual(results.get(("/cached", ()), (1,), lambda: "rebuilt"), "cached")
+        finally:
+            release.set()
+            thread.join(5)
+
+    def test_a_failed_build_is_not_cached(self):
+        results = query_api.ResultCache()
+
+        def fail():
+            raise OSError("gone")
+
+        with self.assertRaises(OSError):
+            results.get(("/x", ()), (1,), fail)
+        self.assertEqual(results.get(("/x", ()), (1,), lambda: "built"), "built")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import generate_history
+import metrics
+import probes
+import reader
+import retention
+import slots
+import summary_index
+import trck
+
+FIRST = datetime.date(2020, 1, 1)
+DAYS = 6
+LAST = FIRST + datetime.timedelta(days=DAYS - 1)
+
+
+class CompactTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        reader.cache.clear()
+        generate_history.generate(FIRST, DAYS, midnight_rate=0.5, with_slots=True, seed=5)
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        reader.cache.clear()
+        shutil.rmtree(self.data_dir)
+
+    def compact(self, days: int) -> tuple:
+        """
+        Compacts the first 'days' days.
+        """
+        found = retention.compact(FIRST + datetime.timedelta(days=days + 1), keep_minutes=1)
+        reader.cache.clear()
+        return found
+
+    def test_compacted_days_answer_as_before(self):
+        summary = summary_index.summary(FIRST, LAST)
+        quantiles = summary_index.quantiles(FIRST, LAST)
+        series = reader.series(FIRST, LAST, 60)[0]
+        self.assertGreater(summary["outage_count"], 0)
+
+        self.assertEqual(self.compact(4), (4, 0))
+        self.assertEqual(retention.minute_days(), [LAST - datetime.timedelta(days=1), LAST])
+
+        after = summary_index.summary(FIRST, LAST)
+        self.assertEqual(after.keys(), summary.keys())
+        for key in summary:
+            if key == "outages":
+                np.testing.assert_array_equal(after[key], summary[key])
+            else:
+                self.assertEqual(after[key], summary[key], key)
+        self.assertEqual(summary_index.quantiles(FIRST, LAST), quantiles)
+        found, exact = reader.series(FIRST, LAST, 60)
+        self.assertTrue(exact)
+        self.assertEqual(found.dtype, series.dtype)
+        for field in series.dtype.names:
+            np.testing.assert_allclose(found[field], series[field], rtol=1e-6, err_msg=field)
+
+    def test_logs_are_deleted_with_the_minute_files(self):
+        for day in range(DAYS):
+            for path in (probes.log_path(FIRST + datetime.timedelta(days=day)),
+                         metrics.log_path(FIRST + datetime.timedelta(days=day))):
+                with open(path, 'w') as file:
+                    file.write("\n")
+        # A log without minute files goes too
+        alone = FIRST - datetime.timedelta(days=3)
+        with open(probes.log_path(alone), 'w') as file:
+            file.write("\n")
+
+        self.compact(4)
+        self.assertFalse(os.path.exists(probes.log_path(alone)))
+        for day in [FIRST + datetime.timedelta(days=d) for d in range(DAYS)]:
+            kept = day >= FIRST + datetime.timedelta(days=4)
+            self.assertEqual(os.path.exists(trck.path(day)), kept, day)
+            self.assertEqual(os.path.exists(probes.log_path(day)), kept, day)
+            self.assertEqual(os.path.exists(metrics.log_path(day)), kept, day)
+
+    def test_log_day(self):
+        self.assertEqual(retention.log_day("02_01_2020.probes"), datetime.date(2020, 1, 2))
+        self.assertEqual(retention.log_day("02_01_2020.metrics"), datetime.date(2020, 1, 2))
+        self.assertIsNone(retention.log_day("02_01_2020.trck"))
+        self.assertIsNone(retention.log_day("collector.probes"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import datetime
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import reader
+import sketch
+import slots
+import summary_index
+
+
+def exact(values: np.ndarray, q: float) -> float:
+    """
+    :return: the value of rank q * (count - 1), as Sketch.quantile() answers it
+    """
+    return float(np.quantile(values, q, method="lower"))
+
+
+class SketchTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        # Speeds over a few orders of magnitude, as download speeds in KiloBits per second are
+        self.values = np.concatenate([rng.lognormal(9, 1.5, 5000), rng.uniform(1, 50, 500), np.zeros(40)])
+
+    def test_quantiles_are_within_accuracy(self):
+        found = sketch.Sketch.of(self.values)
+        for q in (0, 0.001, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 0.999, 1):
+            expected = exact(self.values, q)
+            if expected == 0:
+                self.assertEqual(found.quantile(q), 0, q)
+            else:
+                self.assertLessEqual(abs(found.quantile(q) - expected) / expected, sketch.ACCURACY, q)
+
+    def test_empty(self):
+        self.assertTrue(np.isnan(sketch.Sketch().quantile(0.5)))
+        self.assertTrue(np.isnan(sketch.Sketch.merge([]).quantile(0.5)))
+
+    def test_merge_is_the_sketch_of_the_concatenation(self):
+        parts = np.array_split(self.values, 7)
+        merged = sketch.Sketch.merge(sketch.Sketch.of(part) for part in parts)
+        whole = sketch.Sketch.of(self.values)
+        np.testing.assert_array_equal(merged.keys, whole.keys)
+        np.testing.assert_array_equal(merged.counts, whole.counts)
+        self.assertEqual(merged.zeros, whole.zeros)
+        self.assertEqual(merged.count, len(self.values))
+
+    def test_bytes_round_trip(self):
+        for values in (self.values, np.zeros(3), np.array([])):
+            found = sketch.Sketch.of(values)
+            back = sketch.Sketch.from_bytes(found.to_bytes())
+            np.testing.assert_array_equal(back.keys, found.keys)
+            np.testing.assert_array_equal(back.counts, found.counts)
+            self.assertEqual(back.zeros, found.zeros)
+
+    def test_counts_that_do_not_fit_are_refused(self):
+        big = sketch.Sketch(np.array([1], dtype=np.int32), np.array([sketch.MAX_COUNT + 1], dtype=np.int64))
+        with self.assertRaises(OverflowError):
+            big.to_bytes()
+        with self.assertRaises(OverflowError):
+            sketch.Sketch(zeros=sketch.MAX_COUNT + 1).to_bytes()
+        fits = sketch.Sketch(np.array([1], dtype=np.int32), np.array([sketch.MAX_COUNT], dtype=np.int64))
+        self.assertEqual(sketch.Sketch.from_bytes(fits.to_bytes()).counts[0], sketch.MAX_COUNT)
+
+
+class IndexedSketchesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        reader.cache.clear()
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        reader.cache.clear()
+        shutil.rmtree(self.data_dir)
+
+    def test_quantiles_of_a_range(self):
+        rng = np.random.default_rng(3)
+        first = datetime.date(2020, 1, 1)
+        grids = []
+        for day in range(5):
+            grid = slots.empty_grid()
+            tested = rng.random(slots.MINUTES_PER_DAY) < 0.8
+            grid["download"] = np.where(tested, rng.lognormal(9, 1, slots.MINUTES_PER_DAY), -1)
+            grid["upload"] = np.where(tested, rng.lognormal(7, 1, slots.MINUTES_PER_DAY), -1)
+            grid["ping"] = np.where(tested, rng.uniform(5, 200, slots.MINUTES_PER_DAY), -1)
+            grid["status"] = np.where(tested, slots.ONLINE, slots.OFFLINE)
+            slots.write_grid(first + datetime.timedelta(days=day), grid)
+            grids.append(grid)
+        merged = np.concatenate(grids)
+        tested = merged[merged["download"] > 0]
+
+        found = summary_index.quantiles(first, first + datetime.timedelta(days=4), (0.05, 0.5, 0.95))
+        self.assertEqual(found["samples"], len(tested))
+        for metric in sketch.METRICS:
+            for q, value in found[metric].items():
+                expected = exact(tested[metric].astype(np.float64), q)
+                self.assertLessEqual(abs(value - expected) / expected, sketch.ACCURACY, (metric, q))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import slots
+import trck
+
+DAY = datetime.date(2020, 3, 1)
+
+
+def minute(m: int) -> datetime.datetime:
+    return datetime.datetime.combine(DAY, datetime.time()) + datetime.timedelta(minutes=m)
+
+
+def framed(*runs) -> list:
+    """
+    :return: the lines of framed records of those runs, one per minute
+    """
+    return b"".join(trck.frame(run, minute(run), 1000.0 + run, 100.0, 20.0) for run in runs).decode().splitlines(
+        keepends=True)
+
+
+class FramingTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        record = trck.frame(7, minute(7), 1234.5, 99.0, 21.5, [("tcp", "1.1.1.1:53", 3.25), ("dns", "a b", None)])
+        rows, valid = trck.parse(record.decode().splitlines(keepends=True))
+        self.assertEqual(rows, [[7, "01/03/2020 00:07", 1234.5, 99.0, 21.5,
+                                 {("tcp", "1.1.1.1:53"): 3.25, ("dns", "a b"): None}]])
+        self.assertEqual(valid, 7)
+
+    def test_corrupt_checksum_is_skipped(self):
+        lines = framed(1, 2, 3)
+        lines[7] = "9999.00\n"     # download of run 2
+        rows, valid = trck.parse(lines)
+        self.assertEqual([row[0] for row in rows], [1, 3])
+        self.assertEqual(valid, 15)
+
+    def test_wrong_count_is_skipped(self):
+        lines = trck.frame(1, minute(1), 1000, 100, 20, [("tcp", "x", 1.0)]).decode().splitlines(keepends=True)
+        # The header claims two probe lines, which takes the next record's header as one, and the checksum fails
+        lines[0] = lines[0].replace("+1", "+2")
+        rows, _ = trck.parse(lines + framed(2))
+        self.assertEqual([row[0] for row in rows], [2])
+
+    def test_resyncs_on_the_next_header(self):
+        garbage = ["12:\n", "not a date\n", "x\n", "3:deadbeef\n"]
+        rows, _ = trck.parse(framed(1) + garbage + framed(2))
+        self.assertEqual([row[0] for row in rows], [1, 2])
+
+    def test_legacy_records(self):
+        lines = ["1:\n", "01/03/2020 00:01\n", "1000.00\n", "100.00\n", "20.5\n",
+                 "2:\n", "01/03/2020 00:02\n", "-1\n", "-1\n", "-1\n"]
+        rows, valid = trck.parse(lines + framed(3))
+        self.assertEqual(rows[:2], [[1, "01/03/2020 00:01", 1000.0, 100.0, 20.5],
+                                    [2, "01/03/2020 00:02", -1.0, -1.0, -1.0]])
+        self.assertEqual([row[0] for row in rows], [1, 2, 3])
+        self.assertEqual(valid, 15)
+
+    def test_torn_tail_is_not_valid(self):
+        lines = framed(1, 2)
+        rows, valid = trck.parse(lines[:8])
+        self.assertEqual([row[0] for row in rows], [1])
+        self.assertEqual(valid, 5)
+
+
+class WriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+
+    def tearDown(self):
+        slots.DATA_DIR = self.old_data_dir
+        shutil.rmtree(self.data_dir)
+
+    def read(self) -> list:
+        with trck.open_day(DAY) as file:
+            return trck.parse(file.readlines())[0]
+
+    def test_recover_truncates_a_torn_tail(self):
+        whole = trck.frame(1, minute(1), 1000, 100, 20)
+        with open(trck.path(DAY), 'wb') as file:
+            file.write(whole + trck.frame(2, minute(2), 1000, 100, 20)[:-9])
+        self.assertEqual(trck.recover(trck.path(DAY)), len(trck.frame(2, minute(2), 1000, 100, 20)) - 9)
+        with open(trck.path(DAY), 'rb') as file:
+            self.assertEqual(file.read(), whole)
+        self.assertEqual(trck.recover(trck.path(DAY)), 0)
+
+    def test_writer_recovers_before_appending(self):
+        with open(trck.path(DAY), 'wb') as file:
+            file.write(trck.frame(1, minute(1), 1000, 100, 20) + b"2:0badf00d\n01/03/2020 00:0")
+        writer = trck.Writer()
+        writer.write(3, minute(3), 1000, 100, 20)
+        writer.close()
+        self.assertGreater(writer.recovered, 0)
+        self.assertEqual([row[0] for row in self.read()], [1, 3])
+
+    def test_sync_every_n_records(self):
+        writer = trck.Writer(sync_records=3)
+        with mock.patch.object(trck.os, "fsync") as fsync:
+            for run in range(1, 8):
+                writer.write(run, minute(run), 1000, 100, 20)
+            self.assertEqual(fsync.call_count, 2)
+            writer.close()
+            # close() syncs the record left
+            self.assertEqual(fsync.call_count, 3)
+        self.assertEqual(len(self.read()), 7)
+
+    def test_sync_on_time(self):
+        now = [0.0]
+        with mock.patch.object(trck.time, "monotonic", lambda: now[0]), \
+                mock.patch.object(trck.os, "fsync") as fsync:
+            writer = trck.Writer(sync_records=None, sync_seconds=10)
+            for run in range(1, 4):
+                writer.write(run, minute(run), 1000, 100, 20)
+                now[0] += 4
+            self.assertEqual(fsync.call_count, 0)
+            writer.write(4, minute(4), 1000, 100, 20)
+            self.assertEqual(fsync.call_count, 1)
+            writer.close()
+            self.assertEqual(fsync.call_count, 1)
+
+
+class LateRecordsTest(unittest.TestCase):
+    """
+    A tick running late can append to a day after it was compressed, see trck.compress().
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_data_dir, slots.DATA_DIR = slots.DATA_DIR, self.data_dir
+        self.writer = trck.Writer()
+
+    def tearDown(self):
+        self.writer.close()
+        slots.DATA_DIR = self.old_data_dir
+        shutil.rmtree(self.data_dir)
+
+    def write(self, minutes):
+        for m in minutes:
+            self.writer.write(m + 1, minute(m), 1000 + m, 100, 20)
+
+    def runs(self) -> list:
+        with trck.open_day(DAY) as file:
+            return [row[0] for row in trck.parse(file.readlines())[0]]
+
+    def check_method(self, method: str, dictionary=None):
+        self.write(range(0, 10))
+        self.writer.close()
+        compressed = trck.compress(DAY, method, dictionary)
+        self.assertTrue(compressed.endswith(trck.SUFFIXES[method]))
+
+        self.write([1438, 1439])
+        self.assertEqual(trck.files(DAY), [compressed, trck.path(DAY)])
+        self.assertEqual(trck.find(DAY), trck.path(DAY))
+        self.assertEqual(self.runs(), list(range(1, 11)) + [1439, 1440])
+
+        self.writer.close()
+        # The method of the compressed file wins
+        self.assertEqual(trck.compress(DAY, "gz" if method == "zst" else method), compressed)
+        self.assertEqual(trck.files(DAY), [compressed])
+        self.assertEqual(self.runs(), list(range(1, 11)) + [1439, 1440])
+
+    def test_gzip(self):
+        self.check_method("gz")
+
+    @unittest.skipIf(trck.zstandard is None, "needs zstandard")
+    def test_zstd(self):
+        self.check_method("zst", False)
+
+    @unittest.skipIf(trck.zstandard is None, "needs zstandard")
+    def test_zstd_frames_share_the_dictionary(self):
+        for m in range(1000):
+            self.writer.write(m, minute(m), 1000 + m, 100, 20)
+        self.writer.close()
+        os.rename(trck.path(DAY), trck.path(DAY - datetime.timedelta(days=1)))
+        trck.train_dictionary([DAY - datetime.timedelta(days=1)], 1024)
+        self.check_method("zst")
+
+    def test_writer_reopens_a_compressed_file(self):
+        self.write([0])
+        # Compressed while the writer still has the file open
+        trck.compress(DAY, "gz")
+        self.write([1])
+        self.assertEqual(self.runs(), [1, 2])
+
+    def test_compress_closed_holds_the_lock(self):
+        self.write([0])
+        self.writer.close()
+        lock = threading.Lock()
+        held = []
+        compress = trck.compress
+        try:
+            trck.compress = lambda *args: held.append(lock.locked()) or compress(*args)
+            self.assertEqual(trck.compress_closed(DAY + datetime.timedelta(days=1), "gz", lock), 1)
+        finally:
+            trck.compress = compress
+        self.assertEqual(held, [True])
+        self.assertFalse(lock.locked())
+
+
+if __name__ == "__main__":
+    unittest.main()
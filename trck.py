@@ -0,0 +1,451 @@
+"""
+.trck record framing and the collector's append writer.
+
+A record keeps the five-line layout of the original files (run, time, download, upload, latency), but its first line
+carries a CRC-32 of the record, as "run:crc". Records of ticks that ran light probes are followed by one line per
+probe target, "kind target latency" ("-" for a target that didn't answer), and give their count in the header, as
+"run:crc+count". A minute the speedtest failed in while the light probes answered is stored with slots.NO_SPEEDTEST
+as its download and upload and the fastest probe's latency, so it reads as online. Every record goes to the file in a
+single write, and parse() resyncs on the next record header when it meets a torn or corrupt one, so a crash mid-record
+costs that record only instead of misaligning the rest of the day. Records without a checksum (files written before
+framing) are still read.
+
+Closed days are compressed (compress()) into DD_MM_YYYY.trck.zst when the zstandard package is installed, with a
+dictionary trained on the format when one was trained (train_dictionary()), and into DD_MM_YYYY.trck.gz otherwise.
+open_day() reads whichever of the files a day has, decompressing as it goes. A tick that runs late can still append
+to a day after it was compressed, into a new plain file: open_day() reads it after the compressed one, and the next
+compress() adds it to the compressed file as a new frame (or gzip member).
+"""
+
+import contextlib
+import datetime
+import gzip
+import io
+import os
+import re
+import shutil
+import time
+import zlib
+import slots
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HEADER = re.compile(r"^(\d+):(?:([0-9a-f]{8})(?:\+(\d+))?)?$")
+NAME = re.compile(r"^(\d\d_\d\d_\d{4})\.trck(\.zst|\.gz)?$")
+SUFFIXES = {"zst": ".zst", "gz": ".gz"}
+COMPRESSION = "zst" if zstandard is not None else "gz"      # what closed days are compressed with
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+DICTIONARY_SIZE = 16 * 1024
+DICTIONARY_SAMPLE = 4096        # bytes of text per training sample
+ZSTD_HEADER_MAX = 18
+
+_dictionaries = {}      # dictionary id -> zstandard.ZstdCompressionDict
+
+
+def path(day: datetime.date) -> str:
+    """
+    :param day: the day whose file is wanted
+    :return: path to the day's .trck file
+    """
+    return os.path.join(slots.DATA_DIR, "{}.trck".format(day.strftime("%d_%m_%Y")))
+
+
+def paths(day: datetime.date) -> list:
+    """
+    :return: every path the day's records can be at: the plain file first, then the compressed ones
+    """
+    plain = path(day)
+    return [plain] + [plain + suffix for suffix in SUFFIXES.values()]
+
+
+def find(day: datetime.date) -> str:
+    """
+    :return: the day's file, plain or compressed, None if it has none. When it has both, the plain one, which holds
+             the latest records (see files())
+    """
+    for file_path in paths(day):
+        if os.path.exists(file_path):
+            return file_path
+    return None
+
+
+def files(day: datetime.date) -> list:
+    """
+    :return: the day's files in the order their records were written: the compressed one, then a plain file with the
+             records appended after it was compressed, if any
+    """
+    found = [file_path for file_path in paths(day) if os.path.exists(file_path)]
+    return found[1:] + found[:1] if len(found) > 1 and found[0] == path(day) else found
+
+
+def day_of(name: str) -> datetime.date:
+    """
+    :param name: a file name, e.g. "01_02_2019.trck" or "01_02_2019.trck.gz"
+    :return: the day of a .trck file (plain or compressed), None for other files
+    """
+    match = NAME.match(name)
+    if match is None:
+        return None
+    try:
+        return datetime.datetime.strptime(match.group(1), "%d_%m_%Y").date()
+    except ValueError:
+        return None
+
+
+def checksum(run: int, body: str) -> int:
+    return zlib.crc32("{}\n{}".format(run, body).encode())
+
+
+def frame(run: int, when: datetime.datetime, download: float, upload: float, ping: float, targets: list = ()) -> bytes:
+    """
+    :param run: the test's number
+    :param when: when the test started
+    :param download: KiloBits per second, -1 for failed tests, slots.NO_SPEEDTEST for minutes the light probes found
+                     online without a speedtest
+    :param upload: KiloBits per second, same as download without one
+    :param ping: MilliSeconds, -1 for failed tests
+    :param targets: (list, default = ()) (probe kind, target, latency in MilliSeconds or None) of the light probes of
+                    the tick
+    :return: the record, framed
+    """
+    if download < 0:
+        body = "{}\n{:g}\n{:g}\n{}\n".format(when.strftime('%d/%m/%Y %H:%M'), download, upload, ping)
+    else:
+        body = "{}\n{:.2f}\n{:.2f}\n{}\n".format(when.strftime('%d/%m/%Y %H:%M'), download, upload, ping)
+    body += "".join("{} {} {}\n".format(kind, target.replace(' ', '%20'), "-" if latency is None else
+                                        "{:.2f}".format(latency)) for kind, target, latency in targets)
+    count = "+{}".format(len(targets)) if targets else ""
+    return "{}:{:08x}{}\n{}".format(run, checksum(run, body), count, body).encode()
+
+
+def _targets(lines: list) -> dict:
+    """
+    :return: {(probe kind, target): latency in MilliSeconds, None if it didn't answer} of a record's probe lines, None
+             if one of them isn't valid
+    """
+    found = {}
+    for line in lines:
+        fields = line.rstrip('\n').split(' ')
+        if len(fields) != 3:
+            return None
+        try:
+            found[(fields[0], fields[1].replace('%20', ' '))] = None if fields[2] == "-" else float(fields[2])
+        except ValueError:
+            return None
+    return found
+
+
+def _record(lines: list, i: int):
+    """
+    :return: (row, length in lines) of the record starting at lines[i], or None if there is no valid one
+    """
+    header = HEADER.match(lines[i].rstrip('\n'))
+    if header is None:
+        return None
+    length = 5 + int(header.group(3) or 0)
+    if len(lines) < i + length or not all(line.endswith('\n') for line in lines[i:i + length]):
+        return None
+    run = int(header.group(1))
+    body = "".join(lines[i + 1:i + length])
+    if header.group(2) is not None and int(header.group(2), 16) != checksum(run, body):
+        return None
+    try:
+        values = [float(line) for line in lines[i + 2:i + 5]]
+    except ValueError:
+        return None
+    stamp = lines[i + 1].rstrip('\n')
+    if len(stamp) != 16 or HEADER.match(stamp):
+        return None
+    if length == 5:
+        return [run, stamp] + values, length
+    targets = _targets(lines[i + 5:i + length])
+    if targets is None:
+        return None
+    return [run, stamp] + values + [targets], length
+
+
+def parse(lines: list) -> tuple:
+    """
+    Reads records, skipping anything that isn't a whole valid record and resyncing on the next record header.
+    :param lines: the file's lines, with their line endings
+    :return: (rows as returned by reader.organize(), number of lines that belong to valid records up to the last one)
+    """
+    rows = []
+    i = valid = 0
+    while i < len(lines):
+        found = _record(lines, i)
+        if found is None:
+            i += 1
+            continue
+        rows.append(found[0])
+        i += found[1]
+        valid = i
+    return rows, valid
+
+
+def recover(file_path: str) -> int:
+    """
+    Truncates whatever follows the last valid record of a file, which is what a crash mid-write leaves behind.
+    Corrupt records before the last valid one are left for parse() to skip.
+    :return: number of bytes cut off
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    lines = data.decode(errors="replace").splitlines(keepends=True)
+    valid = parse(lines)[1]
+    keep = sum(len(line.encode(errors="replace")) for line in lines[:valid]) if valid < len(lines) else len(data)
+    if keep < len(data):
+        with open(file_path, 'r+b') as file:
+            file.truncate(keep)
+            os.fsync(file.fileno())
+    return len(data) - keep
+
+
+def dictionary_path(dict_id: int) -> str:
+    return os.path.join(slots.DATA_DIR, "trck.{}.zdict".format(dict_id))
+
+
+def _dictionary(dict_id: int):
+    """
+    :return: the zstandard.ZstdCompressionDict with that id, loaded from the data directory
+    :raises FileNotFoundError: if it isn't there
+    """
+    if dict_id not in _dictionaries:
+        with open(dictionary_path(dict_id), 'rb') as file:
+            _dictionaries[dict_id] = zstandard.ZstdCompressionDict(file.read())
+    return _dictionaries[dict_id]
+
+
+def latest_dictionary():
+    """
+    :return: the most recently trained dictionary, None if there is none (or no zstandard)
+    """
+    if zstandard is None:
+        return None
+    found = []
+    for name in os.listdir(slots.DATA_DIR):
+        match = re.match(r"^trck\.(\d+)\.zdict$", name)
+        if match:
+            found.append((os.path.getmtime(os.path.join(slots.DATA_DIR, name)), int(match.group(1))))
+    return _dictionary(max(found)[1]) if found else None
+
+
+def train_dictionary(days: list, size: int = DICTIONARY_SIZE):
+    """
+    Trains a zstd dictionary on the records of some days and saves it in the data directory, where compress() picks it
+    up. Dictionaries are never deleted: every file compressed with one names it in its frame header and needs it to be
+    read.
+    :param days: days to train on, their files can be plain or compressed
+    :param size: (int, default = DICTIONARY_SIZE) size of the dictionary, in bytes
+    :return: the dictionary
+    """
+    samples = []
+    for day in days:
+        with open_day(day, binary=True) as file:
+            data = file.read()
+        samples += [data[i:i + DICTIONARY_SAMPLE] for i in range(0, len(data), DICTIONARY_SAMPLE)]
+    dictionary = zstandard.train_dictionary(size, samples)
+    dict_id = dictionary.dict_id()
+    temporary = dictionary_path(dict_id) + ".tmp"
+    with open(temporary, 'wb') as file:
+        file.write(dictionary.as_bytes())
+    os.replace(temporary, dictionary_path(dict_id))
+    _dictionaries[dict_id] = dictionary
+    return dictionary
+
+
+class _Chain(io.RawIOBase):
+    """
+    Reads binary files one after the other, closing each once it's exhausted.
+    """
+
+    def __init__(self, parts: list):
+        self.parts = parts
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self.parts:
+            read = self.parts[0].readinto(buffer)
+            if read:
+                return read
+            self.parts.pop(0).close()
+        return 0
+
+    def close(self):
+        for part in self.parts:
+            part.close()
+        self.parts = []
+        super().close()
+
+
+def _open_file(file_path: str):
+    """
+    :return: a binary file object reading file_path, decompressed
+    """
+    file = open(file_path, 'rb')
+    if file_path.endswith(".gz"):
+        # Reads every member, see compress()
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if file_path.endswith(".zst"):
+        if zstandard is None:
+            file.close()
+            raise RuntimeError("{} needs the zstandard package to be read".format(file_path))
+        dict_id = zstandard.get_frame_parameters(file.read(ZSTD_HEADER_MAX)).dict_id
+        file.seek(0)
+        decompressor = zstandard.ZstdDecompressor(dict_data=_dictionary(dict_id) if dict_id else None)
+        return io.BufferedReader(decompressor.stream_reader(file, closefd=True, read_across_frames=True))
+    return file
+
+
+def open_day(day: datetime.date, binary: bool = False):
+    """
+    Opens the day's records for reading, decompressing them as they are read (no temporary copy). A day with both a
+    compressed and a plain file is read from both, in the order of files().
+    :param day: the day wanted
+    :param binary: (bool, default = False) return bytes instead of text
+    :return: a file object, text with undecodable bytes replaced unless binary
+    :raises FileNotFoundError: if the day has no file
+    """
+    parts = []
+    try:
+        for file_path in files(day):
+            try:
+                parts.append(_open_file(file_path))
+            except FileNotFoundError:
+                # compress() removed the plain file since files() looked, its records are in the compressed one
+                continue
+    except BaseException:
+        for part in parts:
+            part.close()
+        raise
+    if not parts:
+        raise FileNotFoundError(path(day))
+    file = parts[0] if len(parts) == 1 else io.BufferedReader(_Chain(parts))
+    return file if binary else io.TextIOWrapper(file, errors="replace")
+
+
+def compress(day: datetime.date, method: str = COMPRESSION, dictionary=None) -> str:
+    """
+    Compresses a closed day's plain file and removes it once the compressed file is complete and on disk. If the day
+    was already compressed (its plain file holds records a late tick appended afterwards), they are added to the
+    compressed file as a new zstd frame or gzip member, with its method and dictionary. Never call it on a day that is
+    still being written to.
+    :param day: the day to compress
+    :param method: (str, default = COMPRESSION) "zst" or "gz"
+    :param dictionary: (zstandard.ZstdCompressionDict, default = None) dictionary for zst, None uses the latest
+                       trained one, if any. False uses none
+    :return: path of the compressed file, None if the day has no plain file
+    """
+    source = path(day)
+    if not os.path.exists(source):
+        return None
+    existing = [file_path for file_path in paths(day)[1:] if os.path.exists(file_path)]
+    target = existing[0] if existing else source + SUFFIXES[method]
+    method = target.rsplit('.', 1)[1]
+    temporary = target + ".tmp"
+    with open(source, 'rb') as plain, open(temporary, 'wb') as out:
+        if existing:
+            with open(target, 'rb') as packed:
+                if method == "zst":
+                    # Frames of a file are read with a single dictionary
+                    dict_id = zstandard.get_frame_parameters(packed.read(ZSTD_HEADER_MAX)).dict_id
+                    dictionary = _dictionary(dict_id) if dict_id else False
+                    packed.seek(0)
+                shutil.copyfileobj(packed, out)
+        if method == "zst":
+            if dictionary is None:
+                dictionary = latest_dictionary()
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary or None, write_checksum=True)
+            compressor.copy_stream(plain, out)
+        else:
+            with gzip.GzipFile(fileobj=out, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) as packed:
+                while True:
+                    chunk = plain.read(1 << 16)
+                    if not chunk:
+                        break
+                    packed.write(chunk)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temporary, target)
+    os.remove(source)
+    return target
+
+
+def compress_closed(today: datetime.date, method: str = COMPRESSION, lock=None) -> int:
+    """
+    Compresses the plain files of every day before today.
+    :param lock: (default = None) a lock held while each day is compressed, the one the collector writes records under,
+                 so a late record of a closed day isn't appended between compress() reading the plain file and removing
+                 it
+    :return: number of days compressed
+    """
+    done = 0
+    for name in sorted(os.listdir(slots.DATA_DIR)):
+        day = day_of(name)
+        if day is not None and day < today and name.endswith(".trck"):
+            with lock if lock is not None else contextlib.nullcontext():
+                compress(day, method)
+            done += 1
+    return done
+
+
+class Writer:
+    """
+    Append writer for the collector. Keeps the day's file open across ticks and moves to the next file at midnight.
+    Records are written whole, with a single write() each, and synced to disk every 'sync_records' records and/or every
+    'sync_seconds' seconds, whichever comes first; between syncs they sit in the OS' page cache, so they survive a crash
+    of the collector but not of the machine.
+    """
+
+    def __init__(self, sync_records: int = 1, sync_seconds: float = None):
+        """
+        :param sync_records: (int, default = 1) records between fsync()s, None to not count records
+        :param sync_seconds: (float, default = None) seconds between fsync()s, None to not sync on time
+        """
+        self.sync_records = sync_records
+        self.sync_seconds = sync_seconds
+        self.day = None
+        self.fd = None
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+        self.recovered = 0
+
+    def open(self, day: datetime.date):
+        self.close()
+        file_path = path(day)
+        if os.path.exists(file_path):
+            self.recovered += recover(file_path)
+        self.fd = os.open(file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.day = day
+
+    def write(self, run: int, when: datetime.datetime, download: float, upload: float, ping: float,
+              targets: list = ()):
+        """
+        Appends a record to the file of when's day (see frame()).
+        """
+        # A record of a closed day (a late tick) reopens its file, which compress() removes once it's compressed
+        if when.date() != self.day or os.fstat(self.fd).st_nlink == 0:
+            self.open(when.date())
+        os.write(self.fd, frame(run, when, download, upload, ping, targets))
+        self.unsynced += 1
+        if (self.sync_records is not None and self.unsynced >= self.sync_records) or \
+                (self.sync_seconds is not None and time.monotonic() - self.synced_at >= self.sync_seconds):
+            self.sync()
+
+    def sync(self):
+        if self.fd is not None and self.unsynced:
+            os.fsync(self.fd)
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def close(self):
+        if self.fd is not None:
+            self.sync()
+            os.close(self.fd)
+            self.fd = None
+            self.day = None